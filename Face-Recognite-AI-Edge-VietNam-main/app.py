@@ -2,39 +2,81 @@ from __future__ import annotations
 
 import os
 import base64
+import threading
 import time
+import uuid
 from datetime import datetime
 from functools import wraps
 from pathlib import Path
 from typing import Dict, List, Optional
 
-import cv2
 import numpy as np
 from flask import Flask, flash, jsonify, redirect, render_template, request, session, url_for
 
-from src.core.recognition import Regconizer
+from src.core import registry
+from src.core.recognition import RecognitionResult
+from src.daemon.client import RemoteRegconizer
+from src.core.scheduler import InferenceScheduler
+from src.core.streaming import LatestFrameSlot, StreamStats
+from src.core.dedupe import FrameDeduplicator
 from src import config as conf
+from src.utils import decode_image
+from src.data import cache
+from src.data.terminal_state import TerminalStateStore
+from src.data.write_behind import get_write_behind
 from src.services import analytics_service, customer_service, face_service, order_service, product_service, user_service
 
+try:
+    from flask_sock import Sock
+except ImportError:  # chưa cài flask-sock: trình duyệt dùng HTTP polling
+    Sock = None
+
 
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
+# Cạnh dài lớn nhất detector có thể dùng: frame lớn hơn được giải mã ở độ phân giải giảm
+DETECTION_MAX_IMGSZ = max(conf.detection_imgsz_candidates) if conf.detection_imgsz_mode == "adaptive" else conf.detection_imgsz
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
 app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key")
-
-recognizer = Regconizer()
+app.config["SOCK_SERVER_OPTIONS"] = {"ping_interval": conf.stream_ping_interval_s}
+sock = Sock(app) if Sock is not None and conf.stream_enabled else None
+STREAM_URL = "/staff/recognize/stream"
+# Các khoá trạng thái nhận diện của một quầy (xoá khi làm mới nhận diện)
+RECOGNITION_STATE_KEYS = ("active_customer", "active_customer_last_seen")
+
+recognizer = registry.get_recognizer(headless=True)
+# Daemon suy luận tự gom batch frame của mọi client nên chỉ cần scheduler khi chạy tại chỗ
+scheduler = InferenceScheduler(recognizer) if conf.scheduler_enabled and not isinstance(recognizer, RemoteRegconizer) else None
+stream_stats = StreamStats()
+frame_dedupe = FrameDeduplicator()
+# Giỏ hàng, khách đang phục vụ... của từng quầy nằm phía server; cookie chỉ giữ terminal_id
+terminal_store = TerminalStateStore()
 
 user_service.ensure_default_admin()
 
 
 def refresh_recognizer():
-    global recognizer
+    """Nạp lại gallery (FAISS index + map id ↔ tên) ngay sau khi thay đổi; mô hình không bị tải lại.
+
+    Các worker khác tự nhận thay đổi qua version stamp của gallery trong vòng ~1 giây.
+    """
+    frame_dedupe.clear()
     try:
-        recognizer = Regconizer()
+        registry.reload_vector_db()  # chế độ daemon: reload gallery nằm trong daemon
     except Exception as exc:
-        app.logger.error("Không thể reload mô hình nhận diện: %s", exc)
+        app.logger.error("Không thể reload gallery nhận diện: %s", exc)
+
+
+def recognize_frame(frame: np.ndarray, terminal_id: str = None) -> RecognitionResult:
+    """Nhận diện một frame, qua bộ gom batch nếu được bật (an toàn với server nhiều luồng).
+
+    ``terminal_id`` để detector chọn imgsz theo lịch sử khuôn mặt của riêng quầy đó.
+    """
+    if scheduler is not None:
+        return scheduler.recognize(frame, terminal_id)
+    return recognizer.recognize(frame, terminal_id)
 
 
 def login_required(role: Optional[str] = None):
@@ -91,6 +133,7 @@ def login():
 
 @app.post("/logout")
 def logout():
+    terminal_store.discard(session.get("terminal_id"))
     session.clear()
     flash("Đã đăng xuất.", "info")
     return redirect(url_for("login"))
@@ -264,6 +307,20 @@ def admin_faces():
     return render_template("admin/faces.html", title="Quản lý dữ liệu nhận diện", faces=faces)
 
 
+@app.route("/admin/inference/stats")
+@login_required("admin")
+def admin_inference_stats():
+    stats = recognizer.stats()
+    if scheduler is not None:
+        stats["scheduler"] = scheduler.stats()
+    stats["stream"] = stream_stats.stats()
+    stats["frame_dedupe"] = frame_dedupe.stats()
+    stats["write_behind"] = get_write_behind().stats()
+    stats["customer_cache"] = cache.stats()
+    stats["terminals"] = terminal_store.stats()
+    return jsonify(stats)
+
+
 @app.route("/admin/reports")
 @login_required("admin")
 def admin_reports():
@@ -281,17 +338,144 @@ def admin_reports():
     )
 
 
+def _terminal_id() -> str:
+    """Id quầy của trình duyệt hiện tại (cookie session chỉ giữ id này)."""
+    terminal_id = session.get("terminal_id")
+    if not terminal_id:
+        terminal_id = session["terminal_id"] = uuid.uuid4().hex
+    return terminal_id
+
+
 def _get_cart() -> Dict[str, Dict]:
-    return session.setdefault("cart", {})
+    cart = terminal_store.get(_terminal_id()).get("cart") or {}
+    return {product_id: dict(item) for product_id, item in cart.items()}
 
 
 def _set_cart(cart: Dict[str, Dict]) -> None:
-    session["cart"] = cart
-    session.modified = True
+    with terminal_store.edit(_terminal_id()) as state:
+        state["cart"] = cart
+
+
+def _get_active_customer() -> Optional[Dict]:
+    return terminal_store.get(_terminal_id()).get("active_customer")
+
 
+def _set_active_customer(customer: Optional[Dict]) -> None:
+    with terminal_store.edit(_terminal_id()) as state:
+        state["active_customer"] = customer
+
+
+def _recognize_for_terminal(frame: np.ndarray, terminal_id: str, staff_id) -> Dict:
+    """
+    Nhận diện một frame POS và cập nhật trạng thái nhận diện của quầy ``terminal_id``
+    (dùng chung cho HTTP và kênh streaming).
+
+    Nếu khung hình gần như không đổi so với frame xử lý trước đó của quầy, kết quả cũ được
+    dùng lại thay vì chạy detection. Một lượt ghé chỉ được ghi log một lần cho cả cửa hàng
+    dù nhiều quầy cùng nhận ra khách. Trả về payload JSON gửi cho trình duyệt.
+    """
+    signature, results = frame_dedupe.lookup(terminal_id, frame)
+    reused = results is not None
+    if not reused:
+        results = recognize_frame(frame, terminal_id)
+        frame_dedupe.store(terminal_id, signature, results)
+    with terminal_store.edit(terminal_id) as state:
+        return _apply_recognition(results, state, staff_id, frame, reused)
 
-def _get_recognition_cache() -> Dict[str, float]:
-    return session.setdefault("recognition_cache", {})
+
+def _apply_recognition(results: RecognitionResult, state: Dict, staff_id, frame: np.ndarray, reused: bool) -> Dict:
+    """Cập nhật ``state`` của quầy (đang giữ khoá) theo kết quả nhận diện và dựng payload trả về."""
+    now_ts = time.time()
+
+    active_customer = state.get("active_customer")
+    history_payload: List[Dict] = []
+    matches: List[Dict] = []
+
+    recognized_customer = None
+    for dist, name, face_id in zip(results.scores, results.names, results.ids):
+        fid = int(face_id)
+        distance_value = float(dist)
+        is_recognized = distance_value <= conf.threshold_distance
+        matches.append(
+            {
+                "distance": distance_value,
+                "name": name,
+                "id": fid,
+                "recognized": is_recognized,
+            }
+        )
+        if not is_recognized:
+            continue
+
+        customer = customer_service.get_customer_by_face_id(fid)
+        if not customer:
+            continue
+
+        recognized_customer = customer
+        if terminal_store.should_log_visit(customer["id"], now_ts):
+            customer_service.log_recognition_event(
+                customer_id=customer["id"],
+                staff_id=staff_id,
+                confidence=distance_value,
+                camera_id="POS-CAM",
+            )
+
+        customer_payload = {
+            "id": customer["id"],
+            "full_name": customer.get("full_name"),
+            "face_id": customer.get("face_id"),
+            "phone": customer.get("phone"),
+            "email": customer.get("email"),
+        }
+
+        if not active_customer or active_customer.get("id") != customer["id"]:
+            active_customer = customer_payload
+            history_payload = [
+                {
+                    "order_number": order.get("order_number"),
+                    "created_at": order.get("created_at"),
+                    "total_amount": order.get("total_amount", 0),
+                }
+                for order in order_service.recent_orders(customer["id"])
+            ]
+            state["active_customer"] = customer_payload
+            state["active_customer_last_seen"] = now_ts
+        else:
+            # refresh payload with newest customer details
+            active_customer.update(customer_payload)
+            history_payload = [
+                {
+                    "order_number": order.get("order_number"),
+                    "created_at": order.get("created_at"),
+                    "total_amount": order.get("total_amount", 0),
+                }
+                for order in order_service.recent_orders(customer["id"])
+            ]
+            state["active_customer_last_seen"] = now_ts
+
+        break
+
+    # nếu không còn khách trong khung hình trong 5 giây -> clear
+    last_seen_ts = state.get("active_customer_last_seen")
+    if recognized_customer is None and last_seen_ts and now_ts - last_seen_ts > 5:
+        state["active_customer"] = None
+        state["active_customer_last_seen"] = None
+        active_customer = None
+        history_payload = []
+
+    return {
+        "matches": matches,
+        "active_customer": active_customer,
+        "purchase_history": history_payload,
+        "detection": {
+            "imgsz": results.detect_imgsz,
+            "ms": results.timings.get("detect_ms"),
+            "timings": results.timings,
+            "frame_size": [frame.shape[1], frame.shape[0]],
+            "reused": reused,
+        },
+        "timestamp": now_ts,
+    }
 
 
 @app.route("/staff")
@@ -317,7 +501,7 @@ def staff_dashboard():
         total += line_total
 
     registration = session.pop("registration_result", None)
-    active_customer = session.get("active_customer")
+    active_customer = _get_active_customer()
     active_customer_info = None
     if active_customer:
         customer_id = active_customer.get("id")
@@ -337,7 +521,7 @@ def staff_dashboard():
 
     purchase_history: List[Dict] = []
     if active_customer and active_customer.get("id"):
-        purchase_history = order_service.list_orders(limit=5, customer_id=active_customer["id"])
+        purchase_history = order_service.recent_orders(active_customer["id"])
 
     return render_template(
         "staff/dashboard.html",
@@ -349,6 +533,11 @@ def staff_dashboard():
         active_customer_info=active_customer_info,
         purchase_history=purchase_history,
         catalog_products=catalog_products,
+        upload_max_side=conf.upload_max_side,
+        upload_jpeg_quality=conf.upload_jpeg_quality,
+        stream_url=STREAM_URL if sock is not None else None,
+        stream_min_interval_ms=conf.stream_min_interval_ms,
+        stream_max_in_flight=conf.stream_max_in_flight,
     )
 
 
@@ -370,119 +559,95 @@ def staff_orders():
 @app.post("/staff/recognize/frame")
 @login_required("staff")
 def staff_recognize_frame():
-    payload = request.get_json(silent=True)
-    if not payload or "image" not in payload:
+    image_bytes = None
+    if request.mimetype in ("application/octet-stream", "image/jpeg"):
+        image_bytes = request.get_data()
+    elif request.mimetype == "multipart/form-data":
+        upload = request.files.get("frame")
+        image_bytes = upload.read() if upload else None
+    else:
+        # Định dạng cũ: JSON chứa data URL base64
+        payload = request.get_json(silent=True)
+        if payload and "image" in payload:
+            image_b64 = payload["image"]
+            if "," in image_b64:
+                image_b64 = image_b64.split(",", 1)[1]
+            try:
+                image_bytes = base64.b64decode(image_b64)
+            except Exception:
+                return jsonify({"error": "Ảnh gửi lên không hợp lệ."}), 400
+    if not image_bytes:
         return jsonify({"error": "Thiếu dữ liệu ảnh."}), 400
 
-    image_b64 = payload["image"]
-    if "," in image_b64:
-        image_b64 = image_b64.split(",", 1)[1]
-
-    try:
-        image_bytes = base64.b64decode(image_b64)
-    except Exception:
-        return jsonify({"error": "Ảnh gửi lên không hợp lệ."}), 400
-
-    np_buffer = np.frombuffer(image_bytes, np.uint8)
-    frame = cv2.imdecode(np_buffer, cv2.IMREAD_COLOR)
+    # Giải mã JPEG ở độ phân giải giảm nếu vẫn lớn hơn đầu vào detector
+    frame = decode_image(image_bytes, min_side=DETECTION_MAX_IMGSZ)
     if frame is None:
         return jsonify({"error": "Không thể đọc dữ liệu ảnh."}), 400
 
-    results = recognizer.regcognize_face(frame)
-    recognition_cache = _get_recognition_cache()
-    now_ts = time.time()
-
-    active_customer = session.get("active_customer")
-    history_payload: List[Dict] = []
-    matches: List[Dict] = []
-
-    recognized_customer = None
-    for dist, name, face_id in zip(results["Distances"], results["Names"], results["IDs"]):
-        fid = int(face_id[0])
-        distance_value = float(dist[0])
-        is_recognized = distance_value <= conf.threshold_distance
-        matches.append(
-            {
-                "distance": distance_value,
-                "name": name[0],
-                "id": fid,
-                "recognized": is_recognized,
-            }
-        )
-        if not is_recognized:
-            continue
-
-        customer = customer_service.get_customer_by_face_id(fid)
-        if not customer:
-            continue
+    payload = _recognize_for_terminal(frame, _terminal_id(), session["user"]["id"])
+    payload["detection"]["upload_bytes"] = len(image_bytes)
+    return jsonify(payload)
 
-        recognized_customer = customer
-        cache_key = str(fid)
-        last_seen = recognition_cache.get(cache_key, 0)
-        if now_ts - last_seen > 10:
-            customer_service.log_recognition_event(
-                customer_id=customer["id"],
-                staff_id=session["user"]["id"],
-                confidence=distance_value,
-                camera_id="POS-CAM",
-            )
-            recognition_cache[cache_key] = now_ts
-            session.modified = True
 
-        customer_payload = {
-            "id": customer["id"],
-            "full_name": customer.get("full_name"),
-            "face_id": customer.get("face_id"),
-            "phone": customer.get("phone"),
-            "email": customer.get("email"),
-        }
+def _stream_reader(ws, slot: LatestFrameSlot) -> None:
+    """Nhận frame nhị phân từ WebSocket vào ``slot`` (chỉ giữ frame mới nhất) đến khi ngắt kết nối."""
+    try:
+        while True:
+            data = ws.receive()
+            if data is None:
+                break
+            if isinstance(data, bytes) and data:
+                slot.put(data)
+    except Exception:
+        pass  # kết nối đã đóng
+    finally:
+        slot.close()
 
-        if not active_customer or active_customer.get("id") != customer["id"]:
-            active_customer = customer_payload
-            history_payload = [
-                {
-                    "order_number": order.get("order_number"),
-                    "created_at": order.get("created_at"),
-                    "total_amount": order.get("total_amount", 0),
-                }
-                for order in order_service.list_orders(limit=5, customer_id=customer["id"])
-            ]
-            session["active_customer"] = customer_payload
-            session["active_customer_last_seen"] = now_ts
-            session.modified = True
-        else:
-            # refresh payload with newest customer details
-            active_customer.update(customer_payload)
-            history_payload = [
-                {
-                    "order_number": order.get("order_number"),
-                    "created_at": order.get("created_at"),
-                    "total_amount": order.get("total_amount", 0),
-                }
-                for order in order_service.list_orders(limit=5, customer_id=customer["id"])
-            ]
-            session["active_customer_last_seen"] = now_ts
-            session.modified = True
 
-        break
+def staff_recognize_stream(ws):
+    """
+    Kênh WebSocket thay cho việc POST từng frame: trình duyệt đẩy JPEG nhị phân liên tục,
+    server chỉ nhận diện frame mới nhất (frame cũ chưa xử lý bị bỏ) và đẩy kết quả về
+    cùng định dạng với ``/staff/recognize/frame``.
+    """
+    user = session.get("user")
+    if not user or user.get("role") != "staff":
+        ws.close(reason=1008, message="Bạn không có quyền truy cập.")
+        return
+
+    # Cookie không ghi lại được sau khi nâng cấp WebSocket: trình duyệt chưa có terminal_id
+    # (chưa mở trang quầy) dùng một id tạm cho riêng kết nối này
+    terminal_id = session.get("terminal_id") or uuid.uuid4().hex
+    slot = LatestFrameSlot()
+    stream_stats.opened(slot)
+    reader = threading.Thread(target=_stream_reader, args=(ws, slot), name="recognition-stream-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            image_bytes = slot.take()
+            if image_bytes is None:
+                break
+            frame = decode_image(image_bytes, min_side=DETECTION_MAX_IMGSZ)
+            if frame is None:
+                payload = {"error": "Không thể đọc dữ liệu ảnh."}
+            else:
+                try:
+                    payload = _recognize_for_terminal(frame, terminal_id, user["id"])
+                    payload["detection"]["upload_bytes"] = len(image_bytes)
+                except Exception as exc:
+                    app.logger.error("Lỗi nhận diện frame streaming: %s", exc)
+                    payload = {"error": "Lỗi nhận diện."}
+            payload["stream"] = slot.stats()
+            ws.send(app.json.dumps(payload))
+    except Exception:
+        pass  # trình duyệt đã đóng kết nối giữa chừng
+    finally:
+        slot.close()
+        stream_stats.closed(slot)
 
-    # nếu không còn khách trong khung hình trong 5 giây -> clear
-    last_seen_ts = session.get("active_customer_last_seen")
-    if recognized_customer is None and last_seen_ts and now_ts - last_seen_ts > 5:
-        session["active_customer"] = None
-        session["active_customer_last_seen"] = None
-        session.modified = True
-        active_customer = None
-        history_payload = []
 
-    return jsonify(
-        {
-            "matches": matches,
-            "active_customer": active_customer,
-            "purchase_history": history_payload,
-            "timestamp": now_ts,
-        }
-    )
+if sock is not None:
+    sock.route(STREAM_URL)(staff_recognize_stream)
 
 
 @app.post("/staff/recognize/reset")
@@ -492,10 +657,11 @@ def staff_reset_recognition():
     Clear any active customer selection and reset recognition cache so the next frame
     starts with a clean state.
     """
-    session.pop("active_customer", None)
-    session.pop("active_customer_last_seen", None)
-    session.pop("recognition_cache", None)
-    session.modified = True
+    terminal_id = _terminal_id()
+    frame_dedupe.forget(terminal_id)
+    with terminal_store.edit(terminal_id) as state:
+        for key in RECOGNITION_STATE_KEYS:
+            state.pop(key, None)
     return jsonify({"status": "reset"})
 
 
@@ -529,13 +695,15 @@ def staff_register_customer():
             face_id=face_id,
         )
         session["registration_result"] = f"Đã đăng ký khách {full_name} với Face ID {face_id} (thu được {added} embedding)."
-        session["active_customer"] = {
-            "id": customer_id,
-            "full_name": full_name,
-            "face_id": face_id,
-            "phone": request.form.get("phone", ""),
-            "email": request.form.get("email", ""),
-        }
+        _set_active_customer(
+            {
+                "id": customer_id,
+                "full_name": full_name,
+                "face_id": face_id,
+                "phone": request.form.get("phone", ""),
+                "email": request.form.get("email", ""),
+            }
+        )
         refresh_recognizer()
         flash("Đăng ký khách hàng mới thành công.", "success")
     except Exception as exc:
@@ -554,8 +722,7 @@ def staff_set_customer():
     )
 
     if not customer_id:
-        session["active_customer"] = None
-        session.modified = True
+        _set_active_customer(None)
         message = "Đã chuyển sang chế độ khách vãng lai."
         if wants_json:
             return jsonify({"status": "cleared", "message": message})
@@ -576,8 +743,7 @@ def staff_set_customer():
         "phone": customer.get("phone"),
         "email": customer.get("email"),
     }
-    session["active_customer"] = active_payload
-    session.modified = True
+    _set_active_customer(active_payload)
     message = f"Đang phục vụ khách {customer.get('full_name') or customer.get('face_id')}."
     if wants_json:
         return jsonify({"status": "ok", "active_customer": active_payload, "message": message})
@@ -588,8 +754,7 @@ def staff_set_customer():
 @app.post("/staff/customer/clear")
 @login_required("staff")
 def staff_clear_customer():
-    session["active_customer"] = None
-    session.modified = True
+    _set_active_customer(None)
     flash("Đã bỏ chọn khách hàng, chuyển sang khách vãng lai.", "info")
     return redirect(url_for("staff_dashboard"))
 
@@ -644,8 +809,7 @@ def staff_remove_from_cart():
 @app.post("/staff/cart/clear")
 @login_required("staff")
 def staff_clear_cart():
-    session["cart"] = {}
-    session.modified = True
+    _set_cart({})
     flash("Đã xóa giỏ hàng.", "info")
     return redirect(url_for("staff_dashboard"))
 
@@ -663,7 +827,7 @@ def staff_checkout():
         flash("Vui lòng chọn phương thức thanh toán.", "danger")
         return redirect(url_for("staff_dashboard"))
 
-    active_customer = session.get("active_customer")
+    active_customer = _get_active_customer()
     customer_id = active_customer.get("id") if active_customer else None
 
     items = []
@@ -678,8 +842,7 @@ def staff_checkout():
             payment_method=payment_method,
             notes=request.form.get("notes", ""),
         )
-        session["cart"] = {}
-        session.modified = True
+        _set_cart({})
         flash(f"Tạo đơn hàng thành công: {order_info['order_number']}", "success")
     except Exception as exc:
         flash(f"Lỗi tạo đơn hàng: {exc}", "danger")
@@ -18,8 +18,8 @@ from PIL import Image, ImageTk
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
-from src.core.vectordb import VectorBD
-from src.core.recognition import Regconizer
+from src.core import registry
+from src.core.tracker import FaceTracker
 from src.utils import check_is_id_exist, get_name_from_id, find_available_cameras
 from src.processing import video_processor, image_processor
 from legacy_scripts import create_database as create_vt_db # Keep for Initialize DB
@@ -30,7 +30,9 @@ class App:
         self.root.title("Hệ thống nhận diện khuôn mặt")
         self.root.geometry("400x400") # Increased height for settings button
 
-        self.db = VectorBD()
+        self.db = registry.get_vector_db()
+        # Tải + warm-up mô hình ở nền để cửa sổ nhận diện đầu tiên mở ngay
+        threading.Thread(target=registry.warm_up, daemon=True).start()
 
         # --- Camera Configuration ---
         self.available_cameras = find_available_cameras()
@@ -88,7 +90,8 @@ class App:
         stop_event = threading.Event()
         
         def _video_loop():
-            reg = Regconizer()
+            reg = registry.get_recognizer()
+            tracker = FaceTracker()
             cam_id = self.selected_camera_id.get()
             cam = cv2.VideoCapture(cam_id, cv2.CAP_V4L2)
             if not cam.isOpened():
@@ -100,7 +103,7 @@ class App:
                 if not ret: time.sleep(0.1); continue
                 
                 frame = cv2.flip(frame, 1)
-                reg.regcognize_face(frame)
+                reg.track_faces(frame, tracker)
                 vis_frame = reg.img_with_bbs if reg.img_with_bbs is not None else frame
 
                 img = cv2.cvtColor(vis_frame, cv2.COLOR_BGR2RGB)
@@ -10,8 +10,7 @@ import argparse
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.core.vectordb import VectorBD
-from src.core.recognition import Regconizer
+from src.core import registry
 from src.utils import read_image, check_is_id_exist
 
 def add_emb_in_folder(root_folder: str, is_reinit: bool = True) -> None:
@@ -21,12 +20,12 @@ def add_emb_in_folder(root_folder: str, is_reinit: bool = True) -> None:
         root_folder (str): Thư mục gốc chứa các thư mục con theo định dạng ``{id}_{name}``.
         is_reinit (bool): True để xoá và khởi tạo DB mới trước khi thêm.
     """
-    vt = VectorBD()
+    vt = registry.get_vector_db()
     if is_reinit:
         # Khởi tạo database
         vt.re_init()
     
-    reg = Regconizer()
+    reg = registry.get_recognizer()
 
     # duyệt từng folder con (mỗi người)
     for person_id, person_name in enumerate(os.listdir(root_folder)):
@@ -6,7 +6,7 @@ import argparse
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.core.vectordb import VectorBD
+from src.core import registry
 from src.utils import check_is_id_exist
 
 def delete_folder_id(id: int):
@@ -27,7 +27,7 @@ def main(id: int):
     Args:
         id (int): Định danh cần xoá.
     """
-    vt_db = VectorBD()
+    vt_db = registry.get_vector_db()
     if not check_is_id_exist(id):
         print(f"❌ ID {id} không tồn tại trong database.")
         return
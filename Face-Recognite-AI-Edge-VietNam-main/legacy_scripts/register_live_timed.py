@@ -13,8 +13,7 @@ import time
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.core.recognition import Regconizer
-from src.core.vectordb import VectorBD
+from src.core import registry
 from src.utils import check_is_id_exist
 
 RECORD_SECONDS = 30
@@ -31,8 +30,8 @@ def main(name: str, id: int):
     os.makedirs(dir_path, exist_ok=True)
 
     # Khởi tạo nhận diện và DB
-    rec = Regconizer()
-    vt_db = VectorBD()
+    rec = registry.get_recognizer()
+    vt_db = registry.get_vector_db()
 
     # Mở camera
     cam = cv2.VideoCapture(0)
@@ -91,9 +90,8 @@ def main(name: str, id: int):
         # Chỉ xử lý khi còn trong thời gian quay
         if remaining_time > 0:
             # Tự động chụp frame nếu có 1 mặt trong khung
-            rec.detector_face.set_img_input(frame)
-            faces = rec.detector_face.cropped_faces
-            if faces is not None and len(faces) == 1:
+            faces = rec.detect(frame)[0]
+            if len(faces) == 1:
                 captured_frames.append(frame)
                 # Có thể thêm hiệu ứng nháy xanh để báo hiệu đã chụp
                 cv2.ellipse(display_img, (center_x, center_y), (oval_w, oval_h), 0, 0, 360, (0, 255, 0), 3)
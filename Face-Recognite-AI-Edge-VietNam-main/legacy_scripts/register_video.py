@@ -12,8 +12,7 @@ import time
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.core.recognition import Regconizer
-from src.core.vectordb import VectorBD
+from src.core import registry
 from src.utils import check_is_id_exist
 
 def main(name: str, id: int, video_path: str, frame_skip: int):
@@ -26,8 +25,8 @@ def main(name: str, id: int, video_path: str, frame_skip: int):
         return
 
     # Khởi tạo nhận diện và DB
-    rec = Regconizer()
-    vt_db = VectorBD()
+    rec = registry.get_recognizer()
+    vt_db = registry.get_vector_db()
 
     # Mở file video
     cap = cv2.VideoCapture(video_path)
@@ -12,8 +12,7 @@ import argparse
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.core.recognition import Regconizer
-from src.core.vectordb import VectorBD
+from src.core import registry
 from src.utils import check_is_id_exist
 
 def main(name: str, id: int):
@@ -35,8 +34,8 @@ def main(name: str, id: int):
     current_idx = 0
 
     # Khởi tạo nhận diện và DB
-    rec = Regconizer()
-    vt_db = VectorBD()
+    rec = registry.get_recognizer()
+    vt_db = registry.get_vector_db()
 
     # Mở camera
     cam = cv2.VideoCapture(0)
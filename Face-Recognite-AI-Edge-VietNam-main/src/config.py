@@ -1,6 +1,78 @@
 path_model_face_detection = './models/model detect/detect_face.pt'
+path_model_face_detection_onnx = './models/model detect/detect_face_int8.onnx'
+path_model_face_detection_openvino = './models/model detect/detect_face_int8_openvino_model'
+detection_backend = 'openvino'  # backend phát hiện ưu tiên: 'openvino' | 'onnx' | 'pytorch'
+detection_backend_fallbacks = ['openvino', 'onnx', 'pytorch']  # thứ tự thử khi backend ưu tiên không tải được
+detection_use_ultralytics = False  # True để chạy onnx/openvino qua ultralytics thay vì LeanFaceDetector (NumPy)
+detection_imgsz = 640  # cạnh dài đầu vào detector (chế độ 'fixed')
+detection_imgsz_mode = 'adaptive'  # 'fixed' | 'adaptive' (chọn imgsz theo kích thước mặt gần đây)
+detection_imgsz_candidates = (320, 416, 640)
+detection_min_face_px = 40  # cạnh mặt nhỏ nhất (px trên ảnh vào detector) cần giữ khi giảm imgsz
+detection_imgsz_history = 10  # số frame có mặt gần nhất dùng để chọn imgsz
+detection_full_scan_every = 30  # cứ N frame chạy imgsz lớn nhất một lần để bắt mặt nhỏ/mới
+detection_imgsz_max_sources = 256  # số nguồn frame (quầy POS) giữ lịch sử chọn imgsz riêng
+detection_conf_threshold = 0.25
+detection_iou_threshold = 0.7  # ngưỡng IoU cho NMS (giống mặc định ultralytics)
+quality_gate_enabled = True  # bỏ qua mặt kém chất lượng trước khi embedding (src/core/quality.py)
+quality_min_face_px = 40  # cạnh ngắn tối thiểu của bbox (px ảnh gốc)
+quality_min_sharpness = 60.0  # phương sai Laplacian tối thiểu (ảnh xám 64x64)
+quality_brightness_range = (40, 220)  # độ sáng trung bình cho phép
+quality_aspect_range = (0.45, 1.3)  # tỉ lệ rộng/cao cho phép (mặt nghiêng hẳn cho bbox rất hẹp)
+max_faces = 16  # sức chứa ban đầu của buffer crop khuôn mặt (tự tăng khi cần)
 path_model_face_recognition = './models/model recognite/Facenet_128.h5'
+path_model_face_recognition_onnx = './models/model recognite/Facenet_128.onnx'
+path_model_face_recognition_tflite = './models/model recognite/facenet.tflite'
+embedding_backend = 'keras_compiled'  # backend embedding: 'keras_compiled' | 'onnx' | 'tflite' | 'keras'
+embedding_backend_fallbacks = ['keras_compiled', 'onnx', 'tflite', 'keras']
+tflite_num_threads = None  # số luồng cho TFLite Interpreter (None = mặc định)
+embedding_batch_buckets = (1, 2, 4, 8)  # các kích thước batch trace sẵn cho keras_compiled
 path_vector_db = './database/face_index.faiss'
 threshold_distance = 1.0
 path_json_id_name = './database/map_id_name.json'
 dim = 128  # chiều embedding
+gallery_reload_check_s = 1.0  # chu kỳ kiểm tra version stamp của gallery (giây)
+vector_index_type = 'auto'  # 'flat' | 'hnsw' | 'ivf' | 'auto' (flat, tự chuyển khi gallery lớn) - xem src/core/ann.py
+vector_index_auto_type = 'ivf'  # loại index chuyển sang khi vượt ngưỡng ở chế độ 'auto'
+vector_index_migrate_threshold = 50000  # số vector để chế độ 'auto' chuyển khỏi flat
+hnsw_m = 32  # số cạnh mỗi nút của đồ thị HNSW
+hnsw_ef_construction = 128  # độ rộng tìm kiếm khi xây HNSW
+hnsw_ef_search = 64  # độ rộng tìm kiếm khi truy vấn HNSW (cao hơn = recall cao hơn, chậm hơn)
+ivf_nlist = None  # số cụm IVF (None = ~4*sqrt(N))
+ivf_nprobe = 16  # số cụm IVF được quét mỗi truy vấn
+ivf_min_train_size = 1000  # số vector tối thiểu để huấn luyện IVF (ít hơn thì dùng flat)
+vector_index_storage = 'float32'  # 'float32' | 'fp16' | 'int8' | 'pq' | 'opq' (HNSW chỉ float32/fp16/int8, pq/opq -> int8)
+sq_min_train_size = 1000  # số vector tối thiểu để huấn luyện int8 (ít hơn thì giữ float32)
+pq_m = 16  # số byte mỗi vector khi lưu PQ/OPQ (dim phải chia hết cho pq_m)
+pq_nbits = 8  # số bit mỗi mã con PQ
+pq_min_train_size = 10000  # số vector tối thiểu để huấn luyện PQ/OPQ (~39 * 2^pq_nbits)
+two_stage_search = True  # tìm trên prototype theo danh tính (index theo vector_index_type) rồi xếp hạng lại trên gallery flat - xem src/core/prototypes.py
+two_stage_min_vectors = 2000  # số vector tối thiểu để bật tìm kiếm hai tầng (ít hơn thì quét index trực tiếp)
+prototypes_per_identity = 3  # số tâm cụm (prototype) tối đa cho mỗi danh tính
+two_stage_candidates = 8  # số danh tính ứng viên được xếp hạng lại trên embedding của gallery
+delta_log_check_s = 30.0  # chu kỳ luồng nền kiểm tra kích thước delta log (giây) - xem src/core/deltalog.py
+delta_log_compact_ratio = 0.25  # nén log thành snapshot mới khi log vượt tỉ lệ này so với snapshot
+delta_log_compact_min_bytes = 4 * 1024 * 1024  # không nén khi log nhỏ hơn ngưỡng này (byte)
+vector_index_mmap = False  # mmap snapshot chỉ đọc (khởi động nhanh, chia sẻ trang giữa tiến trình); tắt tìm kiếm hai tầng
+delta_segment_max_vectors = 10000  # ghi snapshot mới khi segment RAM + tombstone (mmap, xoá trên HNSW) vượt số vector này
+inference_mode = 'auto'  # 'local' | 'daemon' | 'auto' (dùng daemon src/daemon/server.py nếu đang chạy)
+inference_socket_path = './database/inference.sock'  # Unix domain socket của daemon suy luận
+inference_timeout_s = 10.0  # thời gian chờ tối đa mỗi lệnh gửi daemon (giây)
+registry_warmup = True  # chạy batch giả khi tải mô hình lần đầu (src/core/registry.py)
+upload_max_side = 640  # cạnh dài tối đa của frame trình duyệt gửi lên (static/js/recognition.js)
+upload_jpeg_quality = 0.8  # chất lượng JPEG khi trình duyệt mã hoá frame
+stream_enabled = True  # kênh WebSocket /staff/recognize/stream (cần flask-sock), nếu không dùng HTTP polling
+stream_min_interval_ms = 100  # khoảng cách tối thiểu giữa hai frame trình duyệt đẩy lên qua WebSocket
+stream_max_in_flight = 2  # số frame tối đa trình duyệt gửi trước khi nhận kết quả
+stream_ping_interval_s = 25  # chu kỳ ping giữ kết nối WebSocket (giây)
+frame_dedupe_enabled = True  # dùng lại kết quả khi khung hình của quầy không đổi (src/core/dedupe.py)
+frame_dedupe_pixel_delta = 12  # chênh lệch xám tối thiểu để một ô 16x16 được coi là thay đổi
+frame_dedupe_changed_ratio = 0.02  # tỉ lệ ô thay đổi tối đa để coi là cùng cảnh
+frame_dedupe_max_age_s = 10.0  # thời gian tối đa dùng lại một kết quả (giây)
+scheduler_enabled = True  # gom frame từ nhiều request thành batch (src/core/scheduler.py)
+scheduler_max_batch = 8  # số frame tối đa mỗi batch
+scheduler_max_wait_ms = 5  # thời gian chờ gom thêm frame (ms)
+scheduler_workers = 1  # số luồng worker chạy batch song song
+tracker_iou_threshold = 0.3  # IoU tối thiểu để ghép bbox vào track cũ
+tracker_max_misses = 5  # số frame mất dấu trước khi xoá track
+tracker_reverify_every = 30  # xác minh lại danh tính track đã nhận ra sau N frame
+tracker_unknown_retry_every = 5  # thử nhận diện lại track "Unknown" sau N frame
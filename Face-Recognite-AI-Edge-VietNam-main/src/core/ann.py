@@ -0,0 +1,456 @@
+"""
+Các loại FAISS index cho gallery khuôn mặt (tìm kiếm inner product trên embedding đã chuẩn hoá).
+
+- ``flat``: ``IndexIDMap2(IndexFlatIP)``, quét toàn bộ, kết quả chính xác (mặc định cũ).
+- ``hnsw``: ``IndexIDMap2(IndexHNSWFlat)``, đồ thị HNSW; không hỗ trợ xoá vector nên
+  ``remove_ids`` bọc index trong ``SegmentedIndex`` và chỉ đánh dấu tombstone, vector bị
+  xoá thật sự khi ghi snapshot tiếp theo.
+- ``ivf``: ``IndexIVFFlat`` (tự giữ id), chia gallery thành ``nlist`` cụm và chỉ quét
+  ``nprobe`` cụm gần nhất; cần đủ vector để huấn luyện bộ lượng tử hoá.
+
+Với ``conf.vector_index_type = 'auto'``, gallery dùng ``flat`` cho đến khi vượt
+``conf.vector_index_migrate_threshold`` vector rồi tự chuyển sang ``conf.vector_index_auto_type``.
+
+Cách lưu vector (``conf.vector_index_storage``, ``STORAGE_TYPES``) độc lập với loại index:
+
+- ``float32``: vector gốc, 512 B/vector (128 chiều).
+- ``fp16`` / ``int8``: scalar quantization, 256 / 128 B/vector.
+- ``pq`` / ``opq``: product quantization ``conf.pq_m`` byte/vector (``opq`` xoay không gian
+  trước khi lượng tử hoá để giảm sai số); chỉ dùng với ``flat`` và ``ivf`` vì đồ thị HNSW
+  đã chiếm ~``8·hnsw_m`` B/vector.
+
+Các cách lưu cần huấn luyện (``int8``, ``pq``, ``opq``) chỉ được áp dụng khi gallery đủ vector
+(``storage_min_train_size``); trước đó gallery giữ ``float32``.
+
+Với ``conf.vector_index_mmap``, snapshot được ``mmap`` chỉ đọc (``open_mapped``) và bọc trong
+``SegmentedIndex``: vector thêm mới nằm trong một segment nhỏ trên RAM, vector bị xoá được
+đánh dấu tombstone cho tới lần ghi snapshot tiếp theo.
+
+Chạy ``python -m src.core.ann`` để đo recall@1 và độ trễ của từng loại so với ``flat``
+trên gallery tổng hợp; ``python -m src.core.compress`` để chuyển đổi tệp index có sẵn và
+báo cáo độ chính xác so với bộ nhớ của từng cách lưu.
+"""
+
+import math
+import numpy as np
+import faiss
+from src import config as conf
+
+INDEX_KINDS = ('flat', 'hnsw', 'ivf')
+STORAGE_TYPES = ('float32', 'fp16', 'int8', 'pq', 'opq')
+
+# Mã hoá vector tương ứng từng cách lưu trong chuỗi ``faiss.index_factory``
+_FACTORY_CODES = {'float32': 'Flat', 'fp16': 'SQfp16', 'int8': 'SQ8'}
+
+
+def _unwrap(index: faiss.Index):
+    """(index lõi, có OPQ hay không) sau khi bỏ lớp ``SegmentedIndex``, ``IndexIDMap`` và ``IndexPreTransform``."""
+    if isinstance(index, SegmentedIndex):
+        index = index.base
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(inner, faiss.IndexPreTransform):
+        return faiss.downcast_index(inner.index), True
+    return inner, False
+
+
+def index_kind(index: faiss.Index) -> str:
+    """Loại (``INDEX_KINDS``) của một index đã tạo/đọc từ đĩa."""
+    inner, _ = _unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(inner, faiss.IndexIVF):
+        return 'ivf'
+    return 'flat'
+
+
+def index_storage(index: faiss.Index) -> str:
+    """Cách lưu vector (``STORAGE_TYPES``) của một index đã tạo/đọc từ đĩa."""
+    inner, rotated = _unwrap(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return 'fp16' if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else 'int8'
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return 'opq' if rotated else 'pq'
+    return 'float32'
+
+
+def storage_codec(index: faiss.Index):
+    """Bộ mã hoá (``sa_encode``/``sa_decode``) cùng cách lưu với ``index``; None nếu lưu ``float32``."""
+    if index_storage(index) == 'float32':
+        return None
+    if isinstance(index, SegmentedIndex):
+        index = index.base
+    codec = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else faiss.downcast_index(index)
+    if isinstance(codec, faiss.IndexHNSW):
+        codec = faiss.downcast_index(codec.storage)
+    codec.referenced_objects = [index]  # giữ index chứa codec sống cùng codec
+    return codec
+
+
+def storage_min_train_size(storage: str, kind: str = 'flat') -> int:
+    """Số vector tối thiểu để huấn luyện index loại ``kind`` với cách lưu ``storage``."""
+    sizes = {'float32': 0, 'fp16': 0, 'int8': conf.sq_min_train_size,
+             'pq': conf.pq_min_train_size, 'opq': conf.pq_min_train_size}
+    return max(sizes[storage], conf.ivf_min_train_size if kind == 'ivf' else 0)
+
+
+def configure_index(index: faiss.Index) -> faiss.Index:
+    """Gán tham số lúc tìm kiếm (``efSearch``/``nprobe``), vốn không đi theo tệp index."""
+    if isinstance(index, SegmentedIndex):
+        configure_index(index.base)
+        return index
+    kind = index_kind(index)
+    if kind == 'hnsw':
+        _unwrap(index)[0].hnsw.efSearch = conf.hnsw_ef_search
+    elif kind == 'ivf':
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(conf.ivf_nprobe, ivf.nlist)
+    return index
+
+
+def get_vectors(index: faiss.Index):
+    """Lấy lại toàn bộ (vectors (N, dim) float32, ids (N,) int64) đang lưu trong index."""
+    if isinstance(index, SegmentedIndex):
+        return index.get_vectors()
+    if index.ntotal == 0:
+        return np.empty((0, index.d), dtype=np.float32), np.empty((0,), dtype=np.int64)
+    if isinstance(index, faiss.IndexIDMap):
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        return index.index.reconstruct_n(0, index.ntotal), ids
+    # Mỗi danh tính có nhiều vector cùng id nên không dùng direct map (id -> một vector):
+    # đọc thẳng từng inverted list
+    ivf = faiss.extract_index_ivf(index)
+    invlists = ivf.invlists
+    all_vectors, all_ids = [], []
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if not size:
+            continue
+        all_ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+        if isinstance(ivf, faiss.IndexIVFFlat):
+            codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+            all_vectors.append(codes.view(np.float32).reshape(size, ivf.d))
+        else:
+            vectors = np.empty((size, ivf.d), dtype=np.float32)
+            for offset in range(size):
+                ivf.reconstruct_from_offset(list_no, offset, faiss.swig_ptr(vectors[offset]))
+            all_vectors.append(vectors)
+    vectors = np.vstack(all_vectors)
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        # Inverted list lưu vector đã xoay bởi OPQ: xoay ngược về không gian embedding
+        for i in reversed(range(index.chain.size())):
+            vectors = index.chain.at(i).reverse_transform(vectors)
+    return vectors, np.concatenate(all_ids).astype(np.int64)
+
+
+def get_ids(index: faiss.Index) -> np.ndarray:
+    """Id (N,) int64 của mọi vector trong index, không giải mã vector."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype(np.int64)
+    if index.ntotal == 0:
+        return np.empty((0,), dtype=np.int64)
+    ivf = faiss.extract_index_ivf(index)
+    return np.concatenate([faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), ivf.invlists.list_size(list_no)).copy()
+                           for list_no in range(ivf.nlist) if ivf.invlists.list_size(list_no)]).astype(np.int64)
+
+
+def open_mapped(path: str) -> faiss.Index:
+    """Đọc index ở chế độ ``mmap`` chỉ đọc: trang dữ liệu dùng chung giữa các tiến trình.
+
+    Không được thêm/xoá trực tiếp trên index trả về (faiss dừng tiến trình); dùng ``SegmentedIndex``.
+    """
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+
+
+def remove_ids(index: faiss.Index, ids) -> faiss.Index:
+    """Xoá mọi vector có id trong ``ids``; trả về index (HNSW được bọc trong ``SegmentedIndex``).
+
+    HNSW không xoá được vector khỏi đồ thị: thay vì dựng lại cả đồ thị, id bị xoá được đánh dấu
+    tombstone và lọc lúc tìm kiếm; ``SegmentedIndex.materialize`` bỏ hẳn chúng khi ghi snapshot.
+    """
+    if index_kind(index) == 'hnsw' and not isinstance(index, SegmentedIndex):
+        index = SegmentedIndex(index)
+    index.remove_ids(np.asarray(ids, dtype=np.int64).reshape(-1))
+    return index
+
+
+class SegmentedIndex():
+    """Index không sửa trực tiếp được (``base``: snapshot ``mmap`` chỉ đọc, hoặc HNSW vốn không xoá
+    được vector) + segment RAM cho vector mới + tombstone cho id đã xoá.
+
+    Hỗ trợ phần giao diện faiss mà gallery dùng: ``ntotal``, ``d``, ``search``,
+    ``add_with_ids``, ``remove_ids``. ``materialize`` gộp lại thành một index trên RAM để ghi snapshot.
+    """
+    def __init__(self, base: faiss.Index):
+        self.base = base
+        self.d = base.d
+        self.delta = faiss.IndexIDMap2(faiss.IndexFlatIP(base.d))
+        self.tombstones = set()
+        self.removed = 0  # số vector của base bị che bởi tombstone
+        self._base_ids = None
+        self._params = None
+        # PQ phẳng và OPQ không nhận IDSelector: tìm thêm kết quả rồi lọc
+        self._selector_ok = index_storage(base) != 'opq' and not (index_kind(base) == 'flat' and index_storage(base) == 'pq')
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.ntotal - self.removed + self.delta.ntotal
+
+    @property
+    def pending(self) -> int:
+        """Số vector nằm ngoài snapshot (segment RAM + tombstone)."""
+        return self.delta.ntotal + self.removed
+
+    def base_ids(self) -> np.ndarray:
+        if self._base_ids is None:
+            self._base_ids = get_ids(self.base)
+        return self._base_ids
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        self.delta.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        ids = np.asarray(ids, dtype=np.int64)
+        removed = self.delta.remove_ids(ids)
+        new = [int(id) for id in ids if int(id) not in self.tombstones]
+        if new:
+            masked = int(np.isin(self.base_ids(), new).sum())
+            self.tombstones.update(new)
+            self.removed += masked
+            removed += masked
+            self._params = None
+        return removed
+
+    def _search_params(self):
+        if self._params is None:
+            selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(np.fromiter(self.tombstones, dtype=np.int64)))
+            if index_kind(self.base) == 'ivf':
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(self.base).nprobe)
+            else:
+                params = faiss.SearchParameters(sel=selector)
+            params.referenced_objects = [selector]
+            self._params = params
+        return self._params
+
+    def _search_base(self, x: np.ndarray, k: int):
+        if not self.tombstones:
+            return self.base.search(x, k)
+        if self._selector_ok:
+            return self.base.search(x, k, params=self._search_params())
+        dis, ids = self.base.search(x, min(self.base.ntotal, k + self.removed))
+        hidden = np.isin(ids, np.fromiter(self.tombstones, dtype=np.int64))
+        dis[hidden], ids[hidden] = -np.finfo(np.float32).max, -1
+        order = np.argsort(-dis, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(dis, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def search(self, x: np.ndarray, k: int):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        dis, ids = self._search_base(x, k)
+        if self.delta.ntotal == 0:
+            return dis, ids
+        delta_dis, delta_ids = self.delta.search(x, k)
+        dis, ids = np.hstack([dis, delta_dis]), np.hstack([ids, delta_ids])
+        order = np.argsort(-dis, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(dis, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def get_vectors(self):
+        vectors, ids = get_vectors(self.base)
+        if self.tombstones:
+            keep = ~np.isin(ids, np.fromiter(self.tombstones, dtype=np.int64))
+            vectors, ids = vectors[keep], ids[keep]
+        delta_vectors, delta_ids = get_vectors(self.delta)
+        return np.vstack([vectors, delta_vectors]), np.concatenate([ids, delta_ids])
+
+    def materialize(self) -> faiss.Index:
+        """Index trên RAM (cùng loại/cách lưu với ``base``) chứa đúng nội dung hiện tại."""
+        index = faiss.deserialize_index(faiss.serialize_index(self.base))
+        if self.tombstones:
+            tombstones = np.fromiter(self.tombstones, dtype=np.int64)
+            if index_kind(index) == 'hnsw':
+                index = rebuild_index(index, 'hnsw', keep=lambda ids: ~np.isin(ids, tombstones))
+            else:
+                index.remove_ids(tombstones)
+        if self.delta.ntotal:
+            delta_vectors, delta_ids = get_vectors(self.delta)
+            index.add_with_ids(delta_vectors, delta_ids)
+        return configure_index(index)
+
+
+def ivf_nlist(ntotal: int) -> int:
+    """Số cụm IVF: ``conf.ivf_nlist`` hoặc ~4·sqrt(N), tối đa N/39 để mỗi cụm đủ điểm huấn luyện."""
+    nlist = conf.ivf_nlist or int(4 * math.sqrt(ntotal))
+    return max(1, min(nlist, ntotal // 39))
+
+
+def index_description(kind: str, storage: str = 'float32', ntotal: int = 0) -> str:
+    """Chuỗi ``faiss.index_factory`` cho index loại ``kind`` lưu vector theo ``storage``."""
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Loại index không hỗ trợ: {kind} (chọn trong {INDEX_KINDS})")
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Cách lưu không hỗ trợ: {storage} (chọn trong {STORAGE_TYPES})")
+    code = _FACTORY_CODES.get(storage, f"PQ{conf.pq_m}x{conf.pq_nbits}")
+    rotation = f"OPQ{conf.pq_m}," if storage == 'opq' else ""
+    if kind == 'flat':
+        return f"IDMap2,{rotation}{code}"
+    if kind == 'hnsw':
+        if storage in ('pq', 'opq'):
+            raise ValueError("HNSW chỉ hỗ trợ cách lưu float32/fp16/int8")
+        return f"IDMap2,HNSW{conf.hnsw_m}" + (f"_{code}" if storage != 'float32' else "")
+    return f"{rotation}IVF{ivf_nlist(ntotal)},{code}"
+
+
+def build_index(kind: str, vectors: np.ndarray = None, ids: np.ndarray = None, dim: int = conf.dim,
+                storage: str = 'float32', train: np.ndarray = None) -> faiss.Index:
+    """Tạo index loại ``kind``, lưu vector theo ``storage`` (rỗng hoặc chứa sẵn ``vectors``/``ids``).
+
+    ``train``: vector dùng để huấn luyện (mặc định ``vectors``), ví dụ chỉ các vector gốc chưa qua lượng tử hoá.
+    """
+    ntotal = 0 if vectors is None else len(vectors)
+    train = vectors if train is None else train
+    min_train = storage_min_train_size(storage, kind)
+    if min_train and (train is None or len(train) < min_train):
+        raise ValueError(f"Index {kind}/{storage} cần ít nhất {min_train} vector để huấn luyện")
+    index = faiss.index_factory(dim, index_description(kind, storage, ntotal), faiss.METRIC_INNER_PRODUCT)
+    if kind == 'hnsw':
+        _unwrap(index)[0].hnsw.efConstruction = conf.hnsw_ef_construction
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(train, dtype=np.float32))
+    if vectors is not None and len(vectors):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+    return configure_index(index)
+
+
+def target_kind(current: str, ntotal: int) -> str:
+    """Loại index gallery nên dùng với ``ntotal`` vector theo ``conf.vector_index_type``."""
+    wanted = conf.vector_index_type
+    if wanted == 'auto':
+        if current != 'flat' or ntotal < conf.vector_index_migrate_threshold:
+            return current  # đã chuyển thì giữ nguyên, không quay lại flat
+        wanted = conf.vector_index_auto_type
+    if wanted == 'ivf' and ntotal < conf.ivf_min_train_size:
+        return 'flat'
+    return wanted
+
+
+def target_storage(current: str, kind: str, ntotal: int) -> str:
+    """Cách lưu gallery nên dùng theo ``conf.vector_index_storage`` (giữ ``current`` khi chưa đủ vector huấn luyện)."""
+    wanted = conf.vector_index_storage
+    if kind == 'hnsw' and wanted in ('pq', 'opq'):
+        wanted = 'int8'
+    if ntotal < storage_min_train_size(wanted, kind):
+        return current
+    return wanted
+
+
+def rebuild_index(index: faiss.Index, kind: str, keep=None, storage: str = None) -> faiss.Index:
+    """Dựng lại ``index`` thành loại ``kind`` lưu theo ``storage`` (mặc định giữ nguyên);
+    ``keep(ids) -> mask`` để lọc bớt vector.
+
+    Khi giữ nguyên loại/cách lưu, bộ lượng tử hoá đã huấn luyện được giữ lại nên sai số không cộng
+    dồn: mã của vector được chép nguyên (``remove_ids`` trên bản sao), riêng HNSW (không xoá được)
+    nạp lại vector giải mã, được scalar quantizer cũ mã hoá lại đúng mã cũ. Khi đổi cách lưu, index
+    mới được huấn luyện trên vector đã giải mã; nên dùng ``build_index(..., train=...)`` với vector
+    gốc nếu còn (xem ``VectorBD._migrate``).
+    """
+    storage = storage or index_storage(index)
+    same = not isinstance(index, SegmentedIndex) and (kind, storage) == (index_kind(index), index_storage(index))
+    if same and kind != 'hnsw':
+        rebuilt = faiss.clone_index(index)
+        if keep is not None:
+            ids = get_ids(index)
+            rebuilt.remove_ids(ids[~keep(ids)])
+        return configure_index(rebuilt)
+    vectors, ids = get_vectors(index)
+    if keep is not None:
+        mask = keep(ids)
+        vectors, ids = vectors[mask], ids[mask]
+    if same:
+        rebuilt = faiss.clone_index(index)
+        rebuilt.reset()
+        if len(vectors):
+            rebuilt.add_with_ids(vectors, ids)
+        return configure_index(rebuilt)
+    if kind == 'ivf' and len(vectors) < conf.ivf_min_train_size:
+        kind = 'flat'
+    if kind == 'hnsw' and storage in ('pq', 'opq'):
+        storage = 'int8'
+    if len(vectors) < storage_min_train_size(storage, kind):
+        storage = 'float32'
+    return build_index(kind, vectors, ids, index.d, storage)
+
+
+def _synthetic_gallery(identities: int, per_identity: int, dim: int, rng, noise: float = 1.0):
+    """Gallery tổng hợp: mỗi danh tính là một cụm vector đơn vị quanh một tâm ngẫu nhiên.
+
+    Returns:
+        vectors (N, dim), nhãn danh tính (N,) và 1000 truy vấn (ảnh mới của các danh tính ngẫu nhiên).
+    """
+    centers = rng.standard_normal((identities, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+
+    def sample(labels):
+        points = centers[labels] + noise / math.sqrt(dim) * rng.standard_normal((len(labels), dim)).astype(np.float32)
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    labels = np.repeat(np.arange(identities, dtype=np.int64), per_identity)
+    return sample(labels), labels, sample(rng.integers(0, identities, size=1000))
+
+
+def benchmark(identities=(1000, 5000), per_identity: int = 20, noise: float = 1.0, dim: int = conf.dim, seed: int = 0) -> list:
+    """Đo recall@1 và độ trễ tìm kiếm của từng loại index so với ``flat``.
+
+    ``recall_at_1``: tỉ lệ truy vấn trả về đúng vector gần nhất như ``flat``;
+    ``identity_agreement``: tỉ lệ trả về cùng danh tính như ``flat`` (điều nhận diện thực sự cần).
+    ``noise`` càng lớn thì các cụm danh tính càng chồng lấn (bài toán càng khó với ANN).
+
+    Returns:
+        list: mỗi phần tử là dict ``{"vectors", "kind", "recall_at_1", "identity_agreement",
+        "build_s", "ms_per_query", "batch_ms_per_query"}``.
+    """
+    import time
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n_identities in identities:
+        vectors, labels, queries = _synthetic_gallery(n_identities, per_identity, dim, rng, noise)
+        rows_ids = np.arange(len(vectors), dtype=np.int64)  # id riêng cho từng vector để đo recall chính xác
+        reference = None
+        for kind in INDEX_KINDS:
+            start = time.perf_counter()
+            index = build_index(kind, vectors, rows_ids, dim)
+            build_s = time.perf_counter() - start
+            start = time.perf_counter()
+            for query in queries[:200]:
+                index.search(query[None], 1)
+            single_ms = (time.perf_counter() - start) * 1000 / 200
+            start = time.perf_counter()
+            _, found = index.search(queries, 1)
+            batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            if reference is None:
+                reference = found[:, 0]
+            rows.append({
+                "vectors": len(vectors),
+                "kind": kind,
+                "recall_at_1": float((found[:, 0] == reference).mean()),
+                "identity_agreement": float((labels[found[:, 0]] == labels[reference]).mean()),
+                "build_s": build_s,
+                "ms_per_query": single_ms,
+                "batch_ms_per_query": batch_ms,
+            })
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identities", type=int, nargs="+", default=[1000, 5000], help="Số danh tính của từng gallery tổng hợp")
+    parser.add_argument("--per-identity", type=int, default=20, help="Số embedding mỗi danh tính")
+    parser.add_argument("--noise", type=float, default=1.0, help="Độ phân tán embedding quanh tâm danh tính")
+    args = parser.parse_args()
+
+    print(f"{'vectors':>9} {'index':>6} {'recall@1':>9} {'identity':>9} {'build (s)':>10} {'ms/query':>9} {'ms/query (batch)':>17}")
+    for row in benchmark(args.identities, args.per_identity, args.noise):
+        print(f"{row['vectors']:>9} {row['kind']:>6} {row['recall_at_1']:>9.4f} {row['identity_agreement']:>9.4f} {row['build_s']:>10.2f} "
+              f"{row['ms_per_query']:>9.3f} {row['batch_ms_per_query']:>17.4f}")
@@ -0,0 +1,146 @@
+"""
+Chuyển đổi tệp gallery FAISS sang cách lưu nén (fp16/int8/PQ/OPQ) và báo cáo độ chính xác so với bộ nhớ.
+
+Chuyển đổi (phát lại delta log, ghi snapshot mới qua ``DeltaLog.write_snapshot``, tăng version
+stamp để các tiến trình đang chạy reload)::
+
+    python -m src.core.compress --input database/face_index.faiss --storage int8
+
+Báo cáo trên gallery thật (``--input``) hoặc gallery tổng hợp (``--identities``)::
+
+    python -m src.core.compress --report --input database/face_index.faiss
+    python -m src.core.compress --report --identities 5000 --storage float32 fp16 int8 pq opq
+
+Nhớ đặt ``conf.vector_index_storage`` trùng cách lưu đã chuyển, nếu không ``VectorBD`` sẽ
+chuyển gallery về cách lưu trong cấu hình ở lần nạp tiếp theo.
+"""
+
+import os
+import time
+import numpy as np
+import faiss
+from src import config as conf
+from src.core.ann import (STORAGE_TYPES, build_index, get_vectors, index_kind, index_storage,
+                          rebuild_index, storage_min_train_size)
+from src.core.deltalog import DeltaLog
+from src.utils import bump_gallery_version
+
+
+def index_bytes(index: faiss.Index) -> int:
+    """Kích thước index khi ghi ra tệp (xấp xỉ bộ nhớ RAM index chiếm)."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def convert(input_path: str, output_path: str = None, storage: str = conf.vector_index_storage, kind: str = None) -> faiss.Index:
+    """Đọc index ở ``input_path``, dựng lại với cách lưu ``storage`` (và loại ``kind`` nếu có) rồi ghi ra ``output_path``.
+
+    Raises:
+        ValueError: Gallery không đủ vector để huấn luyện cách lưu/loại index yêu cầu.
+    """
+    output_path = output_path or input_path
+    log = DeltaLog(input_path)
+    with log.locked():
+        index, seq = log.replay(faiss.read_index(input_path))
+        kind = kind or index_kind(index)
+        min_train = storage_min_train_size(storage, kind)
+        if index.ntotal < min_train:
+            raise ValueError(f"{kind}/{storage} cần ít nhất {min_train} vector, gallery chỉ có {index.ntotal}")
+        converted = rebuild_index(index, kind, storage=storage)
+        if os.path.abspath(output_path) == os.path.abspath(input_path):
+            log.write_snapshot(converted, seq)
+    if os.path.abspath(output_path) != os.path.abspath(input_path):
+        output_log = DeltaLog(output_path)
+        with output_log.locked():
+            output_log.read()
+            output_log.write_snapshot(converted, output_log.last_seq)
+    bump_gallery_version(output_path)
+    return converted
+
+
+def _noisy_queries(vectors: np.ndarray, ids: np.ndarray, count: int, noise: float, rng):
+    """Truy vấn giả lập ảnh mới: vector gallery ngẫu nhiên cộng nhiễu rồi chuẩn hoá lại."""
+    pick = rng.integers(0, len(vectors), size=min(count, len(vectors)))
+    queries = vectors[pick] + noise / np.sqrt(vectors.shape[1]) * rng.standard_normal((len(pick), vectors.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32), ids[pick]
+
+
+def report(vectors: np.ndarray, ids: np.ndarray, storages=STORAGE_TYPES, kind: str = 'flat',
+           queries: int = 1000, noise: float = 0.5, seed: int = 0) -> list:
+    """So sánh từng cách lưu với ``float32`` trên cùng gallery và truy vấn.
+
+    ``identity_agreement``: tỉ lệ truy vấn trả về cùng danh tính như float32;
+    ``score_error``: sai lệch trung bình của điểm tương tự trả về.
+
+    Returns:
+        list: mỗi phần tử là dict ``{"kind", "storage", "bytes_per_vector", "size_mb",
+        "identity_agreement", "score_error", "build_s", "ms_per_query"}``; cách lưu không
+        áp dụng được (thiếu vector huấn luyện, HNSW + PQ) bị bỏ qua.
+    """
+    rng = np.random.default_rng(seed)
+    query_vectors, _ = _noisy_queries(vectors, ids, queries, noise, rng)
+    reference = build_index(kind, vectors, ids, vectors.shape[1])
+    ref_dis, ref_ids = reference.search(query_vectors, 1)
+    rows = []
+    for storage in storages:
+        if len(vectors) < storage_min_train_size(storage, kind) or (kind == 'hnsw' and storage in ('pq', 'opq')):
+            print(f"Bỏ qua {kind}/{storage}: không áp dụng cho gallery {len(vectors)} vector")
+            continue
+        start = time.perf_counter()
+        index = reference if storage == 'float32' else build_index(kind, vectors, ids, vectors.shape[1], storage)
+        build_s = 0.0 if storage == 'float32' else time.perf_counter() - start
+        start = time.perf_counter()
+        dis, found = index.search(query_vectors, 1)
+        ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+        size = index_bytes(index)
+        rows.append({
+            "kind": kind,
+            "storage": storage,
+            "bytes_per_vector": size / max(index.ntotal, 1),
+            "size_mb": size / 2 ** 20,
+            "identity_agreement": float((found[:, 0] == ref_ids[:, 0]).mean()),
+            "score_error": float(np.abs(dis - ref_dis).mean()),
+            "build_s": build_s,
+            "ms_per_query": ms,
+        })
+    return rows
+
+
+if __name__ == '__main__':
+    import argparse
+    from src.core.ann import _synthetic_gallery
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", help="Tệp FAISS index nguồn (mặc định: gallery tổng hợp khi --report)")
+    parser.add_argument("--output", help="Tệp index đích khi chuyển đổi (mặc định: ghi đè --input)")
+    parser.add_argument("--storage", nargs="+", default=None, choices=STORAGE_TYPES,
+                        help="Cách lưu đích (chuyển đổi: một giá trị; báo cáo: danh sách)")
+    parser.add_argument("--kind", default=None, choices=('flat', 'hnsw', 'ivf'), help="Loại index đích (mặc định: giữ nguyên)")
+    parser.add_argument("--report", action="store_true", help="Chỉ báo cáo độ chính xác/bộ nhớ, không ghi tệp")
+    parser.add_argument("--identities", type=int, default=5000, help="Số danh tính của gallery tổng hợp khi không có --input")
+    parser.add_argument("--per-identity", type=int, default=20, help="Số embedding mỗi danh tính của gallery tổng hợp")
+    parser.add_argument("--noise", type=float, default=0.5, help="Độ nhiễu của truy vấn giả lập quanh vector gallery")
+    args = parser.parse_args()
+
+    if args.report:
+        if args.input:
+            source_log = DeltaLog(args.input)
+            with source_log.locked():
+                source, _ = source_log.replay(faiss.read_index(args.input))
+            vectors, ids = get_vectors(source)
+            kind = args.kind or index_kind(source)
+            print(f"Gallery {args.input}: {len(vectors)} vector, {index_kind(source)}/{index_storage(source)}")
+        else:
+            vectors, ids, _ = _synthetic_gallery(args.identities, args.per_identity, conf.dim, np.random.default_rng(0))
+            kind = args.kind or 'flat'
+            print(f"Gallery tổng hợp: {len(vectors)} vector, {args.identities} danh tính")
+        print(f"{'index':>6} {'storage':>8} {'B/vector':>9} {'size (MB)':>10} {'identity':>9} {'score err':>10} {'build (s)':>10} {'ms/query':>9}")
+        for row in report(vectors, ids, args.storage or STORAGE_TYPES, kind, noise=args.noise):
+            print(f"{row['kind']:>6} {row['storage']:>8} {row['bytes_per_vector']:>9.1f} {row['size_mb']:>10.2f} "
+                  f"{row['identity_agreement']:>9.4f} {row['score_error']:>10.5f} {row['build_s']:>10.2f} {row['ms_per_query']:>9.4f}")
+    else:
+        if not args.input or not args.storage or len(args.storage) != 1:
+            parser.error("chuyển đổi cần --input và đúng một --storage")
+        before = faiss.read_index(args.input)  # snapshot trước khi chuyển (chỉ để so kích thước)
+        index = convert(args.input, args.output, args.storage[0], args.kind)
+        print(f"Đã chuyển {args.input} ({index_kind(before)}/{index_storage(before)}, {index_bytes(before) / 2 ** 20:.2f} MB) -> "
+              f"{args.output or args.input} ({index_kind(index)}/{index_storage(index)}, {index_bytes(index) / 2 ** 20:.2f} MB)")
@@ -0,0 +1,98 @@
+"""
+Bỏ qua frame trùng lặp theo từng quầy POS.
+
+Camera hướng vào quầy trống gửi gần như cùng một khung hình cả ngày. Mỗi quầy giữ chữ ký
+(ảnh xám thu nhỏ 16x16) của frame được xử lý gần nhất cùng kết quả nhận diện; nếu frame
+mới gần như không đổi so với chữ ký đó thì dùng lại kết quả cũ thay vì chạy YOLO. Kích thước
+frame được lưu kèm chữ ký: đổi độ phân giải (toạ độ box cũ không còn đúng) luôn là cache miss.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import cv2
+from src import config as conf
+
+SIGNATURE_SIZE = 16  # cạnh ảnh xám dùng làm chữ ký khung hình
+
+
+def frame_signature(img: np.ndarray) -> np.ndarray:
+    """Chữ ký khung hình: ảnh xám ``SIGNATURE_SIZE`` x ``SIGNATURE_SIZE`` (int16)."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return cv2.resize(gray, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class FrameDeduplicator():
+    """Cache (chữ ký, kết quả) của frame xử lý gần nhất cho từng quầy, giới hạn ``max_terminals`` (LRU).
+
+    Args:
+        enabled: Tắt để luôn chạy nhận diện.
+        pixel_delta: Chênh lệch xám tối thiểu để một ô của chữ ký được coi là thay đổi.
+        changed_ratio: Tỉ lệ ô thay đổi tối đa để frame được coi là cùng cảnh.
+        max_age_s: Thời gian tối đa dùng lại một kết quả (gallery có thể đã thay đổi).
+        max_terminals: Số quầy tối đa được giữ trong cache.
+    """
+    def __init__(self, enabled: bool = conf.frame_dedupe_enabled, pixel_delta: int = conf.frame_dedupe_pixel_delta,
+                 changed_ratio: float = conf.frame_dedupe_changed_ratio, max_age_s: float = conf.frame_dedupe_max_age_s,
+                 max_terminals: int = 256):
+        self.enabled = enabled
+        self.pixel_delta = pixel_delta
+        self.changed_ratio = changed_ratio
+        self.max_age_s = max_age_s
+        self.max_terminals = max_terminals
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.reused = 0
+
+    def lookup(self, key, img: np.ndarray):
+        """Trả về ((chữ ký, kích thước) của ``img``, kết quả cũ nếu cảnh không đổi, ngược lại None)."""
+        if not self.enabled or key is None:
+            return None, None
+        signature = (frame_signature(img), img.shape[:2])
+        now = time.monotonic()
+        with self._lock:
+            self.checked += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return signature, None
+            (previous, previous_shape), result, stored_at = entry
+            if now - stored_at > self.max_age_s or previous_shape != signature[1]:
+                return signature, None
+            changed = (np.abs(signature[0] - previous) > self.pixel_delta).mean()
+            if changed > self.changed_ratio:
+                return signature, None
+            self.reused += 1
+            return signature, result
+
+    def store(self, key, signature: tuple, result) -> None:
+        """Ghi nhận frame vừa xử lý của quầy ``key``."""
+        if signature is None:
+            return
+        with self._lock:
+            self._entries[key] = (signature, result, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_terminals:
+                self._entries.popitem(last=False)
+
+    def forget(self, key) -> None:
+        """Xoá cache của một quầy (ví dụ khi làm mới nhận diện)."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Xoá cache của mọi quầy (ví dụ sau khi gallery thay đổi)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "checked": self.checked,
+                "reused": self.reused,
+                "skip_ratio": self.reused / self.checked if self.checked else 0.0,
+                "terminals": len(self._entries),
+            }
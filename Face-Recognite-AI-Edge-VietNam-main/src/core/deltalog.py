@@ -0,0 +1,353 @@
+"""
+Delta log chỉ-ghi-nối-tiếp cho gallery FAISS: thêm/xoá embedding không còn ghi lại toàn bộ index.
+
+Các tệp cạnh ``path_db``:
+
+- ``<path_db>``: snapshot (tệp FAISS bình thường).
+- ``<path_db>.log``: các bản ghi ``[crc32][seq][op][id][độ dài][vector float32]``, mỗi bản ghi
+  được ``fsync`` trước khi trả về. Khi đọc, bản ghi hỏng/cụt ở cuối (crash giữa lúc ghi) bị bỏ
+  qua và cắt đi ở lần ghi tiếp theo. Bản ghi hỏng mà phía sau vẫn còn bản ghi hợp lệ thì không
+  phải crash giữa lúc ghi: ``read`` báo ``DeltaLogCorrupted`` (không cắt gì), ``replay`` giữ bản
+  sao log ở ``<path_db>.log.corrupt-<thời điểm>``, áp dụng mọi bản ghi còn đọc được rồi ghi snapshot mới.
+- ``<path_db>.meta``: ``seq`` và crc32 của snapshot hiện tại cùng snapshot trước đó. Đây là điểm
+  chuyển nguyên tử khi nén log: ghi meta mới rồi mới ``os.replace`` snapshot, nên dù crash ở
+  giữa thì crc của snapshot trên đĩa vẫn cho biết nó chứa tới ``seq`` nào. Meta còn lưu
+  (inode, kích thước, mtime) của snapshot để lúc nạp thường không phải đọc cả tệp tính crc.
+- ``<path_db>.lock``: ``flock`` giữa các tiến trình (Flask worker, UI, công cụ CLI) dùng chung gallery.
+- ``<path_db>.migrate.lock``: ``flock`` không chờ để chỉ một ``VectorBD`` dựng index khi chuyển loại/cách lưu.
+
+Khi nạp, snapshot được đọc rồi phát lại các bản ghi có ``seq`` lớn hơn snapshot.
+"""
+
+import json
+import os
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+import numpy as np
+import faiss
+from src import config as conf
+
+try:
+    import fcntl
+except ImportError:  # Windows: không khoá giữa các tiến trình
+    fcntl = None
+
+OP_ADD = 1
+OP_REMOVE = 2
+
+# crc32, seq, op, id, số byte vector theo sau
+_RECORD = struct.Struct('<IQBqI')
+
+
+class DeltaLogCorrupted(RuntimeError):
+    """Delta log có bản ghi hỏng ở giữa (sau nó còn bản ghi hợp lệ), không phải đuôi cụt do crash."""
+    def __init__(self, path: str, offset: int):
+        super().__init__(f"Delta log {path} hỏng tại byte {offset} (phía sau còn bản ghi hợp lệ)")
+        self.path = path
+        self.offset = offset
+
+
+def file_crc32(path: str, chunk_size: int = 1 << 20) -> int:
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _fingerprint(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def apply_delta(index: faiss.Index, op: int, id: int, vectors: np.ndarray = None) -> faiss.Index:
+    """Áp dụng một thao tác lên ``index``; trả về index (xoá trên HNSW trả về ``SegmentedIndex`` bọc nó)."""
+    from src.core.ann import remove_ids
+    if op == OP_ADD:
+        index.add_with_ids(vectors, np.full(len(vectors), id, dtype=np.int64))
+        return index
+    return remove_ids(index, [id])
+
+
+class DeltaLog():
+    """Đọc/ghi delta log và snapshot của một gallery.
+
+    Args:
+        path_db: Đường dẫn snapshot FAISS.
+        dim: Chiều embedding.
+    """
+    def __init__(self, path_db: str = conf.path_vector_db, dim: int = conf.dim):
+        self.path_db = path_db
+        self.dim = dim
+        self.path = f"{path_db}.log"
+        self.meta_path = f"{path_db}.meta"
+        self.lock_path = f"{path_db}.lock"
+        self.migrate_lock_path = f"{path_db}.migrate.lock"
+        self.last_seq = 0
+        # Vị trí đã quét tới (theo inode của tệp log) để lần đọc sau chỉ quét phần mới
+        self._scanned = (None, 0, 0)  # (inode, offset, seq tại offset)
+
+    @contextmanager
+    def locked(self):
+        """Khoá gallery giữa các tiến trình (và giữa các luồng, mỗi lần khoá mở fd riêng).
+
+        Mọi thay đổi index (ghi log, nạp/phát lại, nén) diễn ra trong khoá này.
+        """
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    @contextmanager
+    def migrating(self):
+        """Thử giành quyền chuyển đổi gallery (không chờ); trả về True nếu giành được.
+
+        Mỗi lần thử mở fd riêng nên chỉ một ``VectorBD`` (kể cả nhiều đối tượng trong cùng tiến trình)
+        huấn luyện index mới; các đối tượng khác bỏ qua và nạp snapshot mới qua ``_catch_up``.
+        """
+        if fcntl is None:
+            yield True
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.migrate_lock_path)), exist_ok=True)
+        fd = os.open(self.migrate_lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+
+    def read_meta(self) -> dict:
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def snapshot_seq(self):
+        """``seq`` mà snapshot trên đĩa đã bao gồm (0 nếu chưa từng nén); None nếu snapshot không khớp meta."""
+        meta = self.read_meta()
+        if not meta or not os.path.exists(self.path_db):
+            return 0
+        entries = (meta, meta.get("previous") or {})
+        stat = _fingerprint(self.path_db)
+        for entry in entries:
+            if entry.get("stat") == stat:
+                return int(entry.get("seq", 0))
+        crc = file_crc32(self.path_db)
+        for entry in entries:
+            if entry.get("crc") == crc:
+                return int(entry.get("seq", 0))
+        return None
+
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def _parse(self, data: bytes, pos: int):
+        """Bản ghi hợp lệ bắt đầu tại ``pos``: ``(seq, op, id, length, end)``, hoặc None."""
+        if pos + _RECORD.size > len(data):
+            return None
+        crc, seq, op, id, length = _RECORD.unpack_from(data, pos)
+        end = pos + _RECORD.size + length
+        if op not in (OP_ADD, OP_REMOVE) or length % (4 * self.dim) or end > len(data):
+            return None
+        if zlib.crc32(data[pos + 4:end]) != crc:
+            return None
+        return seq, op, id, length, end
+
+    def _next_valid(self, data: bytes, pos: int, after_seq: int = 0):
+        """Vị trí bản ghi hợp lệ đầu tiên sau ``pos`` có ``seq > after_seq`` (None nếu không còn)."""
+        for start in range(pos + 1, len(data) - _RECORD.size + 1):
+            record = self._parse(data, start)
+            if record is not None and record[0] > after_seq:
+                return start
+        return None
+
+    def _record(self, data: bytes, pos: int, parsed) -> tuple:
+        seq, op, id, length, _ = parsed
+        vectors = None
+        if length:
+            vectors = np.frombuffer(data, dtype=np.float32, count=length // 4, offset=pos + _RECORD.size).reshape(-1, self.dim).copy()
+        return seq, op, id, vectors
+
+    def read(self, after_seq: int = 0) -> list:
+        """Các bản ghi hợp lệ có ``seq > after_seq``: list ``(seq, op, id, vectors | None)``.
+
+        Cập nhật ``self.last_seq`` (bản ghi cuối hoặc ``seq`` của snapshot nếu log rỗng).
+
+        Raises:
+            DeltaLogCorrupted: Bản ghi hỏng nằm giữa log (không phải đuôi cụt).
+        """
+        inode, offset, offset_seq = self._scanned
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_ino != inode or stat.st_size < offset or after_seq < offset_seq:
+            inode, offset, offset_seq = (stat.st_ino if stat else None), 0, 0
+        records = []
+        last_seq = offset_seq
+        if stat is not None:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            pos = 0
+            while pos < len(data):
+                parsed = self._parse(data, pos)
+                if parsed is None:
+                    if self._next_valid(data, pos, last_seq) is not None:
+                        raise DeltaLogCorrupted(self.path, offset + pos)
+                    break  # bản ghi cụt ở cuối: crash giữa lúc ghi
+                if parsed[0] > after_seq:
+                    records.append(self._record(data, pos, parsed))
+                last_seq = parsed[0]
+                pos = parsed[4]
+            offset += pos
+        self._scanned = (inode, offset, last_seq)
+        self.last_seq = max(last_seq, int(self.read_meta().get("seq", 0)))
+        return records
+
+    def append(self, op: int, id: int, vectors: np.ndarray = None) -> int:
+        """Ghi một bản ghi (gọi trong ``locked()`` sau ``read``) rồi ``fsync``; trả về ``seq`` của nó."""
+        inode, offset, _ = self._scanned
+        payload = b'' if vectors is None else np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+        seq = self.last_seq + 1
+        body = _RECORD.pack(0, seq, op, id, len(payload))[4:] + payload
+        record = struct.pack('<I', zlib.crc32(body)) + body
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            stat = os.fstat(fd)
+            if stat.st_ino != inode:
+                offset = 0 if stat.st_size == 0 else None
+            if offset is None:
+                raise RuntimeError("Delta log đã đổi từ lần đọc trước, cần read() lại")
+            if stat.st_size > offset:
+                os.ftruncate(fd, offset)  # bỏ đuôi cụt còn sót (``read`` đã xác nhận không còn bản ghi hợp lệ phía sau)
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.write(fd, record)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._scanned = (os.stat(self.path).st_ino, offset + len(record), seq)
+        self.last_seq = seq
+        return seq
+
+    def write_snapshot(self, index: faiss.Index, seq: int) -> int:
+        """Ghi ``index`` (đã gồm mọi bản ghi tới ``seq``) thành snapshot mới rồi làm rỗng log.
+
+        Gọi trong ``locked()``. Trả về crc32 của snapshot mới.
+        """
+        from src.core.ann import SegmentedIndex
+        if isinstance(index, SegmentedIndex):
+            index = index.materialize()
+        blob = faiss.serialize_index(index)
+        crc = zlib.crc32(blob)
+        meta = self.read_meta()
+        if meta:
+            previous = {"seq": meta.get("seq", 0), "crc": meta.get("crc"), "stat": meta.get("stat")}
+        else:
+            previous = {"seq": 0, "crc": file_crc32(self.path_db) if os.path.exists(self.path_db) else None}
+
+        tmp_path = f"{self.path_db}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_meta = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump({"seq": seq, "crc": crc, "stat": _fingerprint(tmp_path), "previous": previous}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_meta, self.meta_path)
+        os.replace(tmp_path, self.path_db)
+        # Log mới rỗng (tệp mới nên tiến trình khác nhận ra qua inode)
+        tmp_log = f"{self.path}.{os.getpid()}.tmp"
+        open(tmp_log, 'wb').close()
+        os.replace(tmp_log, self.path)
+        _fsync_dir(self.path_db)
+        self._scanned = (os.stat(self.path).st_ino, 0, seq)
+        self.last_seq = seq
+        return crc
+
+    def salvage(self, after_seq: int = 0) -> list:
+        """Đọc log có bản ghi hỏng ở giữa: giữ bản sao để kiểm tra, bỏ qua vùng hỏng, trả về các bản ghi còn lại."""
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        corrupt_path = f"{self.path}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+        with open(corrupt_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        records, pos, last_seq = [], 0, 0
+        while pos < len(data):
+            parsed = self._parse(data, pos)
+            if parsed is None:
+                next_pos = self._next_valid(data, pos, last_seq)
+                if next_pos is None:
+                    break
+                print(f"Delta log {self.path}: bỏ qua {next_pos - pos} byte hỏng sau seq {last_seq} (bản sao: {corrupt_path})")
+                pos = next_pos
+                continue
+            if parsed[0] > after_seq:
+                records.append(self._record(data, pos, parsed))
+            last_seq = parsed[0]
+            pos = parsed[4]
+        self.last_seq = max(last_seq, int(self.read_meta().get("seq", 0)))
+        return records
+
+    def replay(self, index: faiss.Index):
+        """Phát lại lên ``index`` (vừa đọc từ snapshot) các bản ghi chưa có trong snapshot; gọi trong ``locked()``.
+
+        Snapshot không khớp meta (bị thay thế từ bên ngoài, ví dụ khôi phục bản sao lưu) được
+        coi là trạng thái đúng: log cũ bị bỏ qua và snapshot được ghi lại kèm meta mới.
+
+        Returns:
+            (index, seq đã áp dụng tới)
+        """
+        base = self.snapshot_seq()
+        if base is None:
+            skipped = len(self.read(0))
+            print(f"Snapshot {self.path_db} không khớp {self.meta_path}: bỏ qua {skipped} bản ghi delta log")
+            self.write_snapshot(index, self.last_seq)
+            return index, self.last_seq
+        try:
+            records, corrupted = self.read(base), False
+        except DeltaLogCorrupted as e:
+            print(f"{e}: khôi phục các bản ghi còn đọc được")
+            records, corrupted = self.salvage(base), True
+        for seq, op, id, vectors in records:
+            index = apply_delta(index, op, id, vectors)
+        seq = max(base, self.last_seq)
+        if corrupted:
+            # Ghi snapshot mới để không phải đọc lại log hỏng (log được làm rỗng)
+            self.write_snapshot(index, seq)
+        return index, seq
@@ -1,48 +1,306 @@
-from ultralytics import YOLO
 import numpy as np
 import cv2
+import os
+import time
+import threading
+from collections import OrderedDict, deque
 from src.utils import *
 from src import config as conf
+from src.core.lean_detection import LeanFaceDetector
+from src.core import registry
+
+
+class UltralyticsDetector():
+    """Chạy mô hình phát hiện qua ``ultralytics.YOLO`` (hỗ trợ .pt, .onnx, thư mục OpenVINO).
+
+    ``YOLO.predict`` không gọi lại đồng thời được nên mỗi lần chạy giữ ``self._lock``.
+    """
+    def __init__(self, model_path: str):
+        from ultralytics import YOLO  # Import muộn: chỉ nạp torch/ultralytics khi thật sự dùng
+        self.model = YOLO(model_path, task="detect")
+        self._lock = threading.Lock()
+
+    def detect(self, img: np.ndarray, imgsz: int = None) -> np.ndarray:
+        """Trả về bbox khuôn mặt dạng ``xyxy`` (N, 4) kiểu int64."""
+        with self._lock:
+            results = self.model.predict(img, imgsz=imgsz or conf.detection_imgsz, verbose=False)
+        # Cần đảm bảo array nằm trên cpu để tính toán với các hàm
+        return results[0].boxes.xyxy.cpu().numpy().astype(dtype= np.int64)
+
+    def detect_batch(self, imgs: list, imgsz: int = None) -> list:
+        """Phát hiện trên nhiều ảnh trong một lần ``predict``."""
+        with self._lock:
+            results = self.model.predict(list(imgs), imgsz=imgsz or conf.detection_imgsz, verbose=False)
+        return [r.boxes.xyxy.cpu().numpy().astype(dtype= np.int64) for r in results]
+
+
+def _lean_or_ultralytics(runtime: str):
+    """Tạo hàm tải dùng ``LeanFaceDetector`` (mặc định) hoặc ultralytics theo cấu hình."""
+    def loader(model_path: str):
+        if conf.detection_use_ultralytics:
+            return UltralyticsDetector(model_path)
+        return LeanFaceDetector(model_path, runtime=runtime)
+    return loader
+
+
+# Registry backend phát hiện: tên -> (đường dẫn mô hình, hàm tải trả về đối tượng có ``detect(img)``)
+DETECTION_BACKENDS = {
+    "openvino": (conf.path_model_face_detection_openvino, _lean_or_ultralytics("openvino")),
+    "onnx": (conf.path_model_face_detection_onnx, _lean_or_ultralytics("onnx")),
+    "pytorch": (conf.path_model_face_detection, UltralyticsDetector),
+}
+
+
+def register_detection_backend(name: str, model_path: str, loader) -> None:
+    """Đăng ký (hoặc ghi đè) một backend phát hiện trong registry."""
+    DETECTION_BACKENDS[name] = (model_path, loader)
+
+
+def load_detection_backend(backend: str = None):
+    """Tải backend phát hiện theo cấu hình, tự động fallback khi lỗi.
+
+    Args:
+        backend (str): Backend ưu tiên. Mặc định lấy ``conf.detection_backend``.
+
+    Returns:
+        tuple: (tên backend đang dùng, đối tượng detector).
+
+    Raises:
+        RuntimeError: Nếu không backend nào tải được.
+    """
+    preferred = backend or conf.detection_backend
+    order = [preferred] + [name for name in conf.detection_backend_fallbacks if name != preferred]
+    errors = []
+    for name in order:
+        if name not in DETECTION_BACKENDS:
+            errors.append(f"{name}: chưa đăng ký")
+            continue
+        model_path, loader = DETECTION_BACKENDS[name]
+        if not os.path.exists(model_path):
+            errors.append(f"{name}: không tìm thấy {model_path}")
+            continue
+        try:
+            detector = loader(model_path)
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+            continue
+        if name != preferred:
+            print(f"Backend phát hiện '{preferred}' không dùng được ({'; '.join(errors)}), chuyển sang '{name}'")
+        print(f"Đang dùng backend phát hiện: {name} ({model_path})")
+        return name, detector
+    raise RuntimeError("Không tải được backend phát hiện nào: " + "; ".join(errors))
+
+
+class InputSizeSelector():
+    """Chọn ``imgsz`` cho detector dựa trên kích thước các khuôn mặt phát hiện gần đây.
+
+    Mặt ở quầy POS thường lớn, nên có thể chạy detector ở độ phân giải thấp hơn mà mặt
+    vẫn đủ ``min_face_px`` điểm ảnh trên ảnh đầu vào mô hình. Định kỳ (hoặc khi chưa thấy
+    mặt nào) sẽ chạy với ``imgsz`` lớn nhất để không bỏ sót khuôn mặt nhỏ/mới.
+
+    Lịch sử được giữ riêng cho từng nguồn frame (``source``, ví dụ id quầy POS) vì khoảng
+    cách tới camera mỗi quầy khác nhau; ``source=None`` là nguồn mặc định (camera tại chỗ).
+    Frame không có mặt cũng được ghi nhận: sau một frame trống, frame kế tiếp của nguồn đó
+    chạy với ``imgsz`` lớn nhất.
+
+    Args:
+        mode: ``'fixed'`` (luôn dùng ``conf.detection_imgsz``) hoặc ``'adaptive'``.
+        candidates: Các ``imgsz`` được phép chọn.
+        max_sources: Số nguồn giữ lịch sử (bỏ nguồn lâu không dùng nhất khi vượt).
+    """
+    def __init__(self, mode: str = conf.detection_imgsz_mode, candidates=conf.detection_imgsz_candidates,
+                 min_face_px: int = conf.detection_min_face_px, history: int = conf.detection_imgsz_history,
+                 full_scan_every: int = conf.detection_full_scan_every, max_sources: int = conf.detection_imgsz_max_sources):
+        self.mode = mode
+        self.candidates = sorted(candidates)
+        self.min_face_px = min_face_px
+        self.history = history
+        self.full_scan_every = full_scan_every
+        self.max_sources = max_sources
+        # source -> [deque cạnh ngắn của mặt nhỏ nhất mỗi frame (px ảnh gốc, None nếu không có mặt), số frame]
+        self._sources = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, source) -> list:
+        state = self._sources.get(source)
+        if state is None:
+            state = self._sources[source] = [deque(maxlen=self.history), 0]
+            if len(self._sources) > self.max_sources:
+                self._sources.popitem(last=False)
+        self._sources.move_to_end(source)
+        return state
+
+    @property
+    def largest(self) -> int:
+        return self.candidates[-1]
+
+    def select(self, shape, source=None) -> int:
+        """``imgsz`` cho frame có kích thước ``shape`` đến từ ``source``."""
+        if self.mode != "adaptive":
+            return conf.detection_imgsz
+        with self._lock:
+            recent, frames = state = self._state(source)
+            state[1] = frames = frames + 1
+            if not recent or recent[-1] is None or frames % self.full_scan_every == 0:
+                return self.largest
+            smallest_face = min(side for side in recent if side is not None)
+        long_side = max(shape[:2])
+        for imgsz in self.candidates:
+            if smallest_face * imgsz / long_side >= self.min_face_px:
+                return imgsz
+        return self.largest
+
+    def should_retry(self, imgsz: int) -> bool:
+        """True nếu frame không thấy mặt ở ``imgsz`` nên được chạy lại với ``imgsz`` lớn nhất."""
+        return self.mode == "adaptive" and imgsz < self.largest
+
+    def observe(self, boxes_list: list, sources=None) -> None:
+        """Ghi nhận kích thước khuôn mặt nhỏ nhất của từng frame (None nếu frame không có mặt)."""
+        sources = sources or [None] * len(boxes_list)
+        with self._lock:
+            for boxes, source in zip(boxes_list, sources):
+                side = None
+                if len(boxes):
+                    side = int(np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]).min())
+                self._state(source)[0].append(side)
+
 
 class FaceDetectYolo():
-    def __init__(self, model_path: str = conf.path_model_face_detection):
-        """Khởi tạo detector YOLO và các trường kết quả."""
-        self.detector = YOLO(model_path, task="detect")  # Mô hình YOLO để phát hiện khuôn mặt
-        self.img_with_bbs = None          # Ảnh đầu vào kèm bounding boxes để hiển thị
+    def __init__(self, model_path: str = None, backend: str = None, headless: bool = False):
+        """Khởi tạo detector YOLO và các trường kết quả.
+
+        Args:
+            model_path (str): Đường dẫn mô hình cụ thể (tải riêng, không qua registry mô hình dùng chung).
+            backend (str): Tên backend trong ``DETECTION_BACKENDS``. Mặc định theo cấu hình.
+            headless (bool): True để không giữ ảnh đầu vào (``img_with_bbs`` luôn là None).
+        """
+        self.headless = headless
+        if model_path is not None:
+            self.backend = "custom"
+            self.detector = UltralyticsDetector(model_path)
+        else:
+            self.backend, self.detector = registry.get_detection_backend(backend)  # Backend đang hoạt động + mô hình dùng chung
+        self._img_input = None            # Ảnh đầu vào gần nhất (chỉ giữ tham chiếu, xem ``img_with_bbs``)
         self.cropped_faces = np.array([]) # Batch ảnh khuôn mặt đã resize + normalize cho mô hình nhận diện
         self.bbs_face = []                # Danh sách bbox khuôn mặt theo định dạng [x1, y1, x2, y2]
+        self.input_size = InputSizeSelector()  # Chọn imgsz cho detector theo các mặt gần đây
+        self.last_imgsz = None            # imgsz dùng ở lần phát hiện gần nhất (chỉ để theo dõi)
+        self.last_detect_ms = 0.0         # Thời gian phát hiện gần nhất (ms, chỉ để theo dõi)
+        # Buffer crop riêng cho từng luồng: staging uint8 (đã resize) và float32 (đã normalize)
+        self._local = threading.local()
+
+    def _reserve_crop_buffer(self, n_faces: int, target_size):
+        """Buffer crop của luồng hiện tại, cấp phát (lại) khi số mặt vượt sức chứa hoặc đổi ``target_size``.
+
+        Returns:
+            tuple: (staging uint8, buffer float32) shape (capacity, H, W, 3).
+        """
+        shape = (target_size[1], target_size[0], 3)
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None and buffer.shape[1:] == shape and len(buffer) >= n_faces:
+            return self._local.staging, buffer
+        capacity = max(n_faces, conf.max_faces)
+        if buffer is not None and buffer.shape[1:] == shape:
+            capacity = max(capacity, 2 * len(buffer))  # tăng gấp đôi để tránh cấp phát lặp lại
+        self._local.staging = np.empty((capacity,) + shape, dtype=np.uint8)
+        self._local.buffer = np.empty((capacity,) + shape, dtype=np.float32)
+        return self._local.staging, self._local.buffer
+
+    @staticmethod
+    def _valid_boxes(boxes: np.ndarray) -> np.ndarray:
+        """Bỏ các box suy biến (rộng/cao bằng 0) để không cắt ra ảnh rỗng."""
+        return boxes[(boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])]
+
+    def _run_detector(self, imgs: list, imgsz: int) -> list:
+        if hasattr(self.detector, "detect_batch"):
+            boxes_list = self.detector.detect_batch(imgs, imgsz)
+        else:
+            boxes_list = [self.detector.detect(img, imgsz) for img in imgs]
+        return [self._valid_boxes(boxes) for boxes in boxes_list]
+
+    def detect_faces(self, imgs: list, sources: list = None):
+        """Phát hiện khuôn mặt cho nhiều ảnh (một lần chạy mô hình nếu backend hỗ trợ).
+
+        Không giữ kết quả trên ``self`` nên gọi được đồng thời từ nhiều luồng: phiên ONNX Runtime
+        an toàn giữa các luồng, OpenVINO dùng ``InferRequest`` riêng cho từng luồng và ultralytics
+        chạy tuần tự dưới khoá của ``UltralyticsDetector`` (``last_imgsz``/``last_detect_ms`` chỉ để theo dõi).
+
+        Args:
+            imgs: Danh sách ảnh BGR.
+            sources: Nguồn của từng ảnh (ví dụ id quầy POS) để chọn ``imgsz`` theo lịch sử riêng;
+                None = nguồn mặc định cho mọi ảnh.
+
+        Returns:
+            tuple: (list bbox ``xyxy`` hợp lệ của từng ảnh, imgsz lớn nhất đã dùng, thời gian phát hiện (ms)).
+        """
+        sources = sources or [None] * len(imgs)
+        # Cả batch dùng chung một imgsz (lớn nhất trong các lựa chọn) để ghép được tensor
+        imgsz = max(self.input_size.select(img.shape, source) for img, source in zip(imgs, sources))
+        start = time.perf_counter()
+        boxes_list = self._run_detector(imgs, imgsz)
+        missed = [i for i, boxes in enumerate(boxes_list) if not len(boxes)]
+        if missed and self.input_size.should_retry(imgsz):
+            # imgsz giảm có thể làm mất mặt ở xa: chạy lại ngay các ảnh trống với imgsz lớn nhất
+            imgsz = self.input_size.largest
+            for i, boxes in zip(missed, self._run_detector([imgs[i] for i in missed], imgsz)):
+                boxes_list[i] = boxes
+        detect_ms = (time.perf_counter() - start) * 1000
+        self.last_detect_ms, self.last_imgsz = detect_ms, imgsz
+        self.input_size.observe(boxes_list, sources)
+        return boxes_list, imgsz, detect_ms
+
+    def detect_batch(self, imgs: list) -> list:
+        """Như ``detect_faces`` nhưng chỉ trả về danh sách bbox của từng ảnh."""
+        return self.detect_faces(imgs)[0]
+
+    def crop_faces(self, imgs: list, boxes_list: list, target_size=(160, 160)) -> np.ndarray:
+        """Cắt + resize + normalize khuôn mặt của nhiều ảnh vào chung một batch.
+
+        Returns:
+            np.ndarray: View float32 (tổng số mặt, H, W, 3) trên buffer dùng lại của luồng
+            hiện tại (bị ghi đè ở lần gọi kế tiếp cùng luồng), thứ tự theo ảnh rồi theo bbox.
+        """
+        n_faces = sum(len(boxes) for boxes in boxes_list)
+        staging, buffer = self._reserve_crop_buffer(n_faces, target_size)
+        staging = staging[:n_faces]
+
+        i = 0
+        for img, boxes in zip(imgs, boxes_list):
+            for x1, y1, x2, y2 in boxes:
+                # Cắt + resize ghi thẳng vào buffer dùng lại
+                cv2.resize(img[y1 : y2, x1 : x2], target_size, dst=staging[i])
+                i += 1
+
+        # Chuẩn hoá cả batch một lần, ghi vào buffer float32
+        return normalize_input(staging, out=buffer[:n_faces])
+
+    @property
+    def img_with_bbs(self):
+        """Bản copy của ảnh vào ``set_img_input`` gần nhất kèm bounding boxes (None khi headless).
+
+        Chỉ copy và vẽ khi được đọc, nên các lời gọi không cần hiển thị không tốn bước này.
+        """
+        if self._img_input is None:
+            return None
+        img = self._img_input.copy()
+        for x1, y1, x2, y2 in self.bbs_face:
+            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        return img
+
     def set_img_input(self, img: np.ndarray, target_size=(160, 160)) -> None:
         """Chạy phát hiện khuôn mặt trên ảnh và chuẩn bị batch đầu vào.
 
+        API có trạng thái cho giao diện/script một luồng; server dùng ``detect_faces`` + ``crop_faces``.
+        ``self.cropped_faces`` là view (không copy) trên buffer dùng lại giữa các lần gọi,
+        nên sẽ bị ghi đè ở lần gọi kế tiếp.
+
         Args:
             img (np.ndarray): Ảnh đầu vào (BGR - OpenCV).
             target_size (tuple): Kích thước HxW cho ảnh khuôn mặt đầu vào model nhận diện.
         """
-        self.img_with_bbs = img.copy()
-        results = self.detector.predict(img, verbose=False)
-    
-        # Cần đảm bảo array nằm trên cpu để tính toán với các hàm
-        self.bbs_face = results[0].boxes.xyxy.cpu().numpy().astype(dtype= np.int64) 
-        
-        self.cropped_faces = np.array([])
-        
-        for box in self.bbs_face:
-            x1, y1, x2, y2 = box
-            # Cắt ảnh            
-            cropped = img[y1 : y2, x1 : x2]
-            
-            # Vẽ box lên đầu ra
-            cv2.rectangle(self.img_with_bbs, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-            # Tiền xử lý ảnh
-            cropped_resized = cv2.resize(cropped, target_size)
-            cropped_resized = normalize_input(cropped_resized)
-            
-            # Bước thêm các ảnh sau xử lý vào array kiểm tra array có rỗng không mới dùng append được
-            if len(self.cropped_faces) == 0:
-                self.cropped_faces = np.expand_dims(cropped_resized, axis=0)
-            else:
-                self.cropped_faces = np.append(self.cropped_faces, [cropped_resized], axis=0)
+        self._img_input = None if self.headless else img
+        self.bbs_face = self.detect_batch([img])[0]
+        self.cropped_faces = self.crop_faces([img], [self.bbs_face], target_size)
 
 
 #******************************************** Code test **********************************************
@@ -52,6 +310,7 @@ if __name__ == '__main__':
 
     cam = cv2.VideoCapture(0)
     detector = FaceDetectYolo()
+    print(f"Backend: {detector.backend}")
     while True:
         ret, frame = cam.read()
         if not ret:
@@ -62,8 +321,9 @@ if __name__ == '__main__':
         time_pre = datetime.datetime.now()
         fps = 1 / (time_pre - timenow).total_seconds()
         timenow = time_pre
-        cv2.putText(detector.img_with_bbs, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.imshow("Face Detection", detector.img_with_bbs)
+        display_img = detector.img_with_bbs
+        cv2.putText(display_img, f"FPS: {fps:.2f}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        cv2.imshow("Face Detection", display_img)
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
@@ -0,0 +1,292 @@
+"""
+Các backend suy luận embedding khuôn mặt (Facenet_128).
+
+- ``keras``: ``model.predict`` như trước (chậm với batch nhỏ, chỉ để đối chiếu).
+- ``keras_compiled``: ``tf.function`` đã trace sẵn cho các bucket batch cố định
+  (1/2/4/8); batch được pad lên bucket gần nhất nên không bao giờ retrace.
+- ``onnx``: ONNX Runtime chạy bản export ``Facenet_128.onnx``.
+- ``tflite``: TFLite Interpreter (ưu tiên gói ``tflite_runtime``), mỗi bucket batch
+  giữ một interpreter đã cấp phát tensor sẵn; không nạp Keras nên tốn ít RAM nhất.
+
+Chạy ``python -m src.core.embedding --export-onnx --export-tflite --parity`` để
+export và kiểm tra độ khớp đầu ra giữa các backend với Keras. Đây là bước kiểm tra thủ công
+(repo chưa có test tự động), cần TensorFlow và các tệp model; lệnh thoát mã 1 nếu có backend lệch.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+from src import config as conf
+
+
+def _bucket_for(n: int, buckets) -> int:
+    """Bucket nhỏ nhất chứa được ``n`` mẫu (``n`` <= bucket lớn nhất)."""
+    for b in buckets:
+        if n <= b:
+            return b
+    return buckets[-1]
+
+
+class KerasEmbedder():
+    """Gọi ``model.predict`` trực tiếp (hành vi gốc)."""
+    def __init__(self, model_path: str):
+        from keras.models import load_model
+        self.model = load_model(model_path, compile=False, safe_mode=False)
+
+    def __call__(self, faces: np.ndarray) -> np.ndarray:
+        return self.model.predict(faces, verbose=False)
+
+
+class _BucketedEmbedder(ABC):
+    """Chia batch theo bucket cố định, pad phần thiếu vào buffer dựng sẵn của bucket.
+
+    Buffer pad (và interpreter TFLite) là trạng thái dùng chung nên mỗi lần gọi giữ ``self._lock``.
+    """
+    def __init__(self, buckets, input_shape):
+        self.buckets = tuple(sorted(buckets))
+        self._pad = {b: np.zeros((b,) + tuple(input_shape), dtype=np.float32) for b in self.buckets}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _run_bucket(self, batch: np.ndarray) -> np.ndarray:
+        """Suy luận một batch đúng bằng một bucket; trả về embedding (b, dim)."""
+
+    def __call__(self, faces: np.ndarray) -> np.ndarray:
+        n = len(faces)
+        max_bucket = self.buckets[-1]
+        outputs = []
+        with self._lock:
+            for start in range(0, n, max_bucket):
+                chunk = faces[start:start + max_bucket]
+                b = _bucket_for(len(chunk), self.buckets)
+                if b != len(chunk):
+                    # Pad vào buffer cố định của bucket để giữ nguyên shape đã chuẩn bị
+                    self._pad[b][:len(chunk)] = chunk
+                    chunk_in = self._pad[b]
+                else:
+                    chunk_in = np.ascontiguousarray(chunk, dtype=np.float32)
+                outputs.append(self._run_bucket(chunk_in)[:len(chunk)])
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
+
+
+class CompiledKerasEmbedder(_BucketedEmbedder):
+    """Suy luận bằng hàm ``tf.function`` đã trace cho từng bucket batch cố định.
+
+    Args:
+        model_path: Đường dẫn mô hình Keras (.h5).
+        buckets: Các kích thước batch được trace sẵn; batch lớn hơn được chia nhỏ.
+    """
+    def __init__(self, model_path: str, buckets=conf.embedding_batch_buckets):
+        import tensorflow as tf
+        from keras.models import load_model
+        self.model = load_model(model_path, compile=False, safe_mode=False)
+        input_shape = tuple(self.model.input_shape[1:])
+        super().__init__(buckets, input_shape)
+
+        fn = tf.function(lambda x: self.model(x, training=False))
+        self._concrete = {
+            b: fn.get_concrete_function(tf.TensorSpec((b,) + input_shape, tf.float32))
+            for b in self.buckets
+        }
+        self._tf = tf
+
+    def _run_bucket(self, batch: np.ndarray) -> np.ndarray:
+        return self._concrete[len(batch)](self._tf.constant(batch)).numpy()
+
+
+def _tflite_interpreter_class():
+    """Ưu tiên ``tflite_runtime`` (nhẹ); nếu không có thì dùng interpreter trong TensorFlow."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter
+    return Interpreter
+
+
+class TFLiteEmbedder(_BucketedEmbedder):
+    """Suy luận bằng TFLite Interpreter, cache một interpreter đã ``allocate_tensors`` cho mỗi bucket.
+
+    Hỗ trợ cả mô hình lượng tử hoá (đầu vào/đầu ra int8/uint8) thông qua tham số quantization.
+
+    Args:
+        model_path: Đường dẫn tệp ``.tflite``.
+        buckets: Các kích thước batch dùng để resize tensor đầu vào.
+        num_threads: Số luồng CPU cho interpreter (None = mặc định của TFLite).
+    """
+    def __init__(self, model_path: str, buckets=conf.embedding_batch_buckets, num_threads=conf.tflite_num_threads):
+        self._interpreter_cls = _tflite_interpreter_class()
+        self.model_path = model_path
+        self.num_threads = num_threads
+        probe = self._interpreter_cls(model_path=model_path, num_threads=num_threads)
+        input_shape = tuple(probe.get_input_details()[0]["shape"][1:])
+        super().__init__(buckets, input_shape)
+        self._interpreters = {}  # bucket -> (interpreter, input_details, output_details)
+
+    def _interpreter_for(self, batch_size: int):
+        cached = self._interpreters.get(batch_size)
+        if cached is not None:
+            return cached
+        interpreter = self._interpreter_cls(model_path=self.model_path, num_threads=self.num_threads)
+        input_details = interpreter.get_input_details()[0]
+        interpreter.resize_tensor_input(input_details["index"], (batch_size,) + tuple(input_details["shape"][1:]))
+        interpreter.allocate_tensors()
+        cached = (interpreter, interpreter.get_input_details()[0], interpreter.get_output_details()[0])
+        self._interpreters[batch_size] = cached
+        return cached
+
+    def _run_bucket(self, batch: np.ndarray) -> np.ndarray:
+        interpreter, input_details, output_details = self._interpreter_for(len(batch))
+        if input_details["dtype"] != np.float32:
+            scale, zero_point = input_details["quantization"]
+            limits = np.iinfo(input_details["dtype"])  # kẹp về miền của kiểu nguyên, tránh tràn số khi ép kiểu
+            batch = np.clip(np.round(batch / scale + zero_point), limits.min, limits.max).astype(input_details["dtype"])
+        interpreter.set_tensor(input_details["index"], batch)
+        interpreter.invoke()
+        out = interpreter.get_tensor(output_details["index"])
+        if output_details["dtype"] != np.float32:
+            scale, zero_point = output_details["quantization"]
+            return (out.astype(np.float32) - zero_point) * scale
+        return out.copy()
+
+
+class OnnxEmbedder():
+    """Suy luận bằng ONNX Runtime trên bản export của mô hình Keras."""
+    def __init__(self, model_path: str):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, faces: np.ndarray) -> np.ndarray:
+        faces = np.ascontiguousarray(faces, dtype=np.float32)
+        return self.session.run(None, {self.input_name: faces})[0]
+
+
+# Registry backend embedding: tên -> (đường dẫn mô hình, hàm tải trả về callable faces -> embeds)
+EMBEDDING_BACKENDS = {
+    "keras_compiled": (conf.path_model_face_recognition, CompiledKerasEmbedder),
+    "onnx": (conf.path_model_face_recognition_onnx, OnnxEmbedder),
+    "tflite": (conf.path_model_face_recognition_tflite, TFLiteEmbedder),
+    "keras": (conf.path_model_face_recognition, KerasEmbedder),
+}
+
+
+def load_embedding_backend(backend: str = None):
+    """Tải backend embedding theo cấu hình, tự động fallback khi lỗi.
+
+    Args:
+        backend (str): Backend ưu tiên. Mặc định lấy ``conf.embedding_backend``.
+
+    Returns:
+        tuple: (tên backend đang dùng, callable nhận batch (N, H, W, C) trả về (N, D)).
+
+    Raises:
+        RuntimeError: Nếu không backend nào tải được.
+    """
+    preferred = backend or conf.embedding_backend
+    order = [preferred] + [name for name in conf.embedding_backend_fallbacks if name != preferred]
+    errors = []
+    for name in order:
+        if name not in EMBEDDING_BACKENDS:
+            errors.append(f"{name}: chưa đăng ký")
+            continue
+        model_path, loader = EMBEDDING_BACKENDS[name]
+        if not os.path.exists(model_path):
+            errors.append(f"{name}: không tìm thấy {model_path}")
+            continue
+        try:
+            embedder = loader(model_path)
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+            continue
+        if name != preferred:
+            print(f"Backend embedding '{preferred}' không dùng được ({'; '.join(errors)}), chuyển sang '{name}'")
+        print(f"Đang dùng backend embedding: {name} ({model_path})")
+        return name, embedder
+    raise RuntimeError("Không tải được backend embedding nào: " + "; ".join(errors))
+
+
+def export_onnx(keras_path: str = conf.path_model_face_recognition,
+                onnx_path: str = conf.path_model_face_recognition_onnx) -> str:
+    """Export mô hình Keras sang ONNX (batch động) bằng ``tf2onnx``."""
+    import tensorflow as tf
+    from keras.models import load_model
+    try:
+        import tf2onnx
+    except ImportError as e:
+        raise RuntimeError("Cần cài tf2onnx để export: pip install tf2onnx") from e
+
+    model = load_model(keras_path, compile=False, safe_mode=False)
+    spec = (tf.TensorSpec((None,) + tuple(model.input_shape[1:]), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=onnx_path)
+    print(f"Đã export ONNX: {onnx_path}")
+    return onnx_path
+
+
+def export_tflite(keras_path: str = conf.path_model_face_recognition,
+                  tflite_path: str = conf.path_model_face_recognition_tflite) -> str:
+    """Export mô hình Keras sang TFLite (float32, batch động)."""
+    import tensorflow as tf
+    from keras.models import load_model
+
+    model = load_model(keras_path, compile=False, safe_mode=False)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(tflite_path, "wb") as f:
+        f.write(converter.convert())
+    print(f"Đã export TFLite: {tflite_path}")
+    return tflite_path
+
+
+def check_parity(reference, candidate, faces: np.ndarray, atol: float = 1e-3) -> dict:
+    """So sánh embedding (đã chuẩn hoá L2) của hai backend trên cùng một batch.
+
+    Returns:
+        dict: ``max_abs_diff``, ``min_cosine`` và ``ok`` (True nếu chênh lệch <= ``atol``).
+    """
+    ref = np.asarray(reference(faces), dtype=np.float32)
+    out = np.asarray(candidate(faces), dtype=np.float32)
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+    out /= np.linalg.norm(out, axis=1, keepdims=True)
+    max_abs_diff = float(np.abs(ref - out).max())
+    min_cosine = float((ref * out).sum(axis=1).min())
+    return {"max_abs_diff": max_abs_diff, "min_cosine": min_cosine, "ok": max_abs_diff <= atol}
+
+
+#******************************************** Code test **********************************************
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--export-onnx", action="store_true", help="Export Facenet Keras sang ONNX")
+    parser.add_argument("--export-tflite", action="store_true", help="Export Facenet Keras sang TFLite")
+    parser.add_argument("--parity", action="store_true", help="So sánh đầu ra các backend với Keras predict (kiểm tra thủ công)")
+    args = parser.parse_args()
+
+    if args.export_onnx:
+        export_onnx()
+    if args.export_tflite:
+        export_tflite()
+
+    if args.parity:
+        reference = KerasEmbedder(conf.path_model_face_recognition)
+        rng = np.random.default_rng(0)
+        failed = False
+        for name in ("keras_compiled", "onnx", "tflite"):
+            model_path, loader = EMBEDDING_BACKENDS[name]
+            if not os.path.exists(model_path):
+                print(f"[SKIP] {name}: không tìm thấy {model_path}")
+                continue
+            candidate = loader(model_path)
+            for n in (1, 3, 8, 11):
+                faces = rng.uniform(-1, 1, size=(n, 160, 160, 3)).astype(np.float32)
+                result = check_parity(reference, candidate, faces)
+                start = time.perf_counter()
+                candidate(faces)
+                elapsed = (time.perf_counter() - start) * 1000
+                status = "OK" if result["ok"] else "FAIL"
+                failed = failed or not result["ok"]
+                print(f"[{status}] {name} batch={n}: max_abs_diff={result['max_abs_diff']:.2e} "
+                      f"min_cos={result['min_cosine']:.6f} ({elapsed:.1f} ms)")
+        if failed:
+            raise SystemExit(1)
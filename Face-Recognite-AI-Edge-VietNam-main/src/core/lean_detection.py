@@ -0,0 +1,184 @@
+"""
+Detector YOLO gọn nhẹ chạy trực tiếp graph ONNX/OpenVINO đã export.
+
+Không phụ thuộc ``ultralytics``/``torch``: letterbox, giải mã đầu ra và NMS
+đều được thực hiện bằng NumPy (vector hoá), trả về bbox ``xyxy`` giống
+``UltralyticsDetector.detect``.
+"""
+
+import os
+import threading
+import numpy as np
+import cv2
+from src import config as conf
+
+
+def letterbox(img: np.ndarray, imgsz: int = 640, stride: int = 32, auto: bool = True, pad_value: int = 114):
+    """Resize giữ tỉ lệ và pad ảnh về kích thước phù hợp với YOLO.
+
+    Args:
+        img (np.ndarray): Ảnh đầu vào (BGR - OpenCV).
+        imgsz (int): Cạnh dài sau khi resize.
+        stride (int): Bội số kích thước mà mô hình yêu cầu.
+        auto (bool): True để chỉ pad tới bội số ``stride`` gần nhất (mô hình dynamic shape),
+            False để pad thành hình vuông ``imgsz`` x ``imgsz``.
+        pad_value (int): Giá trị điểm ảnh vùng pad.
+
+    Returns:
+        tuple: (tensor NCHW float32 RGB trong [0, 1], tỉ lệ resize, (pad_x, pad_y)).
+    """
+    h, w = img.shape[:2]
+    ratio = min(imgsz / h, imgsz / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if auto:
+        out_w = int(np.ceil(new_w / stride) * stride)
+        out_h = int(np.ceil(new_h / stride) * stride)
+    else:
+        out_w = out_h = imgsz
+    pad_x, pad_y = (out_w - new_w) // 2, (out_h - new_h) // 2
+
+    canvas = np.full((out_h, out_w, 3), pad_value, dtype=np.uint8)
+    if (new_w, new_h) != (w, h):
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    else:
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = img
+
+    # BGR -> RGB, HWC -> CHW, [0, 255] -> [0, 1] trong một lần ghi
+    tensor = np.empty((1, 3, out_h, out_w), dtype=np.float32)
+    np.multiply(canvas[..., ::-1].transpose(2, 0, 1), np.float32(1 / 255.0), out=tensor[0], casting='unsafe')
+    return tensor, ratio, (pad_x, pad_y)
+
+
+def decode_predictions(output: np.ndarray, conf_threshold: float):
+    """Giải mã đầu ra YOLO (1, 4 + nc, anchors) thành bbox ``xyxy`` và điểm tin cậy.
+
+    Returns:
+        tuple: (boxes (N, 4) float32, scores (N,) float32) đã lọc theo ``conf_threshold``.
+    """
+    preds = output[0]                      # (4 + nc, anchors)
+    scores = preds[4:].max(axis=0)
+    mask = scores > conf_threshold
+    if not mask.any():
+        return np.empty((0, 4), dtype=np.float32), np.empty((0,), dtype=np.float32)
+    cx, cy, bw, bh = preds[:4, mask]
+    half_w, half_h = bw / 2, bh / 2
+    boxes = np.stack([cx - half_w, cy - half_h, cx + half_w, cy + half_h], axis=1)
+    return boxes, scores[mask]
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, max_det: int = 300) -> np.ndarray:
+    """Non-maximum suppression; IoU giữa box được chọn và phần còn lại tính vector hoá.
+
+    Returns:
+        np.ndarray: Chỉ số các box được giữ lại, sắp xếp theo điểm giảm dần.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0 and len(keep) < max_det:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+class _OnnxRuntimeSession():
+    """Chạy graph ONNX bằng ONNX Runtime (CPU); ``InferenceSession.run`` gọi được đồng thời từ nhiều luồng."""
+    def __init__(self, model_path: str):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, tensor: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: tensor})[0]
+
+
+class _OpenVINOSession():
+    """Chạy IR OpenVINO (thư mục ``*_openvino_model`` hoặc tệp ``.xml``) trên CPU.
+
+    ``CompiledModel.__call__`` dùng chung một ``InferRequest`` nội bộ nên không gọi đồng thời
+    được: mỗi luồng dùng ``InferRequest`` riêng (tạo ở lần gọi đầu tiên của luồng).
+    """
+    def __init__(self, model_path: str):
+        import openvino as ov
+        if os.path.isdir(model_path):
+            xml_files = [f for f in os.listdir(model_path) if f.endswith(".xml")]
+            if not xml_files:
+                raise FileNotFoundError(f"Không tìm thấy tệp .xml trong {model_path}")
+            model_path = os.path.join(model_path, xml_files[0])
+        core = ov.Core()
+        self.compiled = core.compile_model(core.read_model(model_path), "CPU")
+        self.output = self.compiled.output(0)
+        self._local = threading.local()
+
+    def __call__(self, tensor: np.ndarray) -> np.ndarray:
+        request = getattr(self._local, "request", None)
+        if request is None:
+            request = self._local.request = self.compiled.create_infer_request()
+        return request.infer(tensor)[self.output]
+
+
+class LeanFaceDetector():
+    """Detector khuôn mặt không cần ultralytics, cùng hợp đồng ``detect(img) -> xyxy``.
+
+    Args:
+        model_path: Tệp ``.onnx`` hoặc thư mục/tệp IR OpenVINO.
+        runtime: ``'onnx'`` hoặc ``'openvino'``.
+        imgsz: Cạnh dài đầu vào của mô hình.
+    """
+    RUNTIMES = {"onnx": _OnnxRuntimeSession, "openvino": _OpenVINOSession}
+
+    def __init__(self, model_path: str, runtime: str = "onnx", imgsz: int = conf.detection_imgsz):
+        if runtime not in self.RUNTIMES:
+            raise ValueError(f"Runtime không hỗ trợ: {runtime}")
+        self.session = self.RUNTIMES[runtime](model_path)
+        self.imgsz = imgsz
+        self.conf_threshold = conf.detection_conf_threshold
+        self.iou_threshold = conf.detection_iou_threshold
+
+    def _postprocess(self, output: np.ndarray, ratio: float, pad, shape) -> np.ndarray:
+        """Giải mã + NMS một ảnh và đưa bbox từ ảnh letterbox về toạ độ ảnh gốc."""
+        boxes, scores = decode_predictions(output, self.conf_threshold)
+        if len(boxes) == 0:
+            return np.empty((0, 4), dtype=np.int64)
+        boxes = boxes[nms(boxes, scores, self.iou_threshold)]
+
+        pad_x, pad_y = pad
+        boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+        boxes /= ratio
+        h, w = shape[:2]
+        np.clip(boxes, 0, [w, h, w, h], out=boxes)
+        return boxes.astype(np.int64)
+
+    def detect(self, img: np.ndarray, imgsz: int = None) -> np.ndarray:
+        """Phát hiện khuôn mặt và trả về bbox ``xyxy`` (N, 4) kiểu int64 trên toạ độ ảnh gốc.
+
+        Args:
+            imgsz (int): Cạnh dài đầu vào cho lần chạy này (mặc định ``self.imgsz``).
+        """
+        tensor, ratio, pad = letterbox(img, imgsz or self.imgsz)
+        output = self.session(tensor)
+        return self._postprocess(output, ratio, pad, img.shape)
+
+    def detect_batch(self, imgs: list, imgsz: int = None) -> list:
+        """Phát hiện trên nhiều ảnh trong một lần chạy mô hình.
+
+        Mọi ảnh được letterbox về cùng kích thước vuông ``imgsz`` để ghép batch.
+
+        Returns:
+            list: Mỗi phần tử là bbox ``xyxy`` (N_i, 4) int64 của ảnh tương ứng.
+        """
+        if len(imgs) == 1:
+            return [self.detect(imgs[0], imgsz)]
+        prepared = [letterbox(img, imgsz or self.imgsz, auto=False) for img in imgs]
+        outputs = self.session(np.concatenate([tensor for tensor, _, _ in prepared], axis=0))
+        return [
+            self._postprocess(outputs[i:i + 1], ratio, pad, img.shape)
+            for i, (img, (_, ratio, pad)) in enumerate(zip(imgs, prepared))
+        ]
@@ -0,0 +1,37 @@
+"""
+Bộ đếm/histogram nhẹ, thread-safe để theo dõi hiệu năng pipeline nhận diện.
+"""
+
+import bisect
+import threading
+
+
+class Histogram():
+    """Histogram với các mốc cố định (bucket cuối là ``+inf``).
+
+    Args:
+        bounds: Các mốc trên (tăng dần) của từng bucket.
+    """
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self._sum += value
+            self._total += 1
+
+    def snapshot(self) -> dict:
+        """Trả về dict gồm ``count``, ``mean`` và số mẫu theo từng bucket ``le_<mốc>``."""
+        with self._lock:
+            buckets = {f"le_{bound:g}": count for bound, count in zip(self.bounds, self._counts)}
+            buckets["le_inf"] = self._counts[-1]
+            return {
+                "count": self._total,
+                "mean": self._sum / self._total if self._total else 0.0,
+                "buckets": buckets,
+            }
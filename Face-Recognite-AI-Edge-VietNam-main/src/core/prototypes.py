@@ -0,0 +1,234 @@
+"""
+Tìm kiếm hai tầng trên gallery: index prototype theo danh tính + xếp hạng lại chính xác.
+
+Mỗi danh tính được tóm tắt bằng vài tâm cụm (k-means cầu trên các embedding của người đó).
+Truy vấn tìm trước trên index prototype (nhỏ, tỉ lệ với số người chứ không phải số ảnh;
+loại index theo cấu hình, xem ``src.core.ann``) để lấy ``candidates`` danh tính gần nhất,
+sau đó tính inner product chính xác với toàn bộ embedding của riêng các danh tính này.
+Kết quả trùng với tìm kiếm flat khi danh tính đúng nằm trong nhóm ứng viên.
+
+Embedding không được chép thêm: bước xếp hạng lại đọc (``reconstruct_batch``) đúng các dòng
+của ứng viên trong chính gallery flat (``IndexIDMap2`` trên Flat/SQ/PQ/OPQ), nên với gallery
+lượng tử hoá (``conf.vector_index_storage``) điểm được tính trên vector đã giải mã.
+
+Chạy ``python -m src.core.prototypes`` để so sánh với ``flat`` trên gallery tổng hợp.
+"""
+
+import zlib
+import numpy as np
+import faiss
+from src import config as conf
+from src.core.ann import build_index, get_ids, get_vectors, index_kind, remove_ids
+
+KMEANS_ITERATIONS = 10
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def cluster_prototypes(vectors: np.ndarray, k: int) -> np.ndarray:
+    """Tối đa ``k`` tâm cụm (đã chuẩn hoá) của các embedding một danh tính (k-means cầu).
+
+    Khởi tạo bằng farthest-point (xác định, không ngẫu nhiên) nên kết quả lặp lại được.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) <= k:
+        return _normalize(vectors.copy())
+    chosen = [0]
+    similarity = vectors @ vectors[0]
+    for _ in range(1, k):
+        chosen.append(int(np.argmin(similarity)))
+        similarity = np.maximum(similarity, vectors @ vectors[chosen[-1]])
+    centers = vectors[chosen].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(vectors @ centers.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            if len(members):
+                centers[c] = members.mean(axis=0)
+        centers = _normalize(centers)
+    return centers
+
+
+class PrototypeIndex():
+    """Index prototype (id = id danh tính) trỏ vào gallery flat chứa embedding gốc.
+
+    Args:
+        per_identity: Số prototype tối đa cho mỗi danh tính.
+        candidates: Số danh tính ứng viên được xếp hạng lại chính xác.
+        dim: Chiều embedding.
+        kind: Loại index prototype (``flat``/``hnsw``/``ivf``; ``ivf`` dùng ``flat`` khi chưa đủ prototype để huấn luyện).
+    """
+    def __init__(self, per_identity: int = conf.prototypes_per_identity, candidates: int = conf.two_stage_candidates,
+                 dim: int = conf.dim, kind: str = 'flat'):
+        self.per_identity = per_identity
+        self.candidates = candidates
+        self.dim = dim
+        self.kind = kind
+        self.gallery = None     # IndexIDMap2 flat chứa embedding (dùng chung với ``VectorBD.index``)
+        self.prototypes = {}    # id -> prototype (k, dim)
+        self.signatures = {}    # id -> crc32 embedding của danh tính, để dùng lại prototype khi dựng lại
+        self.index = self._new_index()
+        self._groups = None     # (thứ tự dòng theo id, id duy nhất, vị trí bắt đầu); None = cần tính lại
+
+    def _new_index(self, vectors: np.ndarray = None, ids: np.ndarray = None) -> faiss.Index:
+        kind = self.kind
+        if kind == 'ivf' and (vectors is None or len(vectors) < conf.ivf_min_train_size):
+            kind = 'flat'
+        return build_index(kind, vectors, ids, self.dim)
+
+    @classmethod
+    def build(cls, gallery: faiss.Index, previous: "PrototypeIndex" = None, **kwargs) -> "PrototypeIndex":
+        """Dựng từ gallery flat; dùng lại prototype của ``previous`` cho danh tính không đổi."""
+        self = cls(**kwargs)
+        self.gallery = gallery
+        vectors, ids = get_vectors(gallery)
+        if len(ids) == 0:
+            return self
+        order, unique_ids, starts = self._group(ids)
+        proto_vectors, proto_ids = [], []
+        for i, identity in enumerate(unique_ids.tolist()):
+            group = vectors[order[starts[i]:starts[i + 1]]]
+            self.signatures[identity] = zlib.crc32(group.tobytes())
+            if (previous is not None and previous.per_identity == self.per_identity
+                    and previous.signatures.get(identity) == self.signatures[identity]):
+                self.prototypes[identity] = previous.prototypes[identity]
+            else:
+                self.prototypes[identity] = cluster_prototypes(group, self.per_identity)
+            proto_vectors.append(self.prototypes[identity])
+            proto_ids.append(np.full(len(self.prototypes[identity]), identity, dtype=np.int64))
+        self.index = self._new_index(np.vstack(proto_vectors), np.concatenate(proto_ids))
+        self._groups = (order, unique_ids, starts)
+        return self
+
+    @staticmethod
+    def _group(ids: np.ndarray):
+        order = np.argsort(ids, kind='stable')
+        unique_ids, starts = np.unique(ids[order], return_index=True)
+        return order, unique_ids, np.append(starts, len(ids))
+
+    def bind(self, gallery: faiss.Index) -> None:
+        """Trỏ sang đối tượng gallery mới có cùng nội dung (ví dụ sau khi ghi snapshot)."""
+        if gallery is not self.gallery:
+            self.gallery = gallery
+            self._groups = None
+
+    def _rows(self, identities: np.ndarray):
+        """(dòng trong gallery, id danh tính của từng dòng) của các danh tính ``identities``."""
+        if self._groups is None:
+            self._groups = self._group(get_ids(self.gallery))
+        order, unique_ids, starts = self._groups
+        rows, owners = [], []
+        for identity in identities.tolist():
+            i = np.searchsorted(unique_ids, identity)
+            if i < len(unique_ids) and unique_ids[i] == identity:
+                rows.append(order[starts[i]:starts[i + 1]])
+                owners.append(np.full(starts[i + 1] - starts[i], identity, dtype=np.int64))
+        if not rows:
+            return np.empty((0,), dtype=np.int64), np.empty((0,), dtype=np.int64)
+        return np.concatenate(rows), np.concatenate(owners)
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        if not len(rows):
+            return np.empty((0, self.dim), dtype=np.float32)
+        return self.gallery.index.reconstruct_batch(rows)
+
+    def add(self, identity: int) -> None:
+        """Tính lại prototype của ``identity`` sau khi gallery vừa được thêm embedding cho nó."""
+        identity = int(identity)
+        self._groups = None  # nhóm lại lúc tìm kiếm tiếp theo (áp dụng nhiều bản ghi liền nhau chỉ nhóm một lần)
+        group = self._decode(np.flatnonzero(get_ids(self.gallery) == identity))
+        self.signatures[identity] = zlib.crc32(group.tobytes())
+        self._set_prototypes(identity, cluster_prototypes(group, self.per_identity))
+
+    def remove(self, identity: int) -> None:
+        """Bỏ ``identity`` sau khi gallery vừa xoá embedding của nó."""
+        identity = int(identity)
+        self._groups = None
+        self.signatures.pop(identity, None)
+        self._set_prototypes(identity, None)
+
+    def _set_prototypes(self, identity: int, prototypes) -> None:
+        if identity in self.prototypes:
+            self.index = remove_ids(self.index, [identity])
+            del self.prototypes[identity]
+        if prototypes is not None and len(prototypes):
+            self.prototypes[identity] = prototypes
+            self.index.add_with_ids(prototypes, np.full(len(prototypes), identity, dtype=np.int64))
+
+    @property
+    def ntotal(self) -> int:
+        return self.gallery.ntotal if self.gallery is not None else 0
+
+    @property
+    def pending(self) -> int:
+        """Số prototype nằm ngoài đồ thị HNSW (tombstone + segment RAM, xem ``src.core.ann.remove_ids``)."""
+        return getattr(self.index, 'pending', 0)
+
+    def compact(self) -> faiss.Index:
+        """Index prototype đã gộp segment RAM/bỏ tombstone (gán lại vào ``self.index`` khi giữ khoá).
+
+        Index ``ivf`` tạm dùng flat khi còn ít prototype được dựng lại thành IVF khi đã đủ vector huấn luyện.
+        """
+        if self.kind == 'ivf' and index_kind(self.index) != 'ivf' and self.index.ntotal >= conf.ivf_min_train_size:
+            return self._new_index(*get_vectors(self.index))
+        return self.index.materialize() if self.pending else self.index
+
+    def search(self, embeddings: np.ndarray):
+        """Lân cận gần nhất của mỗi truy vấn, cùng định dạng ``faiss`` với k=1: (dis (N, 1), ids (N, 1))."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        dis = np.full((len(embeddings), 1), -np.finfo(np.float32).max, dtype=np.float32)
+        ids = np.full((len(embeddings), 1), -1, dtype=np.int64)
+        if self.index.ntotal == 0:
+            return dis, ids
+        k = min(self.index.ntotal, self.candidates * self.per_identity)
+        _, proto_ids = self.index.search(embeddings, k)
+        # Các danh tính ứng viên của từng truy vấn theo thứ tự prototype gần nhất (bỏ trùng)
+        candidates = [list(dict.fromkeys(found[found >= 0].tolist()))[:self.candidates] for found in proto_ids]
+        union = np.unique(np.fromiter((c for row in candidates for c in row), dtype=np.int64))
+        rows, owners = self._rows(union)
+        if not len(rows):
+            return dis, ids
+        # Giải mã một lần các dòng của mọi ứng viên, mỗi truy vấn chỉ xét dòng của ứng viên của nó
+        scores = embeddings @ self._decode(rows).T
+        allowed = np.zeros((len(embeddings), len(union)), dtype=bool)
+        for row, found in enumerate(candidates):
+            allowed[row, np.searchsorted(union, found)] = True
+        scores[~allowed[:, np.searchsorted(union, owners)]] = -np.inf
+        best = np.argmax(scores, axis=1)
+        best_scores = scores[np.arange(len(embeddings)), best]
+        hit = np.isfinite(best_scores)
+        dis[hit, 0], ids[hit, 0] = best_scores[hit], owners[best[hit]]
+        return dis, ids
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from src.core.ann import _synthetic_gallery
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--identities", type=int, default=5000, help="Số danh tính của gallery tổng hợp")
+    parser.add_argument("--per-identity", type=int, default=30, help="Số embedding mỗi danh tính")
+    parser.add_argument("--noise", type=float, default=1.0, help="Độ phân tán embedding quanh tâm danh tính")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors, labels, queries = _synthetic_gallery(args.identities, args.per_identity, conf.dim, rng, args.noise)
+    flat = build_index('flat', vectors, labels)
+    start = time.perf_counter()
+    flat_dis, flat_ids = flat.search(queries, 1)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    two_stage = PrototypeIndex.build(flat)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    dis, ids = two_stage.search(queries)
+    two_stage_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    print(f"Gallery: {len(vectors)} vector, {args.identities} danh tính -> {two_stage.index.ntotal} prototype (dựng {build_s:.1f} s)")
+    print(f"flat      : {flat_ms:.3f} ms/truy vấn")
+    print(f"hai tầng  : {two_stage_ms:.3f} ms/truy vấn, trùng id với flat {np.mean(ids[:, 0] == flat_ids[:, 0]):.4f}, "
+          f"lệch điểm tối đa {np.abs(dis - flat_dis).max():.2e}")
@@ -0,0 +1,101 @@
+"""
+Lọc chất lượng khuôn mặt trước khi đưa vào batch embedding.
+
+Mặt quá nhỏ, mờ do chuyển động, quá tối/chói hoặc nghiêng gần như hoàn toàn
+(bbox quá hẹp) thường chỉ cho kết quả "Unknown" nhưng vẫn tốn một lượt embedding
+và một lượt tìm kiếm FAISS. Chỉ áp dụng trên luồng nhận diện (``Regconizer.recognize_many``/
+``identify``): các mặt này giữ bbox, được trả về "Unknown" mà không embedding. Phát hiện
+thuần (đăng ký khuôn mặt, tracker, bbox giao diện) không bị lọc.
+"""
+
+import threading
+import numpy as np
+import cv2
+from src import config as conf
+
+QUALITY_PATCH = 64  # cạnh ảnh xám thu nhỏ dùng để đo độ nét/độ sáng
+
+
+def score_faces(img: np.ndarray, boxes: np.ndarray) -> dict:
+    """Tính các chỉ số chất lượng cho từng bbox (vector hoá trên cả batch).
+
+    Args:
+        img (np.ndarray): Ảnh gốc (BGR).
+        boxes (np.ndarray): bbox ``xyxy`` (N, 4) hợp lệ.
+
+    Returns:
+        dict: mảng (N,) ``size`` (cạnh ngắn, px), ``aspect`` (rộng/cao),
+        ``sharpness`` (phương sai Laplacian) và ``brightness`` (độ sáng trung bình).
+    """
+    widths = (boxes[:, 2] - boxes[:, 0]).astype(np.float32)
+    heights = (boxes[:, 3] - boxes[:, 1]).astype(np.float32)
+
+    patches = np.empty((len(boxes), QUALITY_PATCH, QUALITY_PATCH), dtype=np.uint8)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        cv2.resize(gray[y1:y2, x1:x2], (QUALITY_PATCH, QUALITY_PATCH), dst=patches[i], interpolation=cv2.INTER_AREA)
+
+    p = patches.astype(np.float32)
+    # Laplacian 4 lân cận trên phần trong của mỗi patch, tính cho cả batch một lần
+    lap = 4 * p[:, 1:-1, 1:-1] - p[:, :-2, 1:-1] - p[:, 2:, 1:-1] - p[:, 1:-1, :-2] - p[:, 1:-1, 2:]
+    return {
+        "size": np.minimum(widths, heights),
+        "aspect": widths / np.maximum(heights, 1),
+        "sharpness": lap.var(axis=(1, 2)),
+        "brightness": p.mean(axis=(1, 2)),
+    }
+
+
+class QualityGate():
+    """Loại bbox chất lượng kém theo ngưỡng cấu hình và đếm số mặt bị bỏ theo lý do."""
+    REASONS = ("size", "aspect", "sharpness", "brightness")
+
+    def __init__(self, enabled: bool = conf.quality_gate_enabled, min_face_px: float = conf.quality_min_face_px,
+                 min_sharpness: float = conf.quality_min_sharpness, brightness_range=conf.quality_brightness_range,
+                 aspect_range=conf.quality_aspect_range):
+        self.enabled = enabled
+        self.min_face_px = min_face_px
+        self.min_sharpness = min_sharpness
+        self.brightness_range = brightness_range
+        self.aspect_range = aspect_range
+        self.checked = 0
+        self.skipped = dict.fromkeys(self.REASONS, 0)
+        self._lock = threading.Lock()
+
+    def filter(self, img: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+        """Trả về các bbox đạt chất lượng (giữ nguyên thứ tự)."""
+        return boxes[self.mask(img, boxes)]
+
+    def mask(self, img: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+        """Mặt nạ bool (N,) các bbox đạt chất lượng."""
+        if not self.enabled or len(boxes) == 0:
+            return np.ones(len(boxes), dtype=bool)
+        scores = score_faces(img, boxes)
+        failures = {
+            "size": scores["size"] < self.min_face_px,
+            "aspect": (scores["aspect"] < self.aspect_range[0]) | (scores["aspect"] > self.aspect_range[1]),
+            "sharpness": scores["sharpness"] < self.min_sharpness,
+            "brightness": (scores["brightness"] < self.brightness_range[0]) | (scores["brightness"] > self.brightness_range[1]),
+        }
+        keep = np.ones(len(boxes), dtype=bool)
+        skipped = {}
+        for reason in self.REASONS:
+            # Mỗi mặt chỉ được tính cho lý do đầu tiên khiến nó bị loại
+            skipped[reason] = int((failures[reason] & keep).sum())
+            keep &= ~failures[reason]
+        with self._lock:
+            for reason, count in skipped.items():
+                self.skipped[reason] += count
+            self.checked += len(boxes)
+        return keep
+
+    def stats(self) -> dict:
+        with self._lock:
+            checked, by_reason = self.checked, dict(self.skipped)
+        skipped = sum(by_reason.values())
+        return {
+            "checked": checked,
+            "skipped": skipped,
+            "skipped_by_reason": by_reason,
+            "skip_ratio": skipped / checked if checked else 0.0,
+        }
@@ -1,31 +1,78 @@
-from keras.models import load_model
+import time
+from dataclasses import dataclass, field
 import numpy as np
 from src.core.detection import FaceDetectYolo
-from src.utils import draw_box_text
-from src.core.vectordb import VectorBD
+from src.core.quality import QualityGate
+from src.utils import OverlayRenderer
+from src.core import registry
+from src.core.tracker import FaceTracker
 from src import config as conf
-# from tensorflow.lite.python.interpreter import Interpreter
+
+# Khoảng cách gán cho mặt không được tìm kiếm (bị quality gate loại): luôn lớn hơn ``conf.threshold_distance``
+UNKNOWN_DISTANCE = np.finfo(np.float32).max
+
+
+@dataclass(slots=True)
+class RecognitionResult():
+    """Kết quả nhận diện của một frame (bất biến theo quy ước, không chia sẻ buffer).
+
+    Attributes:
+        boxes: bbox ``xyxy`` (N, 4) trên toạ độ ảnh gốc.
+        scores: Khoảng cách tới lân cận gần nhất trong gallery (N,).
+        ids: Face ID của lân cận gần nhất (N,).
+        names: Tên tương ứng với ``ids``.
+        timings: Thời gian từng bước (ms): ``detect_ms``, ``embed_ms``, ``search_ms``, ``total_ms``.
+        detect_imgsz: imgsz detector đã dùng cho frame.
+    """
+    boxes: np.ndarray
+    scores: np.ndarray
+    ids: np.ndarray
+    names: list
+    timings: dict = field(default_factory=dict)
+    detect_imgsz: int = None
+
+    @property
+    def recognized(self) -> np.ndarray:
+        """Mặt nạ bool các mặt có khoảng cách trong ngưỡng ``conf.threshold_distance``."""
+        return self.scores <= conf.threshold_distance
+
+    def to_dict(self) -> dict:
+        """Định dạng dict cũ (``Distances``/``Names``/``IDs`` dạng (N, 1)) của ``regcognize_face``."""
+        return {
+            "Distances": self.scores.reshape(-1, 1),
+            "Names": [[name] for name in self.names],
+            "IDs": self.ids.reshape(-1, 1),
+            "Boxes": self.boxes,
+            "DetectImgsz": self.detect_imgsz,
+            "DetectMs": self.timings.get("detect_ms"),
+        }
+
 
 class Regconizer():
     """Bao bọc pipeline nhận diện: detect → embed → search.
 
+    Mô hình và FAISS index được lấy từ ``src.core.registry`` nên tạo thêm đối tượng
+    không tải lại gì từ đĩa. ``recognize``/``recognize_many`` không ghi kết quả lên ``self``
+    nên một đối tượng dùng chung được cho nhiều luồng; các hàm còn lại (``get_face_embedding``,
+    ``regcognize_face``, ``track_faces``) giữ trạng thái hiển thị cho giao diện một luồng.
+
     Args:
-        model_path: Đường dẫn mô hình TFLite nhận diện khuôn mặt.
+        embedding_backend: Tên backend embedding (xem ``src.core.embedding``). Mặc định theo cấu hình.
+        headless: True khi chỉ cần boxes/embeddings/kết quả (server), bỏ qua mọi bước vẽ.
     """
-    def __init__(self, model_path: str = conf.path_model_face_recognition):
-        self.model = load_model(model_path, compile=False, safe_mode=False)
+    def __init__(self, embedding_backend: str = None, headless: bool = False):
+        self.embedding_backend, self.embedder = registry.get_embedding_backend(embedding_backend)
+        self.headless = headless
         self.img_face = None
         self.img_with_bbs = None
-        self.vt_db = VectorBD()
-        self.detector_face = FaceDetectYolo()
+        self.vt_db = registry.get_vector_db(local=True)
+        self.detector_face = FaceDetectYolo(headless=headless)
+        self.quality_gate = QualityGate()  # mặt kém chất lượng không embedding, trả về "Unknown"
+        self.overlay = None if headless else OverlayRenderer()
         # self.detector_face = FaceDetect()
         self.bbs = []
-        
-        # self.interpreter = Interpreter(model_path= model_path)
-        # self.interpreter.allocate_tensors()
-
-        # self.input_details = self.interpreter.get_input_details()
-        # self.output_details = self.interpreter.get_output_details()
+        self.embedded_faces = 0           # số mặt đã chạy embedding trong track_faces
+        self.reused_faces = 0             # số mặt dùng lại danh tính của track
 
     def get_face_embedding(self, img: np.ndarray) -> np.ndarray:
         """Suy luận embedding cho các khuôn mặt trong ảnh.
@@ -39,36 +86,144 @@ class Regconizer():
         # Set ảnh đầu vào 
         self.detector_face.set_img_input(img)
         
-        # Lấy faces ảnh khuôn mặt (N, H, W, C)
+        # Lấy faces ảnh khuôn mặt (N, H, W, C) - view float32 trên buffer của detector, không copy
         faces = self.detector_face.cropped_faces
         self.bbs = self.detector_face.bbs_face # Lưu bounding box
         
         if faces is None or len(faces) == 0:
             return np.array([])
 
-        # Model predict -> (N, D) nếu nhiều ảnh, hoặc (D,) nếu 1 ảnh
-        embeds = self.model.predict(faces, verbose=False)
-
-        # if faces.dtype != self.input_details[0]['dtype']:
-        #     faces = faces.astype(self.input_details[0]['dtype'])
-
-        # # Set tensor & chạy infer
-        # self.interpreter.resize_tensor_input(self.input_details[0]['index'], faces.shape)
-        # self.interpreter.allocate_tensors()
-        # self.interpreter.set_tensor(self.input_details[0]['index'], faces)
-        # self.interpreter.invoke()
+        return self.embed_faces(faces)
 
-        # # Lấy output (đầu vào dạng batch)
-        # embeds = self.interpreter.get_tensor(self.output_details[0]['index'])  # (faces_size, 128)
+    def embed_faces(self, faces: np.ndarray) -> np.ndarray:
+        """Suy luận embedding cho batch khuôn mặt đã tiền xử lý (N, H, W, C), chuẩn hoá L2."""
+        # Suy luận embedding -> (N, D)
+        embeds = self.embedder(faces)
 
         # Chuẩn hóa L2 theo từng vector
         norms = np.linalg.norm(embeds, axis=1, keepdims=True)
         embeds = embeds / norms
 
-        return embeds  
+        return embeds
+
+    def recognize_many(self, imgs: list, sources: list = None) -> list:
+        """Nhận diện nhiều ảnh cùng lúc: detect, embed và search đều chạy một batch chung.
+
+        Không đọc/ghi kết quả trên ``self`` và không vẽ nhãn, an toàn khi gọi từ thread pool.
+
+        Args:
+            imgs (list): Danh sách ảnh BGR.
+            sources (list): Nguồn của từng ảnh (ví dụ id quầy POS) để detector chọn imgsz theo
+                lịch sử riêng của nguồn đó (xem ``InputSizeSelector``); None = nguồn mặc định.
+
+        Returns:
+            list: ``RecognitionResult`` theo thứ tự ảnh đầu vào (``timings`` là của cả batch).
+        """
+        start = time.perf_counter()
+        boxes_list, imgsz, detect_ms = self.detector_face.detect_faces(imgs, sources)
+        counts = [len(boxes) for boxes in boxes_list]
+        distances, ids, names, timings = self._search_faces(imgs, boxes_list)
+        timings = {"detect_ms": detect_ms, **timings, "total_ms": (time.perf_counter() - start) * 1000}
+
+        results = []
+        offset = 0
+        for boxes, count in zip(boxes_list, counts):
+            end = offset + count
+            results.append(RecognitionResult(
+                boxes=boxes,
+                scores=distances[offset:end],
+                ids=ids[offset:end],
+                names=names[offset:end],
+                timings=dict(timings),
+                detect_imgsz=imgsz,
+            ))
+            offset = end
+        return results
+
+    def recognize(self, img: np.ndarray, source=None) -> RecognitionResult:
+        """Nhận diện một frame (thread-safe, xem ``recognize_many``)."""
+        return self.recognize_many([img], [source])[0]
+
+    def detect(self, img: np.ndarray):
+        """Chỉ phát hiện khuôn mặt (thread-safe).
+
+        Returns:
+            tuple: (bbox ``xyxy`` (N, 4), imgsz đã dùng, thời gian phát hiện (ms)).
+        """
+        boxes_list, imgsz, detect_ms = self.detector_face.detect_faces([img])
+        return boxes_list[0], imgsz, detect_ms
+
+    def identify(self, img: np.ndarray, boxes: np.ndarray) -> RecognitionResult:
+        """Embed + search cho các bbox đã biết trên ảnh (thread-safe, không chạy detector)."""
+        distances, ids, names, timings = self._search_faces([img], [boxes])
+        return RecognitionResult(boxes, distances, ids, names, timings)
+
+    def _search_faces(self, imgs: list, boxes_list: list):
+        """Embed + search các bbox đạt ``self.quality_gate``; mặt bị loại nhận kết quả "Unknown" (id -1).
+
+        Returns:
+            tuple: (distances (N,), ids (N,), names, timings ``embed_ms``/``search_ms``) theo thứ tự ảnh rồi bbox.
+        """
+        keep = np.concatenate([self.quality_gate.mask(img, boxes) for img, boxes in zip(imgs, boxes_list)] or [np.empty((0,), dtype=bool)])
+        distances = np.full(len(keep), UNKNOWN_DISTANCE, dtype=np.float32)
+        ids = np.full(len(keep), -1, dtype=np.int64)
+        names = ["Unknown"] * len(keep)
+        timings = {"embed_ms": 0.0, "search_ms": 0.0}
+        if not keep.any():
+            return distances, ids, names, timings
+        offsets = np.cumsum([0] + [len(boxes) for boxes in boxes_list])
+        kept = [boxes[keep[offsets[i]:offsets[i + 1]]] for i, boxes in enumerate(boxes_list)]
+        faces = self.detector_face.crop_faces(imgs, kept)
+        embed_start = time.perf_counter()
+        embeddings = self.embed_faces(faces)
+        search_start = time.perf_counter()
+        found_distances, found_names, found_ids = self.vt_db.search_emb(embeddings)
+        timings = {
+            "embed_ms": (search_start - embed_start) * 1000,
+            "search_ms": (time.perf_counter() - search_start) * 1000,
+        }
+        distances[keep], ids[keep] = found_distances[:, 0], found_ids[:, 0]
+        for i, name in zip(np.flatnonzero(keep), found_names):
+            names[i] = name[0]
+        return distances, ids, names, timings
+
+    def embed(self, img: np.ndarray):
+        """Phát hiện + embedding, không tìm kiếm (thread-safe).
+
+        Returns:
+            tuple: (bbox ``xyxy`` (N, 4), embedding đã chuẩn hoá L2 (N, D)).
+        """
+        boxes = self.detect(img)[0]
+        if len(boxes) == 0:
+            return boxes, np.array([])
+        return boxes, self.embed_faces(self.detector_face.crop_faces([img], [boxes]))
+
+    def reload_gallery(self) -> bool:
+        """Nạp lại FAISS index + map id ↔ tên từ đĩa (mô hình giữ nguyên)."""
+        return self.vt_db.reload()
+
+    def stats(self) -> dict:
+        """Thông tin backend và số liệu gần nhất của pipeline."""
+        return {
+            "detection_backend": self.detector_face.backend,
+            "embedding_backend": self.embedding_backend,
+            "detection_imgsz": self.detector_face.last_imgsz,
+            "detection_ms": self.detector_face.last_detect_ms,
+            "quality_gate": self.quality_gate.stats(),
+            "loaded_models": registry.loaded(),
+            "gallery_size": self.vt_db.index.ntotal,
+            "gallery_index": self.vt_db.index_kind,
+            "gallery_storage": self.vt_db.index_storage,
+            "gallery_two_stage": self.vt_db.prototypes is not None,
+        }
+
+    def recognize_batch(self, imgs: list) -> list:
+        """Như ``recognize_many`` nhưng trả về dict định dạng cũ (xem ``RecognitionResult.to_dict``)."""
+        return [result.to_dict() for result in self.recognize_many(imgs)]
 
     def regcognize_face(self, img: np.ndarray) -> dict:
-        """Nhận diện các khuôn mặt, trả về kết quả tìm kiếm và ảnh có vẽ nhãn.
+        """Nhận diện các khuôn mặt, trả về kết quả tìm kiếm; ảnh vẽ nhãn (bản copy, ``img`` giữ nguyên)
+        được lưu ở ``self.img_with_bbs`` (bỏ qua khi headless).
 
         Args:
             img (np.ndarray): Ảnh đầu vào (BGR - OpenCV).
@@ -76,31 +231,60 @@ class Regconizer():
         Returns:
             dict: Bao gồm khoảng cách, tên, ids 
         """
-        embeddings = self.get_face_embedding(img)
-        self.img_with_bbs = img
-        
-        if embeddings is None or len(embeddings) == 0:
-            return {
-                "Distances": [],
-                "Names": [],
-                "IDs": [],
-            }
-        
-        # Tìm kiếm cho embeddings
-        distances, names, ids = self.vt_db.search_emb(embeddings)
-        
-        for dist, name, bb, id in zip(distances, names, self.bbs, ids):
-            # Chọn nhãn cho bbs
+        result = self.recognize(img).to_dict()
+        self.bbs = result["Boxes"]
+        self.img_with_bbs = None
+        if not self.headless:
+            self.img_with_bbs = self._draw_results(img, self.bbs, result["Distances"], result["Names"], result["IDs"])
+        return result
+
+    def _draw_results(self, img: np.ndarray, boxes, distances, names, ids) -> np.ndarray:
+        """Vẽ tất cả bbs và nhãn lên một bản copy của ảnh trong một lượt (không sửa ``img``)."""
+        labels, suffixes = [], []
+        for dist, name, id in zip(distances, names, ids):
+            # Chọn nhãn cho bbs: phần danh tính được cache, khoảng cách vẽ riêng
             if dist[0] <= conf.threshold_distance:
-                text = f"{id[0]} - {name[0]} ({dist[0]:.2f})"
+                labels.append(f"{id[0]} - {name[0]}")
+                suffixes.append(f"({dist[0]:.2f})")
             else:
-                text = "Unknown"
+                labels.append("Unknown")
+                suffixes.append("")
+        return self.overlay.render(img.copy(), boxes, labels, suffixes)
 
-            # Vẽ bbs và nhãn lên màn
-            self.img_with_bbs = draw_box_text(self.img_with_bbs, bb, text)
-        
+    def track_faces(self, img: np.ndarray, tracker: FaceTracker) -> dict:
+        """Nhận diện có theo dõi: chỉ embed + search các track cần (mới/chưa chắc chắn/tới hạn xác minh).
+
+        Các track khác dùng lại danh tính đã gắn từ frame trước.
+
+        Args:
+            img (np.ndarray): Ảnh đầu vào (BGR - OpenCV).
+            tracker (FaceTracker): Tracker của luồng video đang xử lý.
+
+        Returns:
+            dict: Như ``regcognize_face`` kèm ``"TrackIDs"``, ``"DetectImgsz"`` và ``"DetectMs"``.
+        """
+        boxes, imgsz, detect_ms = self.detect(img)
+        self.bbs = boxes
+        tracks = tracker.update(boxes)
+
+        pending = [i for i, track in enumerate(tracks) if tracker.needs_embedding(track)]
+        if pending:
+            result = self.identify(img, boxes[pending])
+            for i, dist, name, id in zip(pending, result.scores, result.names, result.ids):
+                tracker.assign(tracks[i], dist, name, id)
+        self.embedded_faces += len(pending)
+        self.reused_faces += len(tracks) - len(pending)
+
+        distances = np.array([[track.identity[0]] for track in tracks], dtype=np.float32).reshape(-1, 1)
+        names = [[track.identity[1]] for track in tracks]
+        ids = np.array([[track.identity[2]] for track in tracks], dtype=np.int64).reshape(-1, 1)
+
+        self.img_with_bbs = None if self.headless else self._draw_results(img, boxes, distances, names, ids)
         return {
             "Distances": distances,
-            "Names": names, 
-            "IDs": ids
+            "Names": names,
+            "IDs": ids,
+            "TrackIDs": [track.track_id for track in tracks],
+            "DetectImgsz": imgsz,
+            "DetectMs": detect_ms,
         }
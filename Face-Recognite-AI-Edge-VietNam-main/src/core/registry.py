@@ -0,0 +1,133 @@
+"""
+Registry mô hình dùng chung trong toàn tiến trình.
+
+Detector, mô hình embedding và FAISS index chỉ được tải một lần (lazy, lần đầu được
+yêu cầu), chạy warm-up bằng batch giả để frame thật đầu tiên không phải chịu chi phí
+khởi tạo, rồi được chia sẻ cho mọi nơi tạo ``Regconizer`` (Flask app, processor,
+giao diện Tkinter, legacy scripts).
+"""
+
+import threading
+import numpy as np
+from src import config as conf
+
+WARMUP_FACE_SHAPE = (160, 160, 3)  # kích thước crop khuôn mặt đưa vào Facenet
+
+_lock = threading.RLock()
+_models = {}
+
+
+def _get_or_load(key, loader):
+    """Trả về đối tượng đã cache theo ``key``; tải bằng ``loader`` (một lần, có khoá) nếu chưa có."""
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = loader()
+                _models[key] = model
+    return model
+
+
+def _warm_up_detector(detector) -> None:
+    """Chạy detector trên ảnh đen với mọi imgsz có thể được chọn."""
+    sizes = conf.detection_imgsz_candidates if conf.detection_imgsz_mode == 'adaptive' else (conf.detection_imgsz,)
+    for imgsz in sizes:
+        detector.detect(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz)
+
+
+def _warm_up_embedder(embedder) -> None:
+    """Chạy embedder với batch rỗng cho từng bucket kích thước batch."""
+    for batch_size in conf.embedding_batch_buckets:
+        embedder(np.zeros((batch_size,) + WARMUP_FACE_SHAPE, dtype=np.float32))
+
+
+def get_detection_backend(backend: str = None):
+    """(tên backend, detector) dùng chung cho cả tiến trình."""
+    def loader():
+        from src.core.detection import load_detection_backend
+        name, detector = load_detection_backend(backend)
+        if conf.registry_warmup:
+            _warm_up_detector(detector)
+        return name, detector
+    return _get_or_load(("detection", backend or conf.detection_backend), loader)
+
+
+def get_embedding_backend(backend: str = None):
+    """(tên backend, embedder) dùng chung cho cả tiến trình."""
+    def loader():
+        from src.core.embedding import load_embedding_backend
+        name, embedder = load_embedding_backend(backend)
+        if conf.registry_warmup:
+            _warm_up_embedder(embedder)
+        return name, embedder
+    return _get_or_load(("embedding", backend or conf.embedding_backend), loader)
+
+
+def get_vector_db(local: bool = False):
+    """``VectorBD`` dùng chung (index FAISS + map id ↔ tên).
+
+    Khi daemon suy luận đang chạy (xem ``use_daemon``) trả về ``RemoteVectorDB``: gallery chỉ
+    nằm trong daemon, mọi thao tác thêm/xoá đi qua daemon. ``local=True`` luôn nạp gallery tại
+    chỗ (``Regconizer`` chạy suy luận trong tiến trình này, kể cả chính daemon).
+    """
+    if not local and use_daemon():
+        def remote_loader():
+            from src.daemon.client import RemoteVectorDB
+            return RemoteVectorDB()
+        return _get_or_load("remote_vector_db", remote_loader)
+
+    def loader():
+        from src.core.vectordb import VectorBD
+        return VectorBD()
+    return _get_or_load("vector_db", loader)
+
+
+def reload_vector_db():
+    """Đọc lại FAISS index và map id ↔ tên từ đĩa ngay (thay thế nguyên tử trong ``VectorBD`` dùng chung)."""
+    vector_db = get_vector_db()
+    vector_db.reload()
+    return vector_db
+
+
+def use_daemon() -> bool:
+    """True nếu suy luận nên đi qua daemon (``conf.inference_mode``)."""
+    if conf.inference_mode == 'local':
+        return False
+    if conf.inference_mode == 'daemon':
+        return True
+    from src.daemon.client import daemon_available
+    return daemon_available()
+
+
+def get_recognizer(headless: bool = False, embedding_backend: str = None):
+    """Tạo ``Regconizer`` mới trên các mô hình dùng chung.
+
+    Mỗi lời gọi trả về một đối tượng riêng (buffer crop, trạng thái hiển thị, bộ chọn
+    imgsz riêng cho từng luồng xử lý) nhưng không tải lại mô hình nào từ đĩa. Khi daemon
+    suy luận đang chạy (xem ``use_daemon``), trả về ``RemoteRegconizer`` và tiến trình này
+    không nạp mô hình nào.
+    """
+    if use_daemon():
+        from src.daemon.client import RemoteRegconizer
+        return RemoteRegconizer(headless=headless)
+    from src.core.recognition import Regconizer
+    return Regconizer(embedding_backend=embedding_backend, headless=headless)
+
+
+def warm_up() -> None:
+    """Tải trước (và warm-up) toàn bộ mô hình mặc định, ví dụ trong luồng nền lúc khởi động.
+
+    Bỏ qua khi dùng daemon suy luận (mô hình nằm trong tiến trình daemon).
+    """
+    if use_daemon():
+        return
+    get_detection_backend()
+    get_embedding_backend()
+    get_vector_db(local=True)
+
+
+def loaded() -> list:
+    """Danh sách khoá các mô hình đã được tải."""
+    with _lock:
+        return [str(key) for key in _models]
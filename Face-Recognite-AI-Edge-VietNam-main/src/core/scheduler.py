@@ -0,0 +1,120 @@
+"""
+Bộ lập lịch micro-batching đặt trước ``Regconizer``.
+
+Các request đồng thời (nhiều quầy POS) gửi frame vào hàng đợi chung; mỗi luồng
+worker gom các frame đến trong một cửa sổ thời gian ngắn (hoặc đủ ``max_batch``),
+chạy detect + embed + search một lần cho cả batch rồi trả kết quả về từng request.
+``Regconizer.recognize_many`` không giữ trạng thái nên có thể chạy nhiều worker song song.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from src import config as conf
+from src.core.metrics import Histogram
+
+
+class InferenceScheduler():
+    """Gom frame từ nhiều request thành batch cho ``Regconizer.recognize_many``.
+
+    Args:
+        recognizer: Đối tượng ``Regconizer`` (có thể thay bằng ``set_recognizer``).
+        max_batch: Số frame tối đa trong một batch.
+        max_wait_ms: Thời gian tối đa chờ gom thêm frame sau frame đầu tiên.
+        workers: Số luồng worker chạy batch song song.
+    """
+    def __init__(self, recognizer, max_batch: int = conf.scheduler_max_batch, max_wait_ms: float = conf.scheduler_max_wait_ms,
+                 workers: int = conf.scheduler_workers):
+        self.recognizer = recognizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._submit_lock = threading.Lock()  # kiểm tra ``_stopped`` + đưa vào hàng đợi là một bước với ``close``
+        self.batch_sizes = Histogram(range(1, max_batch + 1))
+        self.latency_ms = Histogram([5, 10, 25, 50, 100, 250, 500, 1000, 2500])
+        self.queue_wait_ms = Histogram([1, 2, 5, 10, 25, 50, 100])
+        self._workers = [
+            threading.Thread(target=self._run, name=f"inference-scheduler-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def set_recognizer(self, recognizer) -> None:
+        """Thay recognizer; batch kế tiếp sẽ dùng đối tượng mới."""
+        self.recognizer = recognizer
+
+    def submit(self, frame: np.ndarray, source=None) -> Future:
+        """Đưa một frame (của nguồn ``source``, ví dụ id quầy) vào hàng đợi, trả về ``Future`` chứa ``RecognitionResult``."""
+        future = Future()
+        with self._submit_lock:
+            if self._stopped.is_set():
+                future.set_exception(RuntimeError("Bộ lập lịch suy luận đã dừng"))
+            else:
+                self._queue.put((frame, future, time.perf_counter(), source))
+        return future
+
+    def recognize(self, frame: np.ndarray, source=None, timeout: float = None):
+        """Gửi frame và chờ kết quả (``RecognitionResult``, như ``Regconizer.recognize``)."""
+        return self.submit(frame, source).result(timeout)
+
+    def _collect(self) -> list:
+        """Chờ frame đầu tiên, sau đó gom thêm đến khi đủ batch hoặc hết cửa sổ chờ."""
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return [item for item in items if item is not None]
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            items = self._collect()
+            if not items:
+                continue
+            started = time.perf_counter()
+            for _, _, submitted, _ in items:
+                self.queue_wait_ms.observe((started - submitted) * 1000)
+            self.batch_sizes.observe(len(items))
+            try:
+                results = self.recognizer.recognize_many([item[0] for item in items], [item[3] for item in items])
+            except Exception as exc:
+                for _, future, _, _ in items:
+                    future.set_exception(exc)
+                continue
+            finished = time.perf_counter()
+            for (_, future, submitted, _), result in zip(items, results):
+                self.latency_ms.observe((finished - submitted) * 1000)
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Thống kê kích thước batch, độ trễ request và thời gian chờ trong hàng đợi."""
+        return {
+            "pending": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "latency_ms": self.latency_ms.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+    def close(self) -> None:
+        """Dừng các worker; frame còn trong hàng đợi không được xử lý mà ``Future`` của chúng nhận ``RuntimeError``."""
+        with self._submit_lock:
+            self._stopped.set()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("Bộ lập lịch suy luận đã dừng"))
+        for _ in self._workers:
+            self._queue.put(None)
@@ -0,0 +1,79 @@
+"""
+Kênh streaming frame từ quầy POS.
+
+Trình duyệt đẩy frame liên tục qua WebSocket; mỗi kết nối chỉ giữ frame mới nhất
+trong ``LatestFrameSlot``. Khi nhận diện chậm hơn tốc độ gửi, các frame chưa kịp xử lý
+bị ghi đè (bỏ) thay vì xếp hàng, nên kết quả trả về luôn ứng với khung hình gần nhất.
+"""
+
+import threading
+
+
+class LatestFrameSlot():
+    """Ô chứa một frame: ``put`` ghi đè frame chưa xử lý, ``take`` chờ và lấy frame mới nhất."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+
+    def put(self, item) -> None:
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self.received += 1
+            self._cond.notify()
+
+    def take(self, timeout: float = None):
+        """Frame mới nhất, hoặc None khi slot đã đóng (hết frame) hoặc hết ``timeout``."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item, self._item = self._item, None
+            if item is not None:
+                self.processed += 1
+            return item
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"received": self.received, "processed": self.processed, "dropped": self.dropped}
+
+
+class StreamStats():
+    """Thống kê cộng dồn của mọi kết nối streaming trong tiến trình."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = set()
+        self._finished = {"received": 0, "processed": 0, "dropped": 0}
+
+    def opened(self, slot: LatestFrameSlot) -> None:
+        with self._lock:
+            self._active.add(slot)
+
+    def closed(self, slot: LatestFrameSlot) -> None:
+        with self._lock:
+            self._active.discard(slot)
+            for key, value in slot.stats().items():
+                self._finished[key] += value
+
+    def stats(self) -> dict:
+        with self._lock:
+            totals = dict(self._finished)
+            active = list(self._active)
+        for slot in active:
+            for key, value in slot.stats().items():
+                totals[key] += value
+        totals["active"] = len(active)
+        totals["drop_ratio"] = totals["dropped"] / totals["received"] if totals["received"] else 0.0
+        return totals
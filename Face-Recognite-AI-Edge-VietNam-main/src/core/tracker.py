@@ -0,0 +1,124 @@
+"""
+Theo dõi khuôn mặt qua các frame (IoU + mô hình vận tốc không đổi kiểu alpha-beta).
+
+Mỗi track mang danh tính đã nhận diện; ``Regconizer.track_faces`` chỉ chạy
+embedding + tìm kiếm FAISS cho track mới, track chưa nhận ra (thử lại định kỳ)
+hoặc track tới hạn xác minh lại, còn lại dùng danh tính đã lưu.
+"""
+
+import numpy as np
+from src import config as conf
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU giữa từng cặp box ``xyxy`` của hai tập, shape (len(a), len(b))."""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / (area_a + area_b - inter + 1e-9)
+
+
+class Track():
+    """Một khuôn mặt được theo dõi qua nhiều frame."""
+    __slots__ = ("track_id", "box", "velocity", "hits", "misses", "frames_since_verify", "identity")
+
+    def __init__(self, track_id: int, box: np.ndarray):
+        self.track_id = track_id
+        self.box = box.astype(np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.hits = 1
+        self.misses = 0
+        self.frames_since_verify = 0
+        self.identity = None  # (distance, name, face_id) của lần nhận diện gần nhất
+
+    @property
+    def is_recognized(self) -> bool:
+        return self.identity is not None and self.identity[0] <= conf.threshold_distance
+
+    def predict(self) -> np.ndarray:
+        """Vị trí dự đoán ở frame kế tiếp theo vận tốc hiện tại."""
+        return self.box + self.velocity
+
+    def correct(self, box: np.ndarray, alpha: float) -> None:
+        """Cập nhật vị trí/vận tốc theo quan sát mới (làm mượt kiểu alpha-beta)."""
+        box = box.astype(np.float32)
+        self.velocity = alpha * (box - self.box) + (1.0 - alpha) * self.velocity
+        self.box = box
+        self.hits += 1
+        self.misses = 0
+
+
+class FaceTracker():
+    """Ghép bbox của frame hiện tại với các track đang có bằng IoU (greedy theo IoU lớn nhất).
+
+    Args:
+        iou_threshold: IoU tối thiểu để coi là cùng một khuôn mặt.
+        max_misses: Số frame liên tiếp không thấy trước khi xoá track.
+        reverify_every: Chu kỳ (frame) xác minh lại danh tính của track đã nhận ra.
+        unknown_retry_every: Chu kỳ (frame) thử nhận diện lại track chưa nhận ra.
+    """
+    def __init__(self, iou_threshold: float = conf.tracker_iou_threshold, max_misses: int = conf.tracker_max_misses,
+                 reverify_every: int = conf.tracker_reverify_every, unknown_retry_every: int = conf.tracker_unknown_retry_every,
+                 velocity_alpha: float = 0.5):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reverify_every = reverify_every
+        self.unknown_retry_every = unknown_retry_every
+        self.velocity_alpha = velocity_alpha
+        self.tracks = []
+        self._next_id = 1
+
+    def update(self, boxes: np.ndarray) -> list:
+        """Cập nhật tracker với bbox của frame mới.
+
+        Returns:
+            list: ``Track`` tương ứng với từng bbox đầu vào (cùng thứ tự).
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        assigned = [None] * len(boxes)
+        unmatched_tracks = set(range(len(self.tracks)))
+
+        if self.tracks and len(boxes):
+            predicted = np.stack([track.predict() for track in self.tracks])
+            ious = iou_matrix(predicted, boxes)
+            # Greedy: lần lượt lấy cặp (track, box) có IoU lớn nhất còn lại
+            for flat in np.argsort(ious, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if t in unmatched_tracks and assigned[d] is None:
+                    self.tracks[t].correct(boxes[d], self.velocity_alpha)
+                    assigned[d] = self.tracks[t]
+                    unmatched_tracks.discard(t)
+
+        for t in unmatched_tracks:
+            self.tracks[t].misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for d, track in enumerate(assigned):
+            if track is None:
+                track = Track(self._next_id, boxes[d])
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[d] = track
+            else:
+                track.frames_since_verify += 1
+        return assigned
+
+    def needs_embedding(self, track: Track) -> bool:
+        """Track cần chạy embedding: mới, tới hạn xác minh lại, hoặc chưa nhận ra và tới lượt thử lại."""
+        if track.identity is None:
+            return True
+        if track.is_recognized:
+            return track.frames_since_verify >= self.reverify_every
+        return track.frames_since_verify >= self.unknown_retry_every
+
+    @staticmethod
+    def assign(track: Track, distance: float, name: str, face_id: int) -> None:
+        """Gắn kết quả nhận diện mới cho track."""
+        track.identity = (float(distance), name, int(face_id))
+        track.frames_since_verify = 0
@@ -2,12 +2,19 @@ import numpy as np
 import faiss
 import os
 import shutil
+import threading
+import time
 from src import config as conf
-from src.utils import init_id_name, init_vt_db, delete_id_name, check_is_id_exist, add_id_name
+from src.core.ann import SegmentedIndex, build_index, configure_index, get_vectors, index_kind, index_storage, open_mapped, storage_min_train_size, target_kind, target_storage
+from src.core.deltalog import DeltaLog, DeltaLogCorrupted, OP_ADD, OP_REMOVE, apply_delta
+from src.core.prototypes import PrototypeIndex
+from src.utils import init_id_name, init_vt_db, delete_id_name, check_is_id_exist, add_id_name, bump_gallery_version, read_gallery_version
 
 class VectorBD:
     """Bao bọc thao tác với FAISS index và map id ↔ tên.
 
+    Thiết kế: xem ``src.core.deltalog``, ``src.core.ann`` và ``src.core.prototypes``.
+
     Args:
         path_db: Đường dẫn tệp FAISS index.
         path_json_id_name: Đường dẫn tệp JSON lưu ánh xạ id ↔ tên.
@@ -16,8 +23,263 @@ class VectorBD:
         self.dim = conf.dim
         self.path_db = path_db
         self.path_json_id_name = path_json_id_name
-        self.index = init_vt_db(self.path_db)
+        self.version = read_gallery_version(self.path_db)  # stamp tương ứng dữ liệu đang giữ trong RAM
+        self.log = DeltaLog(self.path_db, self.dim)
+        with self.log.locked():
+            self.index, self.seq, self._snapshot_crc = self._load()
         self.map_id_name = init_id_name(self.path_json_id_name)
+        self._lock = threading.RLock()
+        self._next_version_check = time.monotonic() + conf.gallery_reload_check_s
+        self.prototypes = self._build_prototypes(self.index)
+        self._wake = threading.Event()  # đánh thức luồng nền khi gallery cần chuyển loại/cách lưu
+        if self._migration_target() is not None:
+            self._wake.set()
+        threading.Thread(target=self._compaction_loop, name="gallery-compaction", daemon=True).start()
+
+    def _load(self):
+        """Đọc snapshot rồi phát lại delta log (gọi khi đang giữ ``self.log.locked()``).
+
+        Returns:
+            (index, seq đã áp dụng tới, crc32 của snapshot theo meta)
+        """
+        index, seq = self.log.replay(init_vt_db(self.path_db, mmap=conf.vector_index_mmap))
+        return configure_index(index), seq, self.log.read_meta().get("crc")
+
+    def _catch_up(self) -> None:
+        """Áp dụng các bản ghi tiến trình khác vừa thêm vào log (gọi khi đang giữ cả hai khoá)."""
+        if self.log.read_meta().get("crc") != self._snapshot_crc:
+            # Tiến trình khác đã ghi snapshot mới: nạp lại toàn bộ
+            self._swap_loaded(self._load())
+            return
+        try:
+            records = self.log.read(self.seq)
+        except DeltaLogCorrupted:
+            # Bản ghi hỏng giữa log: nạp lại (``replay`` khôi phục phần còn đọc được và ghi snapshot mới)
+            self._swap_loaded(self._load())
+            return
+        for seq, op, id, vectors in records:
+            self.index = apply_delta(self.index, op, id, vectors)
+            self._sync_prototypes(id, added=op == OP_ADD)
+        if records:
+            self.seq = records[-1][0]
+
+    def _swap_loaded(self, loaded, prototypes=None) -> None:
+        """Thay gallery bằng ``loaded`` (kết quả ``_load``) cùng index prototype tương ứng (gọi khi đang giữ cả hai khoá).
+
+        ``prototypes``: index prototype đã dựng sẵn ngoài ``self._lock`` (mặc định dựng tại đây).
+        """
+        if prototypes is None:
+            prototypes = self._loaded_prototypes(*loaded[:2])
+        (self.index, self.seq, self._snapshot_crc), self.prototypes = loaded, prototypes
+        if prototypes is not None:
+            prototypes.bind(self.index)
+
+    def _write(self, op: int, id: int, embeddings: np.ndarray = None) -> None:
+        """Ghi thao tác vào delta log rồi áp dụng vào index trong RAM (gọi khi đang giữ cả hai khoá)."""
+        self._catch_up()
+        self.seq = self.log.append(op, id, embeddings)
+        self.index = apply_delta(self.index, op, id, embeddings)
+
+    def _compaction_loop(self) -> None:
+        while True:
+            self._wake.wait(conf.delta_log_check_s)
+            self._wake.clear()
+            try:
+                if self._migration_target() is not None and self._migrate():
+                    continue
+                limit = max(conf.delta_log_compact_min_bytes, conf.delta_log_compact_ratio * os.path.getsize(self.path_db))
+                pending = getattr(self.index, 'pending', 0)  # vector chờ trong segment RAM (chế độ mmap)
+                if self.prototypes is not None:
+                    pending += self.prototypes.pending  # tombstone trên index prototype HNSW
+                if self.log.size() >= limit or pending >= conf.delta_segment_max_vectors:
+                    self.save_local()
+            except Exception as e:
+                print(f"Không thể nén delta log của vector db: {e}")
+
+    @staticmethod
+    def _two_stage(ntotal: int) -> bool:
+        """True nếu gallery ``ntotal`` vector được tìm hai tầng (ngược lại quét index trực tiếp)."""
+        return conf.two_stage_search and not conf.vector_index_mmap and ntotal >= conf.two_stage_min_vectors
+
+    def _build_prototypes(self, index: faiss.Index, previous: PrototypeIndex = None):
+        """Index prototype cho gallery ``index``, hoặc None nếu không tìm hai tầng."""
+        if not self._two_stage(index.ntotal) or isinstance(index, SegmentedIndex) or index_kind(index) != 'flat':
+            return None
+        return PrototypeIndex.build(index, previous, kind=target_kind('flat', index.ntotal))
+
+    def _loaded_prototypes(self, index: faiss.Index, seq: int):
+        """Index prototype cho gallery vừa nạp từ snapshot (gọi khi đang giữ ``self.log.locked()``).
+
+        Snapshot có đúng nội dung đang giữ (tiến trình khác chỉ nén log) thì dùng lại ``self.prototypes``;
+        ngược lại dựng lại, dùng lại prototype của các danh tính không đổi.
+        """
+        current = self.prototypes
+        if (current is not None and seq == self.seq
+                and not isinstance(index, SegmentedIndex) and index_kind(index) == 'flat'
+                and index_storage(index) == index_storage(current.gallery)
+                and current.kind == target_kind('flat', index.ntotal)):
+            return current
+        return self._build_prototypes(index, current)
+
+    def _sync_prototypes(self, id: int, added: bool) -> None:
+        """Cập nhật index prototype sau khi gallery vừa thêm (``added``) hoặc xoá embedding của ``id``."""
+        prototypes = self.prototypes
+        if (prototypes is None or prototypes.gallery is not self.index
+                or prototypes.kind != target_kind('flat', self.index.ntotal)):
+            # Gallery vừa đổi (chuyển loại/cách lưu) hoặc vừa đủ lớn: dựng lại
+            self.prototypes = self._build_prototypes(self.index, prototypes)
+        elif not self._two_stage(self.index.ntotal):
+            self.prototypes = None
+        elif added:
+            prototypes.add(id)
+        else:
+            prototypes.remove(id)
+
+    @property
+    def index_kind(self) -> str:
+        return index_kind(self.index)
+
+    @property
+    def index_storage(self) -> str:
+        return index_storage(self.index)
+
+    def _migration_target(self):
+        """(loại, cách lưu) gallery cần chuyển sang theo cấu hình, hoặc None nếu đã đúng."""
+        index = self.index
+        current = (index_kind(index), index_storage(index))
+        # Tìm hai tầng: gallery flat là bản duy nhất của embedding, loại index cấu hình dùng cho prototype
+        kind = 'flat' if self._two_stage(index.ntotal) else target_kind(current[0], index.ntotal)
+        wanted = (kind, target_storage(current[1], kind, index.ntotal))
+        return None if wanted == current else wanted
+
+    def _source_vectors(self, kind: str, storage: str):
+        """(vectors, ids, train) để dựng lại gallery (gọi khi đang giữ ``self.log.locked()``, log đã bắt kịp).
+
+        Vector của các bản ghi trong delta log là float32 gốc; phần còn lại đọc từ snapshot (chính xác
+        nếu snapshot lưu float32, ngược lại là vector đã giải mã). ``train`` chỉ gồm vector chính xác,
+        trừ khi chúng chưa đủ để huấn luyện ``kind``/``storage``.
+        """
+        records = self.log.read(self.log.snapshot_seq() or 0)
+        raw, removed = {}, set()
+        for seq, op, id, vectors in records:
+            if op == OP_ADD:
+                raw.setdefault(id, []).append(vectors)
+            else:
+                raw.pop(id, None)
+                removed.add(id)
+        snapshot = open_mapped(self.path_db)
+        vectors, ids = get_vectors(snapshot)
+        if removed:
+            keep = ~np.isin(ids, np.fromiter(removed, dtype=np.int64))
+            vectors, ids = vectors[keep], ids[keep]
+        exact = index_storage(snapshot) == 'float32'
+        if raw:
+            log_vectors = np.vstack([v for chunks in raw.values() for v in chunks]).astype(np.float32)
+            log_ids = np.concatenate([np.full(len(v), id, dtype=np.int64) for id, chunks in raw.items() for v in chunks])
+            vectors, ids = np.vstack([vectors, log_vectors]), np.concatenate([ids, log_ids])
+        train = vectors if exact or not raw else log_vectors
+        if len(train) < storage_min_train_size(storage, kind):
+            train = vectors
+        return vectors, ids, train
+
+    def _migrate(self) -> bool:
+        """Chuyển gallery sang ``_migration_target`` (chạy trong luồng nền).
+
+        Chỉ ``VectorBD`` giành được ``self.log.migrating()`` (một trong mọi tiến trình/đối tượng dùng
+        chung gallery) dựng index mới; các đối tượng khác bỏ qua và nạp snapshot mới qua ``_catch_up``.
+
+        Returns:
+            bool: True nếu đã chuyển.
+        """
+        with self.log.migrating() as elected:
+            if not elected:
+                return False
+            return self._run_migration()
+
+    def _run_migration(self) -> bool:
+        """Dựng index mới và thay thế (gọi khi đang giữ ``self.log.migrating()``).
+
+        Chỉ giữ ``self.log.locked()`` khi lấy vector và khi thay index: huấn luyện/dựng index mới chạy
+        ngoài mọi khoá nên tìm kiếm và ghi không bị chặn. Các bản ghi ghi thêm trong lúc dựng được áp
+        dụng vào index mới trước khi ghi snapshot; nếu tiến trình khác đã ghi snapshot mới thì bỏ qua
+        (lần kiểm tra sau sẽ thử lại trên gallery vừa nạp).
+
+        Returns:
+            bool: True nếu đã chuyển.
+        """
+        with self.log.locked():
+            with self._lock:
+                self._catch_up()
+            target = self._migration_target()
+            if target is None:
+                return False
+            current = (self.index_kind, self.index_storage)
+            vectors, ids, train = self._source_vectors(*target)
+            seq, snapshot_crc = self.seq, self._snapshot_crc
+        start = time.perf_counter()
+        index = build_index(target[0], vectors, ids, self.dim, target[1], train=train)
+        prototypes = self._build_prototypes(index, self.prototypes)
+        with self.log.locked():
+            if self._snapshot_crc != snapshot_crc or self.log.read_meta().get("crc") != snapshot_crc:
+                print("Bỏ qua chuyển đổi vector db: snapshot đã thay đổi trong lúc dựng index")
+                return False
+            records = self.log.read(seq)
+            for seq, op, id, embeddings in records:
+                index = apply_delta(index, op, id, embeddings)
+                if prototypes is not None and op == OP_ADD:
+                    prototypes.add(id)
+                elif prototypes is not None:
+                    prototypes.remove(id)
+            self._snapshot_crc = self.log.write_snapshot(index, seq)
+            if conf.vector_index_mmap:
+                index = configure_index(init_vt_db(self.path_db, mmap=True))
+            with self._lock:
+                self.index, self.seq, self.prototypes = index, seq, prototypes
+        self.version = bump_gallery_version(self.path_db)
+        trained = f", huấn luyện trên {len(train)} vector" if storage_min_train_size(target[1], target[0]) else ""
+        print(f"Đã chuyển vector db từ {'/'.join(current)} sang {self.index_kind}/{self.index_storage} "
+              f"({self.index.ntotal} vector{trained}, {time.perf_counter() - start:.1f} s)")
+        return True
+
+    def reload(self) -> bool:
+        """Cập nhật index + map id ↔ tên theo đĩa.
+
+        Nếu snapshot không đổi thì chỉ áp dụng các bản ghi mới của delta log; ngược lại
+        đọc lại snapshot ngoài ``self._lock`` (tìm kiếm không bị chặn) rồi thay thế nguyên tử.
+
+        Returns:
+            bool: True nếu đã cập nhật.
+        """
+        try:
+            with self.log.locked():
+                version = read_gallery_version(self.path_db)
+                map_id_name = init_id_name(self.path_json_id_name)
+                loaded = None
+                if self.log.read_meta().get("crc") != self._snapshot_crc:
+                    loaded = self._load()
+                    prototypes = self._loaded_prototypes(*loaded[:2])
+                with self._lock:
+                    if loaded is None:
+                        self._catch_up()
+                    else:
+                        self._swap_loaded(loaded, prototypes)
+                    self.map_id_name, self.version = map_id_name, version
+        except Exception as e:
+            # Tệp có thể đang được ghi dở, thử lại ở lần kiểm tra sau
+            print(f"Không thể reload vector db: {e}")
+            return False
+        print(f"Đã reload vector db ({self.index.ntotal} vector, version {version})")
+        return True
+
+    def maybe_reload(self) -> bool:
+        """Reload nếu version stamp trên đĩa khác bản đang giữ (kiểm tra có giới hạn tần suất)."""
+        now = time.monotonic()
+        if now < self._next_version_check:
+            return False
+        self._next_version_check = now + conf.gallery_reload_check_s
+        if read_gallery_version(self.path_db) == self.version:
+            return False
+        return self.reload()
 
     def search_emb(self, embeddings: np.ndarray):
         """Tìm lân cận gần nhất cho mỗi embedding trong batch.
@@ -31,8 +293,14 @@ class VectorBD:
             names = [[name1], [name2], ...]
             ids = [[id1], [id2]]
         """
-        dis, ids = self.index.search(embeddings, 1)
-        names = [[self.map_id_name.get(str(id[0]), "Unknown")] for id in ids]
+        self.maybe_reload()
+        with self._lock:
+            if self.prototypes is not None:
+                dis, ids = self.prototypes.search(embeddings)
+            else:
+                dis, ids = self.index.search(embeddings, 1)
+            map_id_name = self.map_id_name
+        names = [[map_id_name.get(str(id[0]), "Unknown")] for id in ids]
         return dis, names, ids
     
     def remove_emb(self, id: int, name: str):
@@ -42,14 +310,19 @@ class VectorBD:
         """
         # 1. Xoá khỏi FAISS index
         try:
-            self.index.remove_ids(np.array([id]))
-            self.save_local()
+            with self.log.locked(), self._lock:
+                self._write(OP_REMOVE, id)
+                self._sync_prototypes(id, added=False)
+            self.version = bump_gallery_version(self.path_db)
             print(f"Đã xoá embeddings cho ID {id} khỏi FAISS index.")
         except Exception as e:
             print(f"Lỗi khi xoá embedding khỏi FAISS cho ID {id}: {e}")
 
-        # 2. Xoá khỏi map id <-> name
-        delete_id_name(id, self.path_json_id_name)
+        # 2. Xoá khỏi map id <-> name (trong khoá giữa các tiến trình như ``add_emb``)
+        with self.log.locked(), self._lock:
+            delete_id_name(id, self.path_json_id_name, self.path_db)
+            self.map_id_name.pop(str(id), None)
+            self.version = read_gallery_version(self.path_db)
         print(f"Đã xoá ánh xạ cho ID {id} khỏi map_id_name.json.")
 
         # 3. Xoá thư mục dữ liệu thô
@@ -76,8 +349,27 @@ class VectorBD:
         print("Đã cập nhật thành công")
         
     def save_local(self):
-        """Lưu FAISS index xuống tệp ``self.path_db``."""
-        faiss.write_index(self.index, self.path_db)
+        """Ghi snapshot đầy đủ xuống ``self.path_db`` (tệp tạm rồi ``os.replace``), làm rỗng delta log và tăng version stamp.
+
+        Chỉ giữ ``self._lock`` khi bắt kịp log và khi thay index nên tìm kiếm không bị chặn trong lúc gộp/ghi tệp;
+        index không thể đổi trong lúc đó vì mọi thay đổi đều cần ``self.log.locked()``.
+        """
+        with self.log.locked():
+            with self._lock:
+                self._catch_up()
+            # Gộp segment RAM, bỏ hẳn vector bị tombstone (dựng lại đồ thị HNSW ở đây, ngoài ``self._lock``)
+            index = self.index.materialize() if isinstance(self.index, SegmentedIndex) else self.index
+            prototype_index = self.prototypes.compact() if self.prototypes is not None else None
+            self._snapshot_crc = self.log.write_snapshot(index, self.seq)
+            if conf.vector_index_mmap:
+                # Chuyển sang snapshot vừa ghi, segment RAM và tombstone được làm rỗng
+                index = configure_index(init_vt_db(self.path_db, mmap=True))
+            with self._lock:
+                self.index = index
+                if prototype_index is not None:
+                    self.prototypes.index = prototype_index
+                    self.prototypes.bind(index)
+        self.version = bump_gallery_version(self.path_db)
     
     def add_emb(self, embeddings: np.ndarray, name: str, id: int):
         """Thêm embedding (dạng batch) vào index và cập nhật map id ↔ tên.
@@ -87,37 +379,59 @@ class VectorBD:
             name (str): Tên hiển thị của đối tượng.
             id (int): Định danh tương ứng.
         """
-        # Kiểm tra id đã tồn tại hay chưa
-        if not check_is_id_exist(id, self.path_json_id_name):
-            # Thêm vào index embeddings với id tương ứng
-            self.index.add_with_ids(embeddings, np.array([id] * len(embeddings)))
-            add_id_name(id, name) # Thêm vào map id -> name
-            self.save_local() # Lưu lại database
-            print(f"Đã thêm thành công {name.split('_')[0]} với ID: {id} vào database với {len(embeddings)} ảnh")
-        else:
+        with self.log.locked():
+            # Kiểm tra id đã tồn tại hay chưa (trong khoá để hai tiến trình không cùng thêm một id)
+            exists = check_is_id_exist(id, self.path_json_id_name)
+            if not exists:
+                # Thêm vào index embeddings với id tương ứng
+                with self._lock:
+                    self._write(OP_ADD, id, embeddings)
+                    add_id_name(id, name, self.path_json_id_name, self.path_db) # Thêm vào map id -> name
+                    self.map_id_name[str(id)] = name
+                    self._sync_prototypes(id, added=True)
+        if exists:
             print(f"{id} đã tồn tại trong db, vui lòng sử dụng hàm cập nhật")
+            return
+        self._after_add()
+        print(f"Đã thêm thành công {name.split('_')[0]} với ID: {id} vào database với {len(embeddings)} ảnh")
 
     def add_more_emb(self, embeddings: np.ndarray, id: int):
         """Thêm embedding (dạng batch) vào index cho một id đã tồn tại."""
         # Thêm vào index embeddings với id tương ứng
-        self.index.add_with_ids(embeddings, np.array([id] * len(embeddings)))
-        self.save_local() # Lưu lại database
+        with self.log.locked(), self._lock:
+            self._write(OP_ADD, id, embeddings)
+            self._sync_prototypes(id, added=True)
+        self._after_add()
         print(f"Đã thêm thành công {len(embeddings)} ảnh mới cho ID: {id}")
 
+    def _after_add(self) -> None:
+        """Tăng version stamp và đánh thức luồng nền nếu gallery vừa cần chuyển loại/cách lưu."""
+        self.version = bump_gallery_version(self.path_db)
+        if self._migration_target() is not None:
+            self._wake.set()
+
     def re_init(self):
         """Tạo mới hoàn toàn index và map id ↔ tên trên đĩa.
 
         Dùng khi cần làm sạch/cài đặt lại cơ sở dữ liệu cục bộ.
         """
-        # Kiểm tra database tồn tại không, nếu có thì xoá
-        if os.path.exists(self.path_db):
-            os.remove(self.path_db)
-        if os.path.exists(self.path_json_id_name):
-            os.remove(self.path_json_id_name)
-            
-        # Load lại database với dữ liệu đã được lưu từ trước
-        self.index = init_vt_db(self.path_db)
-        self.map_id_name = init_id_name(self.path_json_id_name)
+        with self.log.locked():
+            # Kiểm tra database tồn tại không, nếu có thì xoá
+            if os.path.exists(self.path_db):
+                os.remove(self.path_db)
+            if os.path.exists(self.path_json_id_name):
+                os.remove(self.path_json_id_name)
+
+            # Load lại database với dữ liệu đã được lưu từ trước
+            with self._lock:
+                self.index = init_vt_db(self.path_db, mmap=conf.vector_index_mmap)
+                self.map_id_name = init_id_name(self.path_json_id_name)
+                self.prototypes = None
+                # Snapshot rỗng mới (seq tiếp tục tăng) để các tiến trình khác nạp lại toàn bộ
+                self.log.read(self.seq)
+                self.seq = self.log.last_seq
+                self._snapshot_crc = self.log.write_snapshot(self.index, self.seq)
+                self.version = bump_gallery_version(self.path_db)
         print("Đã tạo lại db mới")
         
     
\ No newline at end of file
@@ -0,0 +1,210 @@
+"""
+Client mỏng của daemon suy luận (``src.daemon.server``).
+
+``RemoteRegconizer`` có cùng API với ``Regconizer`` nhưng không nạp TensorFlow/ONNX/FAISS:
+mọi bước suy luận được gửi sang daemon, chỉ phần vẽ nhãn và tracker chạy tại chỗ.
+``RemoteVectorDB`` tương tự cho ``VectorBD``: tìm kiếm và ghi gallery (thêm/xoá embedding,
+tạo lại db) đều chạy trong daemon, nên client không nạp FAISS index hay chạy luồng nén delta log.
+``src.core.registry.get_recognizer``/``get_vector_db`` tự trả về các lớp này khi daemon đang chạy.
+"""
+
+import os
+import atexit
+import queue
+import socket
+import threading
+import numpy as np
+
+from src import config as conf
+from src.core.recognition import Regconizer, RecognitionResult
+from src.daemon.protocol import SharedFrameWriter, send_message, recv_message, decode_result
+from src.utils import OverlayRenderer
+
+
+class _Channel():
+    """Một kết nối socket kèm vùng shared memory riêng cho frame."""
+    def __init__(self, socket_path: str, timeout: float):
+        self.conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.conn.settimeout(timeout)
+        self.conn.connect(socket_path)
+        self.frames = SharedFrameWriter()
+
+    def close(self) -> None:
+        self.conn.close()
+        self.frames.close()
+
+
+class InferenceClient():
+    """Kết nối tới daemon qua một pool kênh (socket + shared memory).
+
+    Mỗi lệnh mượn một kênh rảnh (hoặc mở kênh mới) rồi trả lại, nên số kênh chỉ bằng số
+    lệnh đồng thời lớn nhất, kể cả với server tạo luồng mới cho từng request.
+
+    Args:
+        socket_path: Đường dẫn Unix domain socket của daemon.
+        timeout: Thời gian chờ tối đa cho mỗi lệnh (giây).
+    """
+    def __init__(self, socket_path: str = conf.inference_socket_path, timeout: float = conf.inference_timeout_s):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def call(self, op: str, frame: np.ndarray = None, **payload) -> dict:
+        """Gửi một lệnh (kèm frame qua shared memory nếu có) và chờ phản hồi.
+
+        Raises:
+            RuntimeError: Daemon trả về lỗi.
+            OSError: Mất kết nối tới daemon.
+        """
+        try:
+            channel = self._idle.get_nowait()
+        except queue.Empty:
+            channel = _Channel(self.socket_path, self.timeout)
+        try:
+            if frame is not None:
+                payload["frame"] = channel.frames.write(frame)
+            send_message(channel.conn, {"op": op, **payload})
+            response = recv_message(channel.conn)
+            if response is None:
+                raise ConnectionError("Daemon suy luận đã đóng kết nối")
+        except BaseException:
+            channel.close()
+            raise
+        self._idle.put(channel)
+        if not response.pop("ok", False):
+            raise RuntimeError(response.get("error", "Lỗi không xác định từ daemon"))
+        return response
+
+    def ping(self) -> bool:
+        try:
+            self.call("ping")
+            return True
+        except OSError:
+            return False
+
+    def close(self) -> None:
+        """Đóng mọi kênh rảnh và giải phóng shared memory của chúng."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_client() -> InferenceClient:
+    """``InferenceClient`` dùng chung trong tiến trình (đóng tự động khi thoát)."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = InferenceClient()
+            atexit.register(_default_client.close)
+        return _default_client
+
+
+def daemon_available(socket_path: str = conf.inference_socket_path) -> bool:
+    """True nếu có daemon đang lắng nghe tại ``socket_path``."""
+    if not os.path.exists(socket_path):
+        return False
+    client = InferenceClient(socket_path, timeout=1.0)
+    try:
+        return client.ping()
+    finally:
+        client.close()
+
+
+class RemoteVectorDB():
+    """``VectorBD`` của daemon: cùng các hàm tìm kiếm/ghi gallery mà app và script sử dụng.
+
+    Args:
+        client: ``InferenceClient`` (mặc định dùng client chung của tiến trình).
+    """
+    def __init__(self, client: InferenceClient = None):
+        self.client = client or get_client()
+
+    def search_emb(self, embeddings: np.ndarray):
+        """Tìm kiếm trên gallery của daemon, cùng định dạng với ``VectorBD.search_emb``."""
+        response = self.client.call("search", embeddings=np.asarray(embeddings, dtype=np.float32).tolist())
+        distances = np.asarray(response["scores"], dtype=np.float32).reshape(-1, 1)
+        ids = np.asarray(response["ids"], dtype=np.int64).reshape(-1, 1)
+        return distances, [[name] for name in response["names"]], ids
+
+    def add_emb(self, embeddings: np.ndarray, name: str, id: int) -> None:
+        self.client.call("add_emb", embeddings=np.asarray(embeddings, dtype=np.float32).tolist(), name=name, id=int(id))
+
+    def add_more_emb(self, embeddings: np.ndarray, id: int) -> None:
+        self.client.call("add_more_emb", embeddings=np.asarray(embeddings, dtype=np.float32).tolist(), id=int(id))
+
+    def remove_emb(self, id: int, name: str) -> None:
+        self.client.call("remove_emb", id=int(id), name=name)
+
+    def re_init(self) -> None:
+        self.client.call("re_init")
+
+    def save_local(self) -> None:
+        self.client.call("save")
+
+    def reload(self) -> bool:
+        return self.client.call("reload")["reloaded"]
+
+
+class RemoteRegconizer(Regconizer):
+    """``Regconizer`` chạy suy luận trong daemon.
+
+    Các hàm có trạng thái hiển thị (``regcognize_face``, ``track_faces``) được kế thừa
+    nguyên vẹn vì chúng chỉ dựa trên ``recognize``/``detect``/``identify``.
+
+    Args:
+        headless: True để bỏ qua bước vẽ nhãn.
+        client: ``InferenceClient`` (mặc định dùng client chung của tiến trình).
+    """
+    def __init__(self, headless: bool = False, client: InferenceClient = None):
+        self.client = client or get_client()
+        self.vt_db = RemoteVectorDB(self.client)
+        self.detector_face = None  # detector nằm trong daemon (``detect``/``recognize`` gọi sang daemon)
+        self.headless = headless
+        self.img_face = None
+        self.img_with_bbs = None
+        self.overlay = None if headless else OverlayRenderer()
+        self.bbs = []
+        self.embedded_faces = 0
+        self.reused_faces = 0
+
+    @property
+    def embedding_backend(self) -> str:
+        return self.stats().get("embedding_backend")
+
+    def recognize(self, img: np.ndarray, source=None) -> RecognitionResult:
+        return decode_result(self.client.call("recognize", img, source=source))
+
+    def recognize_many(self, imgs: list, sources: list = None) -> list:
+        # Daemon tự gom batch các frame từ mọi client
+        return [self.recognize(img, source) for img, source in zip(imgs, sources or [None] * len(imgs))]
+
+    def detect(self, img: np.ndarray):
+        response = self.client.call("detect", img)
+        return np.asarray(response["boxes"], dtype=np.int64).reshape(-1, 4), response["detect_imgsz"], response["detect_ms"]
+
+    def identify(self, img: np.ndarray, boxes: np.ndarray) -> RecognitionResult:
+        return decode_result(self.client.call("identify", img, boxes=np.asarray(boxes).reshape(-1, 4).tolist()))
+
+    def embed(self, img: np.ndarray):
+        response = self.client.call("embed", img)
+        return np.asarray(response["boxes"], dtype=np.int64).reshape(-1, 4), np.asarray(response["embeddings"], dtype=np.float32)
+
+    def get_face_embedding(self, img: np.ndarray) -> np.ndarray:
+        self.bbs, embeddings = self.embed(img)
+        return embeddings if len(embeddings) else np.array([])
+
+    def search(self, embeddings: np.ndarray):
+        """Tìm kiếm trên gallery của daemon, cùng định dạng với ``VectorBD.search_emb``."""
+        return self.vt_db.search_emb(embeddings)
+
+    def reload_gallery(self) -> bool:
+        return self.vt_db.reload()
+
+    def stats(self) -> dict:
+        return {"mode": "daemon", **self.client.call("stats")}
@@ -0,0 +1,110 @@
+"""
+Giao thức giữa daemon suy luận và client.
+
+- Mỗi thông điệp là JSON UTF-8 có tiền tố độ dài 4 byte (big-endian) trên Unix domain socket.
+- Frame không đi qua socket: client ghi ảnh vào một vùng ``SharedMemory`` của riêng nó và chỉ
+  gửi ``{"name", "shape", "dtype"}``; daemon gắn vào cùng vùng nhớ và đọc trực tiếp, không copy.
+"""
+
+import json
+import struct
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+HEADER = struct.Struct("!I")
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = bytearray()
+    while len(chunks) < size:
+        chunk = sock.recv(size - len(chunks))
+        if not chunk:
+            return None
+        chunks.extend(chunk)
+    return bytes(chunks)
+
+
+def send_message(sock, message: dict) -> None:
+    """Gửi một thông điệp JSON có tiền tố độ dài."""
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock) -> dict:
+    """Nhận một thông điệp; trả về None khi phía bên kia đã đóng kết nối."""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+class SharedFrameWriter():
+    """Vùng shared memory do client sở hữu, dùng lại cho mọi frame (tự tăng kích thước khi cần)."""
+    def __init__(self):
+        self.shm = None
+
+    def write(self, frame: np.ndarray) -> dict:
+        """Ghi frame vào shared memory, trả về mô tả frame để gửi cho daemon."""
+        frame = np.ascontiguousarray(frame)
+        if self.shm is None or self.shm.size < frame.nbytes:
+            capacity = max(frame.nbytes, 2 * self.shm.size if self.shm is not None else 0)
+            self.close()
+            self.shm = shared_memory.SharedMemory(create=True, size=capacity)
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf)[...] = frame
+        return {"name": self.shm.name, "shape": list(frame.shape), "dtype": frame.dtype.str}
+
+    def close(self) -> None:
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+class SharedFrameReader():
+    """Phía daemon: gắn vào vùng shared memory của client (cache theo tên) và trả về view ndarray."""
+    def __init__(self):
+        self._attached = {}
+
+    def read(self, spec: dict) -> np.ndarray:
+        shm = self._attached.get(spec["name"])
+        if shm is None:
+            # Client đổi vùng nhớ (frame lớn hơn): bỏ các vùng cũ
+            self.close()
+            shm = shared_memory.SharedMemory(name=spec["name"])
+            # Vùng nhớ thuộc về client; không để resource tracker của daemon unlink nó
+            resource_tracker.unregister(shm._name, "shared_memory")
+            self._attached[spec["name"]] = shm
+        return np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=shm.buf)
+
+    def close(self) -> None:
+        for shm in self._attached.values():
+            shm.close()
+        self._attached.clear()
+
+
+def encode_result(result) -> dict:
+    """``RecognitionResult`` -> dict JSON."""
+    return {
+        "boxes": np.asarray(result.boxes).reshape(-1, 4).tolist(),
+        "scores": np.asarray(result.scores, dtype=np.float32).tolist(),
+        "ids": np.asarray(result.ids, dtype=np.int64).tolist(),
+        "names": list(result.names),
+        "timings": result.timings,
+        "detect_imgsz": result.detect_imgsz,
+    }
+
+
+def decode_result(data: dict):
+    """dict JSON -> ``RecognitionResult``."""
+    from src.core.recognition import RecognitionResult
+    return RecognitionResult(
+        boxes=np.asarray(data["boxes"], dtype=np.int64).reshape(-1, 4),
+        scores=np.asarray(data["scores"], dtype=np.float32),
+        ids=np.asarray(data["ids"], dtype=np.int64),
+        names=data["names"],
+        timings=data["timings"],
+        detect_imgsz=data["detect_imgsz"],
+    )
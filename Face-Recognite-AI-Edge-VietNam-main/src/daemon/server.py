@@ -0,0 +1,150 @@
+"""
+Daemon suy luận chạy lâu dài: giữ detector, mô hình embedding và gallery FAISS trong một
+tiến trình duy nhất, phục vụ Flask app, giao diện Tkinter và các script qua Unix domain socket.
+
+Chạy: ``python -m src.daemon.server [--socket ./database/inference.sock]``
+
+Các lệnh (trường ``op``): ``ping``, ``recognize``, ``detect``, ``identify``, ``embed``,
+``search``, ``reload``, ``stats`` và các lệnh ghi gallery ``add_emb``, ``add_more_emb``,
+``remove_emb``, ``re_init``, ``save`` (``VectorBD`` của daemon là nơi duy nhất giữ gallery).
+Frame được truyền qua shared memory (xem ``protocol``).
+"""
+
+import os
+import sys
+import argparse
+import socketserver
+import threading
+import numpy as np
+
+# Add project root to Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from src import config as conf
+from src.core.recognition import Regconizer
+from src.core.scheduler import InferenceScheduler
+from src.daemon.protocol import SharedFrameReader, send_message, recv_message, encode_result
+
+
+class InferenceDaemon():
+    """Xử lý các lệnh suy luận trên một ``Regconizer`` headless dùng chung.
+
+    ``recognize`` đi qua ``InferenceScheduler`` (nếu bật) nên frame từ mọi client được gom batch chung.
+    """
+    def __init__(self):
+        # Tải + warm-up mô hình qua registry ngay khi khởi động daemon
+        self.recognizer = Regconizer(headless=True)
+        self.scheduler = InferenceScheduler(self.recognizer) if conf.scheduler_enabled else None
+        self.clients = 0
+        self._lock = threading.Lock()
+
+    def handle(self, request: dict, frames: SharedFrameReader) -> dict:
+        op = request.get("op")
+        if op == "ping":
+            return {"pid": os.getpid()}
+        if op == "recognize":
+            frame, source = frames.read(request["frame"]), request.get("source")
+            if self.scheduler is not None:
+                return encode_result(self.scheduler.recognize(frame, source))
+            return encode_result(self.recognizer.recognize(frame, source))
+        if op == "detect":
+            boxes, imgsz, detect_ms = self.recognizer.detect(frames.read(request["frame"]))
+            return {"boxes": boxes.tolist(), "detect_imgsz": imgsz, "detect_ms": detect_ms}
+        if op == "identify":
+            boxes = np.asarray(request["boxes"], dtype=np.int64).reshape(-1, 4)
+            return encode_result(self.recognizer.identify(frames.read(request["frame"]), boxes))
+        if op == "embed":
+            boxes, embeddings = self.recognizer.embed(frames.read(request["frame"]))
+            return {"boxes": np.asarray(boxes).tolist(), "embeddings": np.asarray(embeddings).tolist()}
+        if op == "search":
+            embeddings = np.asarray(request["embeddings"], dtype=np.float32).reshape(-1, conf.dim)
+            distances, names, ids = self.recognizer.vt_db.search_emb(embeddings)
+            return {"scores": distances[:, 0].tolist(), "ids": ids[:, 0].tolist(), "names": [name[0] for name in names]}
+        if op in ("add_emb", "add_more_emb"):
+            embeddings = np.asarray(request["embeddings"], dtype=np.float32).reshape(-1, conf.dim)
+            if op == "add_emb":
+                self.recognizer.vt_db.add_emb(embeddings, request["name"], request["id"])
+            else:
+                self.recognizer.vt_db.add_more_emb(embeddings, request["id"])
+            return {}
+        if op == "remove_emb":
+            self.recognizer.vt_db.remove_emb(request["id"], request["name"])
+            return {}
+        if op == "re_init":
+            self.recognizer.vt_db.re_init()
+            return {}
+        if op == "save":
+            self.recognizer.vt_db.save_local()
+            return {}
+        if op == "reload":
+            return {"reloaded": self.recognizer.reload_gallery()}
+        if op == "stats":
+            return {
+                **self.recognizer.stats(),
+                "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+                "clients": self.clients,
+                "pid": os.getpid(),
+            }
+        raise ValueError(f"Lệnh không hỗ trợ: {op}")
+
+
+class _ClientHandler(socketserver.BaseRequestHandler):
+    """Một luồng cho mỗi kết nối; client giữ kết nối mở và gửi lần lượt từng lệnh."""
+    def handle(self):
+        daemon = self.server.daemon_state
+        frames = SharedFrameReader()
+        with daemon._lock:
+            daemon.clients += 1
+        try:
+            while True:
+                request = recv_message(self.request)
+                if request is None:
+                    break
+                try:
+                    response = {"ok": True, **daemon.handle(request, frames)}
+                except Exception as exc:
+                    response = {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+                send_message(self.request, response)
+        finally:
+            frames.close()
+            with daemon._lock:
+                daemon.clients -= 1
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path: str = conf.inference_socket_path) -> None:
+    """Khởi động daemon và phục vụ đến khi bị dừng (Ctrl+C / SIGTERM)."""
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # socket cũ còn sót lại sau lần dừng đột ngột
+    daemon = InferenceDaemon()
+    server = _UnixServer(socket_path, _ClientHandler)
+    server.daemon_state = daemon
+    os.chmod(socket_path, 0o660)
+    print(f"Daemon suy luận đang lắng nghe tại {socket_path} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if daemon.scheduler is not None:
+            daemon.scheduler.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        print("Đã dừng daemon suy luận")
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+if __name__ == '__main__':
+    import signal
+    signal.signal(signal.SIGTERM, _stop)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=conf.inference_socket_path, help="Đường dẫn Unix domain socket")
+    args = parser.parse_args()
+    serve(args.socket)
@@ -0,0 +1,105 @@
+"""
+Read-through caches for the recognition hot path (customer by face_id, recent orders by customer_id).
+
+Entries expire after ``CUSTOMER_CACHE_TTL`` seconds and the least recently used entry is
+evicted beyond ``CUSTOMER_CACHE_SIZE``. Services invalidate entries explicitly whenever
+they write the underlying documents.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+CUSTOMER_CACHE_TTL = float(os.getenv("CUSTOMER_CACHE_TTL", "30"))
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "1024"))
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe mapping with per-entry expiry and LRU eviction."""
+
+    def __init__(self, ttl: float = CUSTOMER_CACHE_TTL, max_size: int = CUSTOMER_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key`` or load, store and return it."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> None:
+        """Drop every entry for which ``predicate(key, value)`` is true."""
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if predicate(key, value)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# customer dict (empty dict when no customer is linked) keyed by face_id
+customers_by_face = TTLCache()
+# latest orders (newest first) keyed by customer_id
+recent_orders_by_customer = TTLCache()
+
+
+def invalidate_customer(customer_id: str) -> None:
+    """Forget every cached entry that refers to ``customer_id``."""
+    customer_id = str(customer_id)
+    customers_by_face.invalidate_where(lambda _, customer: customer.get("id") == customer_id)
+    recent_orders_by_customer.invalidate(customer_id)
+
+
+def stats() -> Dict:
+    return {
+        "customers_by_face": customers_by_face.stats(),
+        "recent_orders_by_customer": recent_orders_by_customer.stats(),
+    }
@@ -0,0 +1,180 @@
+"""
+Server-side state of POS terminals (cart, active customer, last-seen timestamp).
+
+The browser cookie only carries a terminal id; the state itself lives in memory and is
+optionally persisted to a local JSON file (``TERMINAL_STATE_PATH``) by a background
+thread, so a restart does not empty the carts. Visit dedupe for recognition events is
+store-wide: two terminals seeing the same customer log a single visit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+TERMINAL_STATE_PATH = os.getenv("TERMINAL_STATE_PATH", "")  # empty: keep state in memory only
+TERMINAL_STATE_SAVE_INTERVAL = float(os.getenv("TERMINAL_STATE_SAVE_INTERVAL", "2.0"))
+TERMINAL_STATE_TTL = float(os.getenv("TERMINAL_STATE_TTL", str(24 * 3600)))
+VISIT_DEDUPE_SECONDS = float(os.getenv("VISIT_DEDUPE_SECONDS", "10"))
+
+
+class TerminalStateStore:
+    """Per-terminal state dicts guarded by per-terminal locks, plus store-wide visit dedupe."""
+
+    def __init__(
+        self,
+        path: str = TERMINAL_STATE_PATH,
+        save_interval: float = TERMINAL_STATE_SAVE_INTERVAL,
+        ttl: float = TERMINAL_STATE_TTL,
+        visit_window: float = VISIT_DEDUPE_SECONDS,
+    ):
+        self.path = path or None
+        self.save_interval = save_interval
+        self.ttl = ttl
+        self.visit_window = visit_window
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # atexit and the maintenance thread share one temp file
+        self._states: Dict[str, Dict] = {}
+        self._locks: Dict[str, threading.RLock] = {}
+        self._touched: Dict[str, float] = {}
+        self._visits: Dict[str, float] = {}
+        self._dirty = False
+        if self.path:
+            self._load()
+            atexit.register(self.save)
+        threading.Thread(target=self._maintenance_loop, name="terminal-state-maintenance", daemon=True).start()
+
+    def _entry(self, terminal_id: str):
+        with self._lock:
+            if terminal_id not in self._states:
+                self._states[terminal_id] = {}
+                self._locks[terminal_id] = threading.RLock()
+            self._touched[terminal_id] = time.time()
+            return self._states[terminal_id], self._locks[terminal_id]
+
+    @contextmanager
+    def _locked(self, terminal_id: str) -> Iterator[Dict]:
+        """Hold a terminal's lock on a state dict that is still registered in the store.
+
+        ``discard``/``expire`` may pop the entry between ``_entry`` and acquiring its lock;
+        writing into the popped dict would be lost, so retry with a fresh entry.
+        """
+        while True:
+            state, lock = self._entry(terminal_id)
+            with lock:
+                with self._lock:
+                    current = self._states.get(terminal_id) is state
+                if current:
+                    yield state
+                    return
+
+    def get(self, terminal_id: str) -> Dict:
+        """Snapshot (shallow copy) of a terminal's state for read-only use."""
+        with self._locked(terminal_id) as state:
+            return dict(state)
+
+    @contextmanager
+    def edit(self, terminal_id: str) -> Iterator[Dict]:
+        """Lock a terminal's state for modification; changes are persisted afterwards."""
+        with self._locked(terminal_id) as state:
+            try:
+                yield state
+            finally:
+                self._dirty = True
+
+    def discard(self, terminal_id: Optional[str]) -> None:
+        """Forget a terminal entirely (e.g. on logout)."""
+        if not terminal_id:
+            return
+        with self._lock:
+            self._states.pop(terminal_id, None)
+            self._locks.pop(terminal_id, None)
+            self._touched.pop(terminal_id, None)
+            self._dirty = True
+
+    def should_log_visit(self, visitor_key, now: Optional[float] = None) -> bool:
+        """True if ``visitor_key`` was not logged by any terminal within the dedupe window."""
+        now = time.time() if now is None else now
+        key = str(visitor_key)
+        with self._lock:
+            last = self._visits.get(key)
+            if last is not None and now - last <= self.visit_window:
+                return False
+            self._visits[key] = now
+            return True
+
+    def expire(self, now: Optional[float] = None) -> None:
+        """Drop terminals idle for longer than ``ttl`` and visits older than the dedupe window."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for terminal_id in [tid for tid, ts in self._touched.items() if now - ts > self.ttl]:
+                self._states.pop(terminal_id, None)
+                self._locks.pop(terminal_id, None)
+                self._touched.pop(terminal_id, None)
+                self._dirty = True
+            for key in [key for key, ts in self._visits.items() if now - ts > self.visit_window]:
+                del self._visits[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "terminals": len(self._states),
+                "recent_visits": len(self._visits),
+                "persisted": bool(self.path),
+            }
+
+    def save(self) -> None:
+        """Write every terminal's state to ``path`` atomically (temp file + ``os.replace``)."""
+        if not self.path:
+            return
+        with self._save_lock:
+            self._save()
+
+    def _save(self) -> None:
+        with self._lock:
+            self._dirty = False
+            items = list(self._states.items())
+            locks = dict(self._locks)
+            touched = dict(self._touched)
+        terminals = {}
+        for terminal_id, state in items:
+            with locks[terminal_id]:
+                terminals[terminal_id] = {"state": copy.deepcopy(state), "touched": touched.get(terminal_id, 0)}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump({"terminals": terminals}, handle, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError) as exc:
+            print(f"Terminal state: cannot read {self.path}: {exc}")
+            return
+        for terminal_id, entry in data.get("terminals", {}).items():
+            self._states[terminal_id] = entry.get("state", {})
+            self._locks[terminal_id] = threading.RLock()
+            self._touched[terminal_id] = entry.get("touched", time.time())
+        self.expire()
+
+    def _maintenance_loop(self) -> None:
+        while True:
+            time.sleep(self.save_interval)
+            self.expire()
+            if self.path and self._dirty:
+                try:
+                    self.save()
+                except OSError as exc:
+                    print(f"Terminal state: cannot write {self.path}: {exc}")
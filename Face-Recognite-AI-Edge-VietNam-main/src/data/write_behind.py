@@ -0,0 +1,209 @@
+"""
+Write-behind queue for append-only audit writes (recognition events, login and activity logs).
+
+Callers enqueue pymongo write operations and return immediately; a background thread
+groups them per collection and writes them with ``insert_many``/``bulk_write`` once the
+batch is full, the flush interval has elapsed, or the process exits.
+"""
+
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.collection import Collection
+
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "1") != "0"
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+
+
+class WriteBehindQueue:
+    """Bounded queue of (collection, operation) pairs drained by one writer thread.
+
+    When the queue is full new operations are dropped (and counted) instead of blocking
+    the request that produced them.
+    """
+
+    def __init__(
+        self,
+        max_size: int = WRITE_BEHIND_MAX_QUEUE,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._counters = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._last_error: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, collection: Collection, operation) -> bool:
+        """Enqueue a document to insert or an ``UpdateOne``; return False if it was dropped.
+
+        The closed check and the enqueue happen under ``self._lock`` so nothing lands behind
+        the stop sentinel; after ``close`` operations are written synchronously.
+        """
+        with self._lock:
+            if not self._closed:
+                try:
+                    self._queue.put_nowait((collection, operation))
+                except queue.Full:
+                    self._counters["dropped"] += 1
+                    return False
+                self._counters["enqueued"] += 1
+                return True
+        self._write(collection, [operation])
+        return True
+
+    def insert(self, collection: Collection, document: Dict) -> bool:
+        return self.submit(collection, document)
+
+    def update(self, collection: Collection, filter: Dict, update: Dict) -> bool:
+        return self.submit(collection, UpdateOne(filter, update))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything enqueued so far has been written (or ``timeout`` expires)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write the remaining operations and stop the writer thread, waiting at most ``timeout`` seconds.
+
+        Runs from ``atexit``: if the writer cannot drain in time (e.g. MongoDB unreachable),
+        whatever is still pending is counted as dropped instead of blocking shutdown.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put((None, None), timeout=timeout)
+        except queue.Full:
+            self._drop_pending(self._queue.unfinished_tasks)
+            return
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        if self._thread.is_alive():
+            self._drop_pending(self._queue.unfinished_tasks - 1)  # minus the stop sentinel
+
+    def _drop_pending(self, pending: int) -> None:
+        if pending > 0:
+            print(f"Write-behind: writer did not finish in time, dropping {pending} pending operations")
+            self._count("dropped", pending)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            last_error = self._last_error
+        return {
+            "enabled": True,
+            "queue_depth": self._queue.qsize(),
+            "max_size": self.max_size,
+            **counters,
+            "last_error": last_error,
+        }
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[key] += value
+
+    def _collect(self) -> List:
+        """Wait for the first operation, then gather more until the batch is full or the interval ends."""
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(items) < self.batch_size and items[-1][0] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self) -> None:
+        while True:
+            items = self._collect()
+            stop = any(collection is None for collection, _ in items)
+            grouped: Dict[str, tuple] = {}
+            for collection, operation in items:
+                if collection is None:
+                    continue
+                grouped.setdefault(collection.full_name, (collection, []))[1].append(operation)
+            for collection, operations in grouped.values():
+                self._write(collection, operations)
+            for _ in items:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, collection: Collection, operations: List) -> None:
+        try:
+            if all(isinstance(operation, dict) for operation in operations):
+                collection.insert_many(operations, ordered=False)
+            else:
+                requests = [InsertOne(op) if isinstance(op, dict) else op for op in operations]
+                collection.bulk_write(requests, ordered=True)
+        except Exception as exc:
+            print(f"Write-behind: failed to write {len(operations)} operations to {collection.name}: {exc}")
+            with self._lock:
+                self._counters["failed"] += len(operations)
+                self._last_error = f"{type(exc).__name__}: {exc}"
+            return
+        with self._lock:
+            self._counters["written"] += len(operations)
+            self._counters["batches"] += 1
+
+
+class _DirectWriter:
+    """Synchronous stand-in used when ``WRITE_BEHIND_ENABLED=0``."""
+
+    def insert(self, collection: Collection, document: Dict) -> bool:
+        collection.insert_one(document)
+        return True
+
+    def update(self, collection: Collection, filter: Dict, update: Dict) -> bool:
+        collection.update_one(filter, update)
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return True
+
+    def close(self, timeout: float = 10.0) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        return {"enabled": False}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_write_behind():
+    """Return the process-wide writer, started on first use and flushed at exit."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            if WRITE_BEHIND_ENABLED:
+                _writer = WriteBehindQueue()
+                atexit.register(_writer.close)
+            else:
+                _writer = _DirectWriter()
+        return _writer
@@ -11,7 +11,7 @@ from glob import glob
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from src.core.recognition import Regconizer
+from src.core import registry
 from src.utils import read_image
 
 SUPPORTED_EXTENSIONS = ["*.jpg", "*.jpeg", "*.png"]
@@ -30,7 +30,7 @@ def process_image_folder(folder_path: str) -> np.ndarray:
         print(f"Error: Folder not found at {folder_path}")
         return np.array([])
 
-    rec = Regconizer()
+    rec = registry.get_recognizer(headless=True)
     image_paths = []
     for ext in SUPPORTED_EXTENSIONS:
         image_paths.extend(glob(os.path.join(folder_path, ext)))
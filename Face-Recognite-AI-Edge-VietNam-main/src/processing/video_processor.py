@@ -10,7 +10,7 @@ import os
 # Add project root to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from src.core.recognition import Regconizer
+from src.core import registry
 
 def process_video(video_path: str, sample_rate: int = 2) -> np.ndarray:
     """
@@ -27,7 +27,7 @@ def process_video(video_path: str, sample_rate: int = 2) -> np.ndarray:
         print(f"Error: Video file not found at {video_path}")
         return np.array([])
 
-    rec = Regconizer()
+    rec = registry.get_recognizer(headless=True)
     cam = cv2.VideoCapture(video_path)
     if not cam.isOpened():
         print(f"Error: Could not open video file {video_path}")
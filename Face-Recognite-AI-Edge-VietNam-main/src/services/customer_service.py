@@ -9,7 +9,9 @@ from typing import Dict, List, Optional
 
 from bson import ObjectId
 
+from src.data import cache
 from src.data.db import get_collection
+from src.data.write_behind import get_write_behind
 from src.services.user_service import log_activity
 
 CUSTOMERS = get_collection("customers")
@@ -53,6 +55,8 @@ def create_customer(
         "updated_at": now,
     }
     result = CUSTOMERS.insert_one(doc)
+    if face_id is not None:
+        cache.customers_by_face.invalidate(face_id)
     return str(result.inserted_id)
 
 
@@ -63,11 +67,16 @@ def update_customer(customer_id: str, **fields) -> None:
         return
     updates["updated_at"] = _now_iso()
     CUSTOMERS.update_one({"_id": ObjectId(customer_id)}, {"$set": updates})
+    cache.invalidate_customer(customer_id)
+    if updates.get("face_id") is not None:
+        cache.customers_by_face.invalidate(updates["face_id"])
 
 
 def get_customer_by_face_id(face_id: int) -> Optional[Dict]:
-    doc = CUSTOMERS.find_one({"face_id": face_id})
-    return _serialize(doc)
+    customer = cache.customers_by_face.get_or_load(
+        face_id, lambda: _serialize(CUSTOMERS.find_one({"face_id": face_id}))
+    )
+    return dict(customer)
 
 
 def get_customer(customer_id: str) -> Optional[Dict]:
@@ -91,7 +100,9 @@ def log_recognition_event(
     camera_id: str,
 ) -> None:
     now = _now_iso()
-    RECOGNITION_EVENTS.insert_one(
+    writer = get_write_behind()
+    writer.insert(
+        RECOGNITION_EVENTS,
         {
             "customer_id": customer_id,
             "staff_id": staff_id,
@@ -101,7 +112,8 @@ def log_recognition_event(
         }
     )
     if customer_id:
-        CUSTOMERS.update_one(
+        writer.update(
+            CUSTOMERS,
             {"_id": ObjectId(customer_id)},
             {
                 "$inc": {"visit_count": 1},
@@ -121,6 +133,7 @@ def record_purchase(customer_id: Optional[str], order_id: str, total_amount: flo
             "$set": {"last_visit": now, "updated_at": now},
         },
     )
+    cache.invalidate_customer(customer_id)
 
 
 def merge_customers(primary_id: str, duplicate_id: str, user_id: Optional[str] = None) -> None:
@@ -129,12 +142,15 @@ def merge_customers(primary_id: str, duplicate_id: str, user_id: Optional[str] =
     ORDERS.update_many({"customer_id": duplicate_id}, {"$set": {"customer_id": primary_id}})
     RECOGNITION_EVENTS.update_many({"customer_id": duplicate_id}, {"$set": {"customer_id": primary_id}})
     CUSTOMERS.delete_one({"_id": ObjectId(duplicate_id)})
+    cache.invalidate_customer(primary_id)
+    cache.invalidate_customer(duplicate_id)
     if user_id:
         log_activity(user_id, "merge_customers", f"{duplicate_id} -> {primary_id}")
 
 
 def unlink_face(face_id: int) -> None:
     CUSTOMERS.update_many({"face_id": face_id}, {"$set": {"face_id": None}})
+    cache.customers_by_face.invalidate(face_id)
 
 
 def recognition_history(limit: int = 200) -> List[Dict]:
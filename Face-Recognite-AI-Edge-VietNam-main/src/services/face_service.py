@@ -7,15 +7,18 @@ from __future__ import annotations
 import os
 from glob import glob
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import numpy as np
 
-from src.core.vectordb import VectorBD
+from src.core import registry
 from src.processing import image_processor, video_processor
 from src.utils import add_id_name, check_is_id_exist, get_name_from_id, init_id_name
 from legacy_scripts import create_database as legacy_builder
 
+if TYPE_CHECKING:
+    from src.core.vectordb import VectorBD
+
 
 ROOT_DIR = Path(__file__).resolve().parents[2]
 MEDIA_DIR = ROOT_DIR / "database" / "data"
@@ -42,7 +45,7 @@ def next_face_id() -> int:
 
 
 def _vector_db() -> VectorBD:
-    return VectorBD()
+    return registry.get_vector_db()
 
 
 def add_embeddings(face_id: int, name: str, embeddings: np.ndarray, is_update: bool = False) -> int:
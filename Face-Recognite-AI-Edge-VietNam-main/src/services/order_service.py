@@ -9,6 +9,7 @@ from typing import Dict, List, Optional
 
 from bson import ObjectId
 
+from src.data import cache
 from src.data.db import get_collection
 from src.services.customer_service import record_purchase
 from src.services.user_service import log_activity
@@ -19,6 +20,8 @@ INVENTORY = get_collection("inventory_movements")
 USERS = get_collection("users")
 CUSTOMERS = get_collection("customers")
 
+RECENT_ORDERS_LIMIT = 5
+
 
 def _now_iso() -> str:
     return datetime.utcnow().isoformat(timespec="seconds")
@@ -110,6 +113,7 @@ def create_order(
 
     if customer_id:
         record_purchase(customer_id, inserted_id, total_amount)
+        cache.recent_orders_by_customer.invalidate(str(customer_id))
     if staff_id:
         log_activity(staff_id, "create_order", f"{order_number}:{total_amount}")
 
@@ -136,6 +140,14 @@ def list_orders(limit: int = 100, customer_id: Optional[str] = None, staff_id: O
     return results
 
 
+def recent_orders(customer_id: str) -> List[Dict]:
+    """Latest ``RECENT_ORDERS_LIMIT`` orders of a customer, served from the read-through cache."""
+    orders = cache.recent_orders_by_customer.get_or_load(
+        str(customer_id), lambda: list_orders(limit=RECENT_ORDERS_LIMIT, customer_id=customer_id)
+    )
+    return [dict(order) for order in orders]
+
+
 def get_order_details(order_id: str) -> Dict:
     doc = ORDERS.find_one({"_id": ObjectId(order_id)})
     if not doc:
@@ -10,6 +10,7 @@ from typing import Dict, List, Optional
 from bson import ObjectId
 
 from src.data.db import ensure_indexes, get_collection
+from src.data.write_behind import get_write_behind
 from src.services.security import generate_session_token, hash_password, verify_password
 
 
@@ -166,7 +167,8 @@ def authenticate(username: str, password: str) -> Optional[Dict]:
 
 
 def log_login_attempt(user_id, success: bool, client_info: str, ip_address: str) -> None:
-    LOGIN_LOGS.insert_one(
+    get_write_behind().insert(
+        LOGIN_LOGS,
         {
             "user_id": str(user_id) if user_id else None,
             "successful": bool(success),
@@ -178,7 +180,8 @@ def log_login_attempt(user_id, success: bool, client_info: str, ip_address: str)
 
 
 def log_activity(user_id: Optional[str], action: str, details: str = "") -> None:
-    ACTIVITY_LOGS.insert_one(
+    get_write_behind().insert(
+        ACTIVITY_LOGS,
         {
             "user_id": str(user_id) if user_id else None,
             "action": action,
@@ -4,17 +4,23 @@ from src import config as conf
 import json
 import os
 import faiss
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 
 from PIL import ImageFont, ImageDraw, Image
 
-def normalize_input(img: np.ndarray) -> np.ndarray:
+def normalize_input(img: np.ndarray, out: np.ndarray = None) -> np.ndarray:
     """Chuẩn hoá giá trị điểm ảnh về khoảng xấp xỉ [-1, 1].
 
     Thực hiện phép biến đổi (img - 127.5) / 128.0 phù hợp với nhiều
-    mô hình nhận diện khuôn mặt họ Facenet.
+    mô hình nhận diện khuôn mặt họ Facenet. Kết quả luôn là float32.
 
     Args:
-        img: Ảnh đầu vào dạng mảng có shape (H, W, C) và dtype là số thực hoặc số nguyên.
+        img: Ảnh đầu vào dạng mảng có shape (H, W, C) hoặc batch (N, H, W, C),
+            dtype là số thực hoặc số nguyên.
+        out: Mảng float32 cùng shape để ghi kết quả (tránh cấp phát mới).
 
     Returns:
         Mảng đã được chuẩn hoá cùng shape với đầu vào.
@@ -22,8 +28,11 @@ def normalize_input(img: np.ndarray) -> np.ndarray:
     # Các lựa chọn khác: chuẩn hoá theo mean/std của ảnh (đã giữ lại tham khảo dưới đây)
     # mean, std = img.mean(), img.std()
     # img = (img - mean) / std
-    img = (img - 127.5) / 128.0
-    return img
+    if out is None:
+        out = np.empty(img.shape, dtype=np.float32)
+    np.subtract(img, np.float32(127.5), out=out, dtype=np.float32)
+    out *= np.float32(1 / 128.0)
+    return out
 
 def read_image(path: str) -> np.ndarray:
     """Đọc ảnh từ đường dẫn và chuyển sang RGB.
@@ -42,6 +51,54 @@ def read_image(path: str) -> np.ndarray:
         raise ValueError(f"Không đọc được ảnh: {path}")
     return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)  # chuẩn RGB
 
+# Marker SOF (Start Of Frame) của JPEG chứa kích thước ảnh (bỏ DHT/JPG/DAC: C4, C8, CC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def jpeg_size(data: bytes):
+    """Đọc (rộng, cao) từ header JPEG mà không giải mã ảnh.
+
+    Returns:
+        tuple (w, h), hoặc None nếu ``data`` không phải JPEG hợp lệ.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # byte đệm
+            i += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            h = int.from_bytes(data[i + 5:i + 7], "big")
+            w = int.from_bytes(data[i + 7:i + 9], "big")
+            return w, h
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+def decode_image(data: bytes, min_side: int = None) -> np.ndarray:
+    """Giải mã ảnh (BGR) từ bytes; với JPEG lớn thì giải mã ở độ phân giải giảm 1/2, 1/4 hoặc 1/8.
+
+    Args:
+        data: Nội dung tệp ảnh.
+        min_side: Cạnh dài tối thiểu cần giữ sau khi giảm (thường là imgsz của detector).
+            None để luôn giải mã đủ kích thước.
+
+    Returns:
+        Ảnh BGR, hoặc None nếu không giải mã được.
+    """
+    flag = cv2.IMREAD_COLOR
+    size = jpeg_size(data) if min_side else None
+    if size is not None:
+        long_side = max(size)
+        for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if long_side // factor >= min_side:
+                flag = reduced_flag
+                break
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+
 def cosine_similarity(v1: np.ndarray, v2: np.ndarray) -> float:
     """Tính độ tương tự cosine giữa hai vector đã được chuẩn hoá L2.
 
@@ -57,6 +114,19 @@ def cosine_similarity(v1: np.ndarray, v2: np.ndarray) -> float:
     """
     return np.dot(v1, v2)
 
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+@lru_cache(maxsize=8)
+def load_font(size: int = 18):
+    """Tải font Unicode một lần cho mỗi cỡ chữ (có cache), fallback về font mặc định."""
+    try:
+        # Try a common Linux font that supports Unicode
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        # If not found, fall back to default font and print a warning
+        print("Warning: DejaVuSans.ttf not found. Falling back to default font. Unicode characters may not display correctly.")
+        return ImageFont.load_default()
+
 def draw_box_text(img: np.ndarray, box: list, text: str) -> np.ndarray:
     """
     Vẽ bounding box và text (hỗ trợ Unicode/tiếng Việt) lên ảnh.
@@ -78,18 +148,8 @@ def draw_box_text(img: np.ndarray, box: list, text: str) -> np.ndarray:
     img_pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
     draw = ImageDraw.Draw(img_pil)
 
-    # Load font, with fallback
-    try:
-        # Try a common Linux font that supports Unicode
-        font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 18)
-    except OSError:
-        # If not found, fall back to default font and print a warning
-        print("Warning: DejaVuSans.ttf not found. Falling back to default font. Unicode characters may not display correctly.")
-        font = ImageFont.load_default()
-
-
     # Vẽ text
-    draw.text((x1, y1 - 25), text, font=font, fill=(0, 255, 0))
+    draw.text((x1, y1 - 25), text, font=load_font(18), fill=(0, 255, 0))
 
     # Chuyển ngược về OpenCV
     img = cv2.cvtColor(np.array(img_pil), cv2.COLOR_RGB2BGR)
@@ -97,30 +157,140 @@ def draw_box_text(img: np.ndarray, box: list, text: str) -> np.ndarray:
     return img
 
 
-def add_id_name(id: int, name: str):
+class OverlayRenderer:
+    """Vẽ bbox + nhãn cho nhiều khuôn mặt trong một lượt, dùng cho các giao diện hiển thị.
+
+    Khác ``draw_box_text``: font chỉ tải một lần, nhãn Unicode của mỗi danh tính được
+    render bằng PIL đúng một lần rồi cache dạng mặt nạ alpha; mỗi frame chỉ alpha-blend
+    các vùng nhãn nhỏ thay vì chuyển đổi BGR↔RGB toàn khung hình.
+
+    Args:
+        font_size: Cỡ chữ nhãn.
+        max_cached_labels: Số nhãn tối đa giữ trong cache (LRU).
+    """
+    def __init__(self, font_size: int = 18, max_cached_labels: int = 256):
+        self.font = load_font(font_size)
+        self.max_cached_labels = max_cached_labels
+        self._labels = OrderedDict()  # text -> mặt nạ alpha float32 (H, W, 1)
+
+    def _label_mask(self, text: str) -> np.ndarray:
+        mask = self._labels.get(text)
+        if mask is not None:
+            self._labels.move_to_end(text)
+            return mask
+        left, top, right, bottom = self.font.getbbox(text)
+        canvas = Image.new("L", (max(right - left, 1), max(bottom - top, 1)), 0)
+        ImageDraw.Draw(canvas).text((-left, -top), text, font=self.font, fill=255)
+        mask = (np.asarray(canvas, dtype=np.float32) / 255.0)[..., None]
+        self._labels[text] = mask
+        if len(self._labels) > self.max_cached_labels:
+            self._labels.popitem(last=False)
+        return mask
+
+    def _blend_label(self, img: np.ndarray, mask: np.ndarray, x: int, y: int, color) -> int:
+        """Alpha-blend mặt nạ nhãn tại (x, y) (có cắt theo biên ảnh); trả về toạ độ x kết thúc."""
+        h, w = mask.shape[:2]
+        img_h, img_w = img.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, img_w), min(y + h, img_h)
+        if x0 >= x1 or y0 >= y1:
+            return x + w
+        alpha = mask[y0 - y:y1 - y, x0 - x:x1 - x]
+        roi = img[y0:y1, x0:x1]
+        roi[:] = roi * (1.0 - alpha) + np.asarray(color, dtype=np.float32) * alpha
+        return x + w
+
+    def render(self, img: np.ndarray, boxes, labels: list, suffixes: list = None,
+               box_color=(255, 255, 0), text_color=(0, 255, 0)) -> np.ndarray:
+        """Vẽ tất cả bbox và nhãn lên ảnh (sửa tại chỗ).
+
+        Args:
+            img (np.ndarray): Ảnh BGR.
+            boxes: Danh sách bbox [x1, y1, x2, y2].
+            labels (list): Nhãn Unicode theo danh tính (được cache), ví dụ ``"1 - Nguyễn Văn A"``.
+            suffixes (list): Phần thay đổi theo frame (ASCII, ví dụ khoảng cách), vẽ bằng OpenCV.
+
+        Returns:
+            Ảnh BGR đã vẽ (chính là ``img``).
+        """
+        suffixes = suffixes or [""] * len(labels)
+        for (x1, y1, x2, y2), label, suffix in zip(boxes, labels, suffixes):
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+            cv2.rectangle(img, (x1, y1), (x2, y2), box_color, 2)
+            end_x = self._blend_label(img, self._label_mask(label), x1, y1 - 25, text_color)
+            if suffix:
+                cv2.putText(img, suffix, (end_x + 4, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, text_color, 1, cv2.LINE_AA)
+        return img
+
+
+def add_id_name(id: int, name: str, path: str = conf.path_json_id_name, path_db: str = conf.path_vector_db):
     """Thêm hoặc cập nhật ánh xạ id → tên vào file JSON cấu hình.
 
     Args:
         id: Định danh người dùng/đối tượng.
         name: Tên hiển thị tương ứng.
+        path: Đường dẫn file JSON lưu ánh xạ id → tên.
+        path_db: FAISS index đi kèm (để tăng đúng version stamp của gallery đó).
     """
-    path = conf.path_json_id_name
-    data = json.load(open(path, 'r', encoding='utf-8'))
-    data[id] = name
-    json.dump(data, open(path, 'w', encoding='utf-8'), ensure_ascii= False, indent=4)
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data[str(id)] = name
+    write_id_name(data, path)
+    bump_gallery_version(path_db)
 
-def delete_id_name(id: int, path: str = conf.path_json_id_name):
+def delete_id_name(id: int, path: str = conf.path_json_id_name, path_db: str = conf.path_vector_db):
     """Xoá ánh xạ theo ``id`` khỏi file JSON nếu tồn tại.
 
     Args:
         id: Định danh cần xoá.
         path: Đường dẫn file JSON lưu ánh xạ id → tên.
+        path_db: FAISS index đi kèm (để tăng đúng version stamp của gallery đó).
     """
     id = str(id)
-    data = json.load(open(path, 'r', encoding='utf-8'))
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
     if id in data.keys():
         del data[id]
-    json.dump(data, open(path, 'w', encoding='utf-8'), ensure_ascii= False, indent=4)
+    write_id_name(data, path)
+    bump_gallery_version(path_db)
+
+def write_id_name(data: dict, path: str = conf.path_json_id_name) -> None:
+    """Ghi file ánh xạ id → tên qua tệp tạm rồi ``os.replace`` (người đọc không bao giờ thấy file ghi dở).
+
+    Args:
+        data: Dict ánh xạ id (chuỗi) → tên.
+        path: Đường dẫn file JSON lưu ánh xạ id → tên.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii= False, indent=4)
+    os.replace(tmp_path, path)
+
+def gallery_version_path(path_db: str = conf.path_vector_db) -> str:
+    """Đường dẫn tệp version stamp nằm cạnh FAISS index."""
+    return path_db + '.version'
+
+def bump_gallery_version(path_db: str = conf.path_vector_db) -> str:
+    """Ghi version stamp mới (ghi tệp tạm rồi ``os.replace``) để mọi tiến trình biết gallery đã đổi.
+
+    Returns:
+        Giá trị stamp vừa ghi.
+    """
+    version = f"{time.time_ns()}-{os.getpid()}"
+    path = gallery_version_path(path_db)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
+
+def read_gallery_version(path_db: str = conf.path_vector_db) -> str | None:
+    """Đọc version stamp hiện tại (None nếu chưa có)."""
+    try:
+        with open(gallery_version_path(path_db), 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
 
 def check_is_id_exist(id: int, path: str = conf.path_json_id_name) -> bool:
     """Kiểm tra id có tồn tại trong file ánh xạ hay không.
@@ -151,32 +321,38 @@ def init_id_name(path: str = conf.path_json_id_name) -> dict:
         with open(path, 'r', encoding='utf-8') as f:
             map_id_name = json.load(f)
     else:
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(map_id_name, f)
+        write_id_name(map_id_name, path)
     return map_id_name
 
-def init_vt_db(path: str = conf.path_vector_db) -> faiss.Index:
+def init_vt_db(path: str = conf.path_vector_db, mmap: bool = False) -> faiss.Index:
     """Khởi tạo hoặc tải cơ sở dữ liệu vector FAISS.
 
     - Nếu file index tồn tại tại ``path``, tiến hành load.
-    - Nếu không tồn tại, tạo mới ``IndexIDMap2(IndexFlatIP(dim))`` và lưu.
+    - Nếu không tồn tại, tạo mới index rỗng theo ``conf.vector_index_type``
+      (mặc định ``IndexIDMap2(IndexFlatIP(dim))``, xem ``src.core.ann``) và lưu.
 
     Args:
         path: Đường dẫn đến file index FAISS.
+        mmap: ``mmap`` tệp chỉ đọc và trả về ``src.core.ann.SegmentedIndex`` (ghi vào segment RAM).
 
     Returns:
         Đối tượng ``faiss.Index`` đã sẵn sàng cho tìm kiếm/thêm vector.
     """
     if os.path.exists(path):
         print("Đang load vector db")
-        index = faiss.read_index(path)
+        index = None if mmap else faiss.read_index(path)
         print("Đã load xong vector bd")
     else:
         print("Không tìm thấy vector db, chuẩn bị tạo mới")
-        # Sử dụng IndexFlatIP để tìm kiếm tương tự cos
-        index = faiss.IndexIDMap2(faiss.IndexFlatIP(conf.dim)) 
+        # Inner product trên embedding đã chuẩn hoá = tương tự cos
+        from src.core.ann import build_index, target_kind, target_storage
+        kind = target_kind('flat', 0)
+        index = build_index(kind, storage=target_storage('float32', kind, 0))
         faiss.write_index(index, path)
         print("Đã tạo xong vector bb")
+    if mmap:
+        from src.core.ann import SegmentedIndex, open_mapped
+        index = SegmentedIndex(open_mapped(path))
     return index
 
 def get_name_from_id(id: int) -> str | None:
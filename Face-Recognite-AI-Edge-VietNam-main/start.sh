@@ -36,4 +36,13 @@ export MONGO_URI
 export TF_ENABLE_ONEDNN_OPTS=0
 export FLASK_DEBUG=${FLASK_DEBUG:-0}
 
+# Daemon suy luận giữ mô hình + gallery cho app, giao diện Tkinter và các script
+if [ "${START_INFERENCE_DAEMON:-0}" = "1" ]; then
+  "$PYTHON_BIN" -m src.daemon.server &
+  for _ in $(seq 1 60); do
+    [ -S ./database/inference.sock ] && break
+    sleep 1
+  done
+fi
+
 exec "$PYTHON_BIN" app.py
@@ -1,7 +1,15 @@
 (() => {
   const CAPTURE_INTERVAL_MS = 2000;
+  const UPLOAD_MAX_SIDE = Number(window.recognitionUploadMaxSide) || 640;
+  const JPEG_QUALITY = Number(window.recognitionJpegQuality) || 0.8;
+  const STREAM_URL = window.recognitionStreamUrl || null;
+  const STREAM_MIN_INTERVAL_MS = Number(window.recognitionStreamMinIntervalMs) || 100;
+  const STREAM_MAX_IN_FLIGHT = Number(window.recognitionStreamMaxInFlight) || 2;
+  const captureCanvas = document.createElement("canvas");
   let videoStream = null;
   let captureTimer = null;
+  // Kênh WebSocket đang mở: { socket, sent, acked, encoding, lastSentAt }
+  let frameStream = null;
   let isProcessing = false;
   let currentActiveCustomer = null;
 
@@ -206,54 +214,156 @@
     }
   }
 
+  // Thu nhỏ frame về cạnh dài UPLOAD_MAX_SIDE rồi mã hoá JPEG nhị phân (không base64)
+  function encodeFrame() {
+    const scale = Math.min(1, UPLOAD_MAX_SIDE / Math.max(videoEl.videoWidth, videoEl.videoHeight));
+    captureCanvas.width = Math.round(videoEl.videoWidth * scale);
+    captureCanvas.height = Math.round(videoEl.videoHeight * scale);
+    const ctx = captureCanvas.getContext("2d");
+    ctx.drawImage(videoEl, 0, 0, captureCanvas.width, captureCanvas.height);
+    return new Promise((resolve, reject) => {
+      captureCanvas.toBlob(
+        (blob) => (blob ? resolve(blob) : reject(new Error("Không thể mã hoá khung hình."))),
+        "image/jpeg",
+        JPEG_QUALITY
+      );
+    });
+  }
+
+  // Cập nhật giao diện từ kết quả nhận diện (chung cho HTTP polling và WebSocket)
+  function applyRecognitionResult(result) {
+    updateMatches(result.matches || []);
+    updateActiveCustomer(result.active_customer || null);
+    updatePurchaseHistory(result.purchase_history || []);
+
+    if (currentActiveCustomer && currentActiveCustomer.id) {
+      const { full_name: name, face_id: faceId } = currentActiveCustomer;
+      const displayName = name ? name : faceId ? `Face ID ${faceId}` : "khách hàng";
+      const faceSuffix = faceId ? ` – Face ID ${faceId}` : "";
+      showRecognitionAlert(`Đã nhận diện khách hàng ${displayName}${faceSuffix}.`, "success");
+      setStatus("Đã nhận diện khách hàng.", "success");
+      return true;
+    }
+    showRecognitionAlert("Chưa nhận diện khách hàng.", "info");
+    setStatus("Đang quét khuôn mặt...", "info");
+    return false;
+  }
+
+  function showRecognitionError(error) {
+    console.error(error);
+    showRecognitionAlert(error.message || "Lỗi nhận diện.", "error");
+    setStatus(error.message || "Lỗi nhận diện.", "error");
+  }
+
   async function captureFrame() {
     if (!videoEl || !videoStream || isProcessing) return;
     if (!videoEl.videoWidth || !videoEl.videoHeight) return;
 
-    const canvas = document.createElement("canvas");
-    canvas.width = videoEl.videoWidth;
-    canvas.height = videoEl.videoHeight;
-    const ctx = canvas.getContext("2d");
-    ctx.drawImage(videoEl, 0, 0, canvas.width, canvas.height);
-    const dataUrl = canvas.toDataURL("image/jpeg", 0.85);
-
     isProcessing = true;
     try {
+      const frameBlob = await encodeFrame();
       const response = await fetch("/staff/recognize/frame", {
         method: "POST",
         headers: {
-          "Content-Type": "application/json",
+          "Content-Type": "application/octet-stream",
           Accept: "application/json",
         },
-        body: JSON.stringify({ image: dataUrl }),
+        body: frameBlob,
       });
       const result = await response.json();
       if (!response.ok) {
         throw new Error(result.error || "Không nhận diện được khuôn mặt.");
       }
+      if (applyRecognitionResult(result)) {
+        stopRecognition(false);
+      }
+    } catch (error) {
+      showRecognitionError(error);
+    } finally {
+      isProcessing = false;
+    }
+  }
+
+  function startPolling() {
+    captureTimer = window.setInterval(captureFrame, CAPTURE_INTERVAL_MS);
+    captureFrame();
+  }
 
-      updateMatches(result.matches || []);
-      updateActiveCustomer(result.active_customer || null);
-      updatePurchaseHistory(result.purchase_history || []);
+  // Đẩy frame kế tiếp lên WebSocket nếu số frame chưa có kết quả còn dưới STREAM_MAX_IN_FLIGHT;
+  // server chỉ nhận diện frame mới nhất và báo lại số frame đã xử lý/bỏ qua trong "stream".
+  async function pumpStream() {
+    const current = frameStream;
+    if (!current || current.encoding || current.socket.readyState !== WebSocket.OPEN) return;
+    if (!videoEl.videoWidth || !videoEl.videoHeight) return;
+    if (current.sent - current.acked >= STREAM_MAX_IN_FLIGHT) return;
+    if (performance.now() - current.lastSentAt < STREAM_MIN_INTERVAL_MS) return;
 
-      if (currentActiveCustomer && currentActiveCustomer.id) {
-        const { full_name: name, face_id: faceId } = currentActiveCustomer;
-        const displayName = name ? name : faceId ? `Face ID ${faceId}` : "khách hàng";
-        const faceSuffix = faceId ? ` – Face ID ${faceId}` : "";
-        showRecognitionAlert(`Đã nhận diện khách hàng ${displayName}${faceSuffix}.`, "success");
-        setStatus("Đã nhận diện khách hàng.", "success");
-        stopRecognition(false);
-      } else {
-        showRecognitionAlert("Chưa nhận diện khách hàng.", "info");
-        setStatus("Đang quét khuôn mặt...", "info");
+    current.encoding = true;
+    try {
+      const frameBlob = await encodeFrame();
+      if (frameStream === current && current.socket.readyState === WebSocket.OPEN) {
+        current.socket.send(frameBlob);
+        current.sent += 1;
+        current.lastSentAt = performance.now();
       }
     } catch (error) {
       console.error(error);
-      showRecognitionAlert(error.message || "Lỗi nhận diện.", "error");
-      setStatus(error.message || "Lỗi nhận diện.", "error");
     } finally {
-      isProcessing = false;
+      current.encoding = false;
+    }
+  }
+
+  function handleStreamMessage(current, event) {
+    if (frameStream !== current) return;
+    let result;
+    try {
+      result = JSON.parse(event.data);
+    } catch (error) {
+      console.error("Phản hồi streaming không hợp lệ:", error);
+      return;
+    }
+    if (result.stream) {
+      current.acked = result.stream.processed + result.stream.dropped;
+    }
+    if (result.error) {
+      showRecognitionError(new Error(result.error));
+    } else if (applyRecognitionResult(result)) {
+      stopRecognition(false);
+      return;
+    }
+    pumpStream();
+  }
+
+  // Mở kênh WebSocket; quay về HTTP polling nếu trình duyệt/server không hỗ trợ hoặc mất kết nối.
+  function startStreaming() {
+    let socket;
+    try {
+      const url = new URL(STREAM_URL, window.location.href);
+      url.protocol = url.protocol === "https:" ? "wss:" : "ws:";
+      socket = new WebSocket(url);
+    } catch (error) {
+      console.error("Không thể mở kênh streaming:", error);
+      startPolling();
+      return;
     }
+    const current = { socket, sent: 0, acked: 0, encoding: false, lastSentAt: 0 };
+    frameStream = current;
+    socket.addEventListener("open", () => {
+      captureTimer = window.setInterval(pumpStream, STREAM_MIN_INTERVAL_MS);
+      pumpStream();
+    });
+    socket.addEventListener("message", (event) => handleStreamMessage(current, event));
+    socket.addEventListener("close", () => {
+      if (frameStream !== current) return;
+      frameStream = null;
+      if (captureTimer) {
+        window.clearInterval(captureTimer);
+        captureTimer = null;
+      }
+      if (videoStream) {
+        startPolling();
+      }
+    });
   }
 
   async function startRecognition(autoStart = false) {
@@ -277,8 +387,11 @@
       setStatus("Đang quét khuôn mặt...", "info");
       startBtn && (startBtn.disabled = true);
       stopBtn && (stopBtn.disabled = false);
-      captureTimer = window.setInterval(captureFrame, CAPTURE_INTERVAL_MS);
-      captureFrame();
+      if (STREAM_URL && "WebSocket" in window) {
+        startStreaming();
+      } else {
+        startPolling();
+      }
     } catch (error) {
       console.error(error);
       setStatus("Không thể truy cập camera. Hãy cấp quyền và thử lại.", "error");
@@ -290,6 +403,11 @@
   }
 
   function stopRecognition(showMessage = true) {
+    if (frameStream) {
+      const { socket } = frameStream;
+      frameStream = null;
+      socket.close();
+    }
     if (captureTimer) {
       window.clearInterval(captureTimer);
       captureTimer = null;